@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Mensaje
+from .models import Mensaje, ArchivoConversacion
+from . import busqueda
 
 
 @admin.register(Mensaje)
@@ -9,16 +10,17 @@ class MensajeAdmin(admin.ModelAdmin):
     """
     list_display = [
         'remitente', 'get_destinatario', 'preview_contenido',
-        'fecha', 'leido'
+        'fecha', 'esta_leido'
     ]
-    list_filter = ['leido', 'fecha']
+    list_filter = ['fecha']
+    list_select_related = ['match', 'remitente']
+    # El contenido se busca con el índice de texto completo (get_search_results)
     search_fields = [
         'remitente__nombre_completo',
         'remitente__email',
-        'contenido'
     ]
     date_hierarchy = 'fecha'
-    readonly_fields = ['fecha', 'fecha_lectura']
+    readonly_fields = ['fecha', 'esta_leido']
     
     fieldsets = (
         ('Match', {
@@ -28,16 +30,27 @@ class MensajeAdmin(admin.ModelAdmin):
             'fields': ('remitente', 'contenido')
         }),
         ('Estado', {
-            'fields': ('leido', 'fecha', 'fecha_lectura')
+            'fields': ('esta_leido', 'fecha')
         }),
     )
     
+    def get_search_results(self, request, queryset, search_term):
+        resultados, puede_duplicar = super().get_search_results(request, queryset, search_term)
+        if search_term:
+            resultados |= busqueda.filtrar(queryset, search_term)
+        return resultados, puede_duplicar
+    
     def preview_contenido(self, obj):
         if len(obj.contenido) > 50:
             return obj.contenido[:50] + '...'
         return obj.contenido
     preview_contenido.short_description = 'Contenido'
     
+    def esta_leido(self, obj):
+        return obj.match.mensaje_leido(obj)
+    esta_leido.boolean = True
+    esta_leido.short_description = 'Leído'
+    
     def get_destinatario(self, obj):
         otro = obj.match.obtener_otro_usuario(obj.remitente)
         return otro.nombre_completo if otro else '-'
@@ -45,4 +58,22 @@ class MensajeAdmin(admin.ModelAdmin):
     
     def has_add_permission(self, request):
         # No permitir crear mensajes desde el admin
-        return False
\ No newline at end of file
+        return False
+
+
+@admin.register(ArchivoConversacion)
+class ArchivoConversacionAdmin(admin.ModelAdmin):
+    """
+    Admin de solo lectura para los segmentos archivados
+    """
+    list_display = ['match', 'desde_id', 'hasta_id', 'cantidad', 'fecha_creacion']
+    list_filter = ['fecha_creacion']
+    search_fields = ['match__id']
+    exclude = ['datos']
+    readonly_fields = ['match', 'desde_id', 'hasta_id', 'cantidad', 'fecha_creacion']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
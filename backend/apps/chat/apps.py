@@ -1,7 +1,19 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def instalar_triggers_busqueda(sender, using, **kwargs):
+    # Las migraciones que reconstruyen chat_mensaje en SQLite borran los
+    # triggers del índice de búsqueda
+    from . import busqueda
+    busqueda.instalar_triggers(connections[using])
 
 
 class ChatConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.chat'
-    verbose_name = 'Chat'
\ No newline at end of file
+    verbose_name = 'Chat'
+
+    def ready(self):
+        post_migrate.connect(instalar_triggers_busqueda, sender=self)
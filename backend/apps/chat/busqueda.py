@@ -0,0 +1,294 @@
+"""
+Búsqueda de texto completo en los mensajes del chat.
+
+El índice depende del motor de base de datos:
+- SQLite: tabla virtual FTS5 `chat_mensaje_fts` de contenido externo (no
+  duplica el texto, lo lee de chat_mensaje) mantenida con triggers. Las
+  migraciones que reconstruyen chat_mensaje en SQLite borran los triggers;
+  ChatConfig los vuelve a crear en post_migrate.
+- PostgreSQL: índice GIN sobre la misma expresión que genera
+  SearchVector('contenido', config='spanish'), para que el planner lo use.
+- Otros motores: sin índice, se busca con icontains y sin ranking.
+
+Cada palabra de la búsqueda se toma como prefijo y deben aparecer todas. Los
+resultados se ordenan por relevancia (`rango`, mayor es mejor) y por id, que
+es también el orden del cursor. El ranking depende de todo el índice, así
+que puede moverse un poco entre páginas si llegan mensajes nuevos.
+
+Solo se busca en la tabla: los mensajes archivados (ArchivoConversacion)
+no aparecen, pero solo se archivan los que ya salieron de la ventana de
+sincronización.
+
+manage.py reindexar_busqueda reconstruye el índice.
+"""
+import html
+import re
+
+from django.db import connections, router
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from apps.matches.paginacion import KeysetPagination, _SIN_CURSOR
+
+TABLA_FTS = 'chat_mensaje_fts'
+INDICE_PG = 'chat_mensaje_contenido_fts_idx'
+CONFIG_PG = 'spanish'
+MAX_TERMINOS = 8
+
+# Marcas del resaltado: se escapa el HTML del mensaje y después se cambian
+# por <mark>, así el contenido nunca se interpreta como HTML
+_INICIO = '\x02'
+_FIN = '\x03'
+
+SQL_SQLITE = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA_FTS} USING fts5(
+        contenido,
+        content='chat_mensaje',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+]
+
+SQL_TRIGGERS_SQLITE = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLA_FTS}_ai AFTER INSERT ON chat_mensaje BEGIN
+        INSERT INTO {TABLA_FTS}(rowid, contenido) VALUES (new.id, new.contenido);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLA_FTS}_ad AFTER DELETE ON chat_mensaje BEGIN
+        INSERT INTO {TABLA_FTS}({TABLA_FTS}, rowid, contenido)
+        VALUES ('delete', old.id, old.contenido);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLA_FTS}_au AFTER UPDATE OF contenido ON chat_mensaje BEGIN
+        INSERT INTO {TABLA_FTS}({TABLA_FTS}, rowid, contenido)
+        VALUES ('delete', old.id, old.contenido);
+        INSERT INTO {TABLA_FTS}(rowid, contenido) VALUES (new.id, new.contenido);
+    END
+    """,
+]
+
+# Misma expresión que SearchVector('contenido', config=CONFIG_PG)
+SQL_POSTGRES = f"""
+    CREATE INDEX IF NOT EXISTS {INDICE_PG} ON chat_mensaje
+    USING GIN (to_tsvector('{CONFIG_PG}'::regconfig, COALESCE(contenido, '')))
+"""
+
+
+def terminos(texto):
+    """Palabras de la búsqueda (sin operadores ni comillas)"""
+    return re.findall(r'\w+', texto or '')[:MAX_TERMINOS]
+
+
+def resaltar(texto):
+    """HTML escapado con las coincidencias entre <mark> y </mark>"""
+    return html.escape(texto).replace(_INICIO, '<mark>').replace(_FIN, '</mark>')
+
+
+def instalar_indice(connection):
+    """Crea el índice y lo llena con los mensajes existentes"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            for sql in SQL_SQLITE + SQL_TRIGGERS_SQLITE:
+                cursor.execute(sql)
+            cursor.execute(f"INSERT INTO {TABLA_FTS}({TABLA_FTS}) VALUES ('rebuild')")
+        elif connection.vendor == 'postgresql':
+            cursor.execute(SQL_POSTGRES)
+
+
+def quitar_indice(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            for sufijo in ('ai', 'ad', 'au'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS {TABLA_FTS}_{sufijo}')
+            cursor.execute(f'DROP TABLE IF EXISTS {TABLA_FTS}')
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f'DROP INDEX IF EXISTS {INDICE_PG}')
+
+
+def instalar_triggers(connection):
+    """Vuelve a crear los triggers de SQLite si el índice existe y faltan"""
+    if connection.vendor != 'sqlite':
+        return
+    if TABLA_FTS not in connection.introspection.table_names():
+        return
+    with connection.cursor() as cursor:
+        for sql in SQL_TRIGGERS_SQLITE:
+            cursor.execute(sql)
+
+
+def reconstruir_indice(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f"INSERT INTO {TABLA_FTS}({TABLA_FTS}) VALUES ('rebuild')")
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f'REINDEX INDEX {INDICE_PG}')
+
+
+def _vector_pg():
+    from django.contrib.postgres.search import SearchVector
+    return SearchVector('contenido', config=CONFIG_PG)
+
+
+def _consulta_pg(palabras):
+    from django.contrib.postgres.search import SearchQuery
+    return SearchQuery(
+        ' & '.join(f'{palabra}:*' for palabra in palabras),
+        search_type='raw', config=CONFIG_PG
+    )
+
+
+def _consulta_fts(palabras):
+    return ' '.join(f'"{palabra}"*' for palabra in palabras)
+
+
+def filtrar(queryset, texto):
+    """Filtra un queryset de Mensaje a los que coinciden con la búsqueda"""
+    from .models import Mensaje
+
+    palabras = terminos(texto)
+    if not palabras:
+        return queryset.none()
+    vendor = connections[queryset.db].vendor
+    if vendor == 'sqlite':
+        return queryset.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s',
+            [_consulta_fts(palabras)]
+        ))
+    if vendor == 'postgresql':
+        return queryset.filter(id__in=Mensaje.objects.annotate(
+            vector=_vector_pg()
+        ).filter(vector=_consulta_pg(palabras)).values('id'))
+    for palabra in palabras:
+        queryset = queryset.filter(contenido__icontains=palabra)
+    return queryset
+
+
+class BusquedaMensajes:
+    """
+    Búsqueda en las conversaciones activas de un usuario (o solo en una).
+    `resultados` retorna mensajes con los atributos `rango` y `resaltado`.
+    """
+
+    def __init__(self, usuario, texto, match_id=None):
+        self.usuario = usuario
+        self.palabras = terminos(texto)
+        self.match_id = match_id
+
+    def resultados(self, cursor, cantidad):
+        """
+        Hasta `cantidad` mensajes después de `cursor` (par (rango, id) o None)
+        """
+        from .models import Mensaje
+
+        if not self.palabras:
+            return []
+        vendor = connections[router.db_for_read(Mensaje)].vendor
+        if vendor == 'sqlite':
+            return self._resultados_sqlite(cursor, cantidad)
+        return self._resultados_orm(vendor, cursor, cantidad)
+
+    def _resultados_sqlite(self, cursor, cantidad):
+        from apps.matches.models import Match
+        from .models import Mensaje
+
+        # bm25 solo existe dentro de la consulta FTS, así que va en SQL
+        # crudo; es negativo y menor es mejor, se invierte para que el orden
+        # sea el mismo que en PostgreSQL
+        params = [_INICIO, _FIN, _consulta_fts(self.palabras), True, self.usuario.id, self.usuario.id]
+        filtro_match = ''
+        if self.match_id is not None:
+            filtro_match = 'AND m.match_id = %s'
+            params.append(self.match_id)
+        filtro_cursor = ''
+        if cursor is not None:
+            filtro_cursor = 'WHERE rango < %s OR (rango = %s AND id < %s)'
+            params.extend([cursor[0], cursor[0], cursor[1]])
+        params.append(cantidad)
+
+        sql = f"""
+            SELECT * FROM (
+                SELECT m.*, -bm25({TABLA_FTS}) AS rango,
+                       highlight({TABLA_FTS}, 0, %s, %s) AS resaltado
+                FROM {TABLA_FTS}
+                JOIN {Mensaje._meta.db_table} m ON m.id = {TABLA_FTS}.rowid
+                JOIN {Match._meta.db_table} x ON x.id = m.match_id
+                WHERE {TABLA_FTS} MATCH %s AND x.activo = %s
+                  AND (x.usuario1_id = %s OR x.usuario2_id = %s) {filtro_match}
+            ) {filtro_cursor}
+            ORDER BY rango DESC, id DESC
+            LIMIT %s
+        """
+        mensajes = list(Mensaje.objects.raw(sql, params).prefetch_related('remitente', 'match'))
+        for mensaje in mensajes:
+            mensaje.resaltado = resaltar(mensaje.resaltado)
+        return mensajes
+
+    def _resultados_orm(self, vendor, cursor, cantidad):
+        from .models import Mensaje
+
+        mensajes = Mensaje.objects.filter(
+            Q(match__usuario1=self.usuario) | Q(match__usuario2=self.usuario),
+            match__activo=True
+        ).select_related('remitente', 'match')
+        if self.match_id is not None:
+            mensajes = mensajes.filter(match_id=self.match_id)
+
+        if vendor == 'postgresql':
+            from django.contrib.postgres.search import SearchHeadline, SearchRank
+
+            consulta = _consulta_pg(self.palabras)
+            mensajes = mensajes.annotate(vector=_vector_pg()).filter(
+                vector=consulta
+            ).annotate(
+                rango=SearchRank(F('vector'), consulta),
+                texto_resaltado=SearchHeadline(
+                    'contenido', consulta, config=CONFIG_PG,
+                    start_sel=_INICIO, stop_sel=_FIN, highlight_all=True
+                )
+            )
+        else:
+            mensajes = filtrar(mensajes, ' '.join(self.palabras)).annotate(
+                rango=Value(0.0, output_field=FloatField())
+            )
+
+        if cursor is not None:
+            mensajes = mensajes.filter(
+                Q(rango__lt=cursor[0]) | Q(rango=cursor[0], id__lt=cursor[1])
+            )
+        mensajes = list(mensajes.order_by('-rango', '-id')[:cantidad])
+        for mensaje in mensajes:
+            texto = getattr(mensaje, 'texto_resaltado', None)
+            mensaje.resaltado = resaltar(texto) if texto is not None else html.escape(mensaje.contenido)
+        return mensajes
+
+
+class BusquedaPagination(KeysetPagination):
+    """
+    Cursor (rango, id) sobre los resultados de BusquedaMensajes; la vista
+    pasa la búsqueda en lugar de un queryset
+    """
+    campo = 'rango'
+
+    def paginate_queryset(self, busqueda, request, view=None):
+        self.request = request
+        limite = self.get_page_size(request)
+        cursor = self.decodificar_cursor(request)
+
+        filas = busqueda.resultados(None if cursor is _SIN_CURSOR else cursor, limite + 1)
+        pagina = filas[:limite]
+        self.siguiente = None
+        if len(filas) > limite:
+            ultima = pagina[-1]
+            self.siguiente = self.codificar_cursor(ultima.rango, ultima.pk)
+        return pagina
+
+    def valor_desde_cursor(self, valor):
+        return float(valor)
+
+    def valor_para_cursor(self, valor):
+        return valor
@@ -0,0 +1,126 @@
+"""
+Escritura agrupada del resumen de conversación en Match.
+
+Sin agrupar, cada mensaje hace un UPDATE de la fila de su match (último
+mensaje y contador de no leídos) y otro del badge del destinatario; en una
+conversación muy activa todos los envíos compiten por el mismo candado de
+fila. Con CHAT_COALESCER_ACTIVO los mensajes se acumulan en memoria después
+del commit y un hilo los escribe cada CHAT_COALESCER_INTERVALO segundos: un
+solo UPDATE por match con el mensaje más nuevo y la suma de los no leídos.
+
+El orden de las listas de conversaciones se mantiene porque
+MatchQuerySet.aplicar_actividad nunca retrocede el último mensaje, sin
+importar en qué orden lleguen los lotes. A cambio, las listas ven el
+mensaje nuevo con hasta un intervalo de retraso, y si el proceso termina
+sin vaciar el búfer se pierden los resúmenes pendientes
+(manage.py recalcular_resumenes y reconciliar_no_leidos los reconstruyen).
+
+Los no leídos no se suman por mensaje: al vaciar se vuelven a contar los
+mensajes después de la marca de lectura actual (Match.contar_no_leidos),
+con la fila del match bloqueada, y el badge se ajusta con la diferencia.
+Así un mensaje que el usuario leyó antes de que se vaciara el búfer (o
+que vació otro proceso) no queda como no leído. En la misma transacción se
+registra el Cambio del match para la sincronización incremental.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+
+class Coalescedor:
+
+    def __init__(self, intervalo):
+        self.intervalo = intervalo
+        # match_id -> {'match': Match, 'ultimo': datos, 'destinatarios': {usuario_id}}
+        self._pendientes = {}
+        self._lock = threading.Lock()
+        self._hilo = None
+
+    def agregar(self, mensaje):
+        """Acumula un mensaje ya confirmado en la base de datos"""
+        from apps.matches.models import Match
+
+        match = mensaje.match
+        with self._lock:
+            pendiente = self._pendientes.setdefault(match.pk, {
+                'match': match, 'ultimo': None, 'destinatarios': set()
+            })
+            if pendiente['ultimo'] is None or mensaje.id > pendiente['ultimo']['id_ultimo_mensaje']:
+                pendiente['ultimo'] = Match.datos_ultimo_mensaje(mensaje)
+            pendiente['destinatarios'].add(match.otro_usuario_id(mensaje.remitente_id))
+            self._iniciar()
+
+    def _iniciar(self):
+        if self._hilo is None or not self._hilo.is_alive():
+            self._hilo = threading.Thread(
+                target=self._ciclo, name='coalescedor-chat', daemon=True
+            )
+            self._hilo.start()
+
+    def _ciclo(self):
+        while True:
+            time.sleep(self.intervalo)
+            try:
+                self.vaciar()
+            except Exception:
+                logger.exception('Error al escribir los resúmenes de conversación')
+            finally:
+                close_old_connections()
+
+    def vaciar(self):
+        """Escribe todo lo acumulado; retorna cuántos matches se actualizaron"""
+        from apps.matches.models import Match
+        from apps.sincronizacion.models import Cambio
+        from .models import ContadorNoLeidos
+
+        with self._lock:
+            pendientes, self._pendientes = self._pendientes, {}
+
+        # En orden de id para que los candados se tomen siempre igual
+        for match_id in sorted(pendientes):
+            pendiente = pendientes[match_id]
+            match = pendiente['match']
+            campos = {
+                usuario_id: match.campo_no_leidos(usuario_id)
+                for usuario_id in pendiente['destinatarios']
+            }
+            with transaction.atomic():
+                # El mismo candado que Mensaje.marcar_leidos: la marca de
+                # lectura no se mueve entre el recuento y el ajuste del badge
+                antes = Match.objects.select_for_update().filter(
+                    pk=match_id
+                ).values(*campos.values()).first()
+                if antes is None:
+                    continue
+                filas = Match.objects.filter(pk=match_id)
+                filas.aplicar_actividad(pendiente['ultimo'], recuentos={
+                    campo: match.contar_no_leidos(usuario_id)
+                    for usuario_id, campo in campos.items()
+                })
+                despues = filas.values(*campos.values()).first()
+                for usuario_id, campo in campos.items():
+                    ContadorNoLeidos.ajustar(usuario_id, antes[campo], despues[campo])
+                # /api/sync/ entrega el resumen nuevo a ambos usuarios
+                Cambio.registrar_matches([match])
+        return len(pendientes)
+
+
+_coalescedor = None
+_coalescedor_lock = threading.Lock()
+
+
+def obtener_coalescedor():
+    """Instancia única del proceso (se vacía también al salir)"""
+    global _coalescedor
+    if _coalescedor is None:
+        with _coalescedor_lock:
+            if _coalescedor is None:
+                _coalescedor = Coalescedor(settings.CHAT_COALESCER_INTERVALO)
+                atexit.register(_coalescedor.vaciar)
+    return _coalescedor
@@ -0,0 +1,65 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+from django.utils import timezone
+
+from apps.chat.models import ArchivoConversacion
+from apps.matches.models import Match
+
+
+class Command(BaseCommand):
+    """
+    Mueve a ArchivoConversacion los mensajes de matches desactivados (todos)
+    y de matches sin mensajes en los últimos --dias (menos los últimos
+    --ventana mensajes y los que falten por leer). Los mensajes que todavía
+    tienen cambios de sincronización (ver purgar_cambios) se quedan en la
+    tabla.
+
+    Uso: python manage.py archivar_conversaciones [--dias 180] [--ventana 50]
+         [--segmento 500] [--simular]
+    """
+    help = 'Archiva los mensajes de conversaciones inactivas o viejas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=180)
+        parser.add_argument(
+            '--ventana',
+            type=int,
+            default=50,
+            help='Mensajes que se quedan en la tabla en matches activos'
+        )
+        parser.add_argument('--segmento', type=int, default=500, help='Mensajes por segmento')
+        parser.add_argument(
+            '--simular',
+            action='store_true',
+            help='Solo reportar cuántos mensajes se archivarían'
+        )
+
+    def handle(self, *args, **options):
+        limite = timezone.now() - timedelta(days=options['dias'])
+        candidatos = Match.objects.filter(
+            Q(activo=False) | Q(ultimo_mensaje__lt=limite),
+            id_ultimo_mensaje__gt=F('archivado_hasta_id')
+        ).order_by('id')
+
+        # Los mensajes que llegan durante el recorrido tienen ids mayores
+        tope = ArchivoConversacion.tope_sincronizacion()
+        matches = 0
+        total = 0
+        for match in candidatos.iterator():
+            hasta_id = ArchivoConversacion.limite_archivable(match, options['ventana'], tope)
+            if hasta_id <= match.archivado_hasta_id:
+                continue
+            if options['simular']:
+                cantidad = match.mensajes.filter(id__lte=hasta_id).count()
+            else:
+                cantidad = ArchivoConversacion.archivar(match, hasta_id, options['segmento'])
+            if cantidad:
+                matches += 1
+                total += cantidad
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'Match {match.id}: {cantidad} mensajes')
+
+        accion = 'por archivar' if options['simular'] else 'archivados'
+        self.stdout.write(self.style.SUCCESS(f'{total} mensajes {accion} de {matches} matches'))
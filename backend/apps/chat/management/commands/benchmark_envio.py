@@ -0,0 +1,89 @@
+import threading
+import time
+import uuid
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.test.utils import override_settings
+
+from apps.chat.coalescer import obtener_coalescedor
+from apps.chat.models import Mensaje
+from apps.matches.models import Match
+from apps.usuarios.models import Usuario
+
+
+class Command(BaseCommand):
+    """
+    Mide mensajes por segundo en una sola conversación con el resumen del
+    match escrito en cada envío y agrupado (CHAT_COALESCER_ACTIVO). Crea dos
+    usuarios temporales y los borra al terminar.
+
+    Uso: python manage.py benchmark_envio --mensajes 500 --hilos 4
+    """
+    help = 'Benchmark de envío de mensajes con y sin escritura agrupada del match'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mensajes', type=int, default=500)
+        parser.add_argument(
+            '--hilos',
+            type=int,
+            default=1,
+            help='Remitentes concurrentes en la misma conversación'
+        )
+
+    def handle(self, *args, **options):
+        usuarios = [self._crear_usuario() for _ in range(2)]
+        try:
+            match = Match.objects.crear_entre(usuarios[0].id, usuarios[1].id)
+            self.stdout.write(
+                f'{options["mensajes"]} mensajes, {options["hilos"]} hilos, una conversación'
+            )
+            directo = self._medir(match, usuarios, options, coalescer=False)
+            self.stdout.write(f'  Resumen en cada envío: {directo:8.1f} mensajes/s')
+            agrupado = self._medir(match, usuarios, options, coalescer=True)
+            self.stdout.write(f'  Resumen agrupado:      {agrupado:8.1f} mensajes/s')
+            self.stdout.write(self.style.SUCCESS(f'  Aceleración:           {agrupado / directo:8.1f}x'))
+        finally:
+            Usuario.objects.filter(id__in=[u.id for u in usuarios]).delete()
+
+    def _crear_usuario(self):
+        clave = uuid.uuid4().hex[:12]
+        return Usuario.objects.create_user(
+            username=f'benchmark_{clave}',
+            email=f'benchmark_{clave}@benchmark.local',
+            password=None,
+            nombre_completo='Benchmark',
+            codigo_udg=f'benchmark_{clave}',
+            url_credencial=f'https://benchmark.local/{clave}',
+            vigencia='DIC-2099',
+            fecha_nacimiento=date(2000, 1, 1),
+            activo=False
+        )
+
+    def _medir(self, match, usuarios, options, coalescer):
+        por_hilo = max(options['mensajes'] // options['hilos'], 1)
+
+        def enviar(remitente):
+            try:
+                for i in range(por_hilo):
+                    Mensaje.objects.create(match=match, remitente=remitente, contenido=f'Mensaje {i}')
+            finally:
+                close_old_connections()
+
+        with override_settings(CHAT_COALESCER_ACTIVO=coalescer):
+            hilos = [
+                threading.Thread(target=enviar, args=(usuarios[i % 2],))
+                for i in range(options['hilos'])
+            ]
+            inicio = time.perf_counter()
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+            if coalescer:
+                # Lo que quedó en el búfer también cuenta
+                obtener_coalescedor().vaciar()
+            segundos = time.perf_counter() - inicio
+
+        return por_hilo * len(hilos) / segundos
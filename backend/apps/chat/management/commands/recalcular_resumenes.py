@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Q, Subquery
+
+from apps.chat.models import Mensaje
+from apps.matches.models import Match, generar_preview
+
+CAMPOS_RESUMEN = [
+    'ultimo_mensaje', 'id_ultimo_mensaje', 'preview_ultimo_mensaje',
+    'remitente_ultimo_mensaje', 'no_leidos_usuario1', 'no_leidos_usuario2'
+]
+
+
+class Command(BaseCommand):
+    """
+    Recalcula desde la tabla de mensajes el resumen guardado en cada match
+    (último mensaje y no leídos de cada lado). Se corre una vez después de la
+    migración que agrega los campos, o si se sospecha que se desincronizaron.
+
+    Uso: python manage.py recalcular_resumenes --lote 500
+    """
+    help = 'Recalcula el último mensaje y los no leídos guardados en los matches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500)
+
+    def handle(self, *args, **options):
+        ultimo = Mensaje.objects.filter(
+            match=OuterRef('pk')
+        ).order_by('-id')
+
+        matches = Match.objects.annotate(
+            ultimo_id=Subquery(ultimo.values('id')[:1])
+        ).order_by('id')
+
+        total = 0
+        lote = []
+        for match in matches.iterator(chunk_size=options['lote']):
+            lote.append(match)
+            if len(lote) >= options['lote']:
+                total += self._recalcular(lote)
+                lote = []
+        if lote:
+            total += self._recalcular(lote)
+
+        self.stdout.write(self.style.SUCCESS(f'{total} matches recalculados'))
+
+    def _recalcular(self, matches):
+        ultimos = Mensaje.objects.in_bulk(
+            [m.ultimo_id for m in matches if m.ultimo_id is not None]
+        )
+
+        no_leidos = {}
+        # No leídos: mensajes del otro lado después de la marca de agua
+        conteos = Mensaje.objects.filter(
+            Q(remitente=F('match__usuario1'), id__gt=F('match__ultimo_leido_usuario2')) |
+            Q(remitente=F('match__usuario2'), id__gt=F('match__ultimo_leido_usuario1')),
+            match__in=matches
+        ).values('match_id', 'remitente_id').annotate(total=Count('id'))
+        for fila in conteos:
+            no_leidos[(fila['match_id'], fila['remitente_id'])] = fila['total']
+
+        # Sin mensajes en la tabla pero con archivo: el resumen guardado es
+        # el único que queda, no se toca
+        matches = [
+            m for m in matches
+            if m.ultimo_id is not None or not m.archivado_hasta_id
+        ]
+        for match in matches:
+            mensaje = ultimos.get(match.ultimo_id)
+            match.ultimo_mensaje = mensaje.fecha if mensaje else None
+            match.id_ultimo_mensaje = mensaje.id if mensaje else None
+            match.preview_ultimo_mensaje = generar_preview(mensaje.contenido) if mensaje else ''
+            match.remitente_ultimo_mensaje_id = mensaje.remitente_id if mensaje else None
+            # Los no leídos de un lado son los mensajes que envió el otro
+            match.no_leidos_usuario1 = no_leidos.get((match.id, match.usuario2_id), 0)
+            match.no_leidos_usuario2 = no_leidos.get((match.id, match.usuario1_id), 0)
+
+        Match.objects.bulk_update(matches, CAMPOS_RESUMEN)
+        return len(matches)
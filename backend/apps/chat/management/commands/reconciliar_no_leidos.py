@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.chat.models import ContadorNoLeidos
+
+
+class Command(BaseCommand):
+    """
+    Recalcula los contadores de no leídos (badge) desde los mensajes y las
+    marcas de lectura, reporta los que se desviaron y los corrige.
+
+    Uso: python manage.py reconciliar_no_leidos [--usuario ID ...] [--simular]
+    """
+    help = 'Recalcula los contadores de no leídos y reporta las diferencias'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--usuario',
+            type=int,
+            nargs='+',
+            help='Ids de usuario a reconciliar (por defecto todos)'
+        )
+        parser.add_argument(
+            '--simular',
+            action='store_true',
+            help='Solo reportar las diferencias, sin corregirlas'
+        )
+
+    def handle(self, *args, **options):
+        usuario_ids = options['usuario']
+        reales = ContadorNoLeidos.calcular(usuario_ids)
+
+        contadores = ContadorNoLeidos.objects.all()
+        if usuario_ids:
+            contadores = contadores.filter(usuario_id__in=usuario_ids)
+
+        corregir = []
+        revisados = set()
+        for contador in contadores.iterator():
+            revisados.add(contador.usuario_id)
+            esperado = reales.get(contador.usuario_id, (0, 0))
+            if (contador.mensajes, contador.conversaciones) != esperado:
+                self._reportar(contador.usuario_id, (contador.mensajes, contador.conversaciones), esperado)
+                contador.mensajes, contador.conversaciones = esperado
+                contador.fecha_actualizacion = timezone.now()
+                corregir.append(contador)
+
+        # Usuarios con no leídos que todavía no tienen contador
+        nuevos = [
+            ContadorNoLeidos(usuario_id=usuario_id, mensajes=mensajes, conversaciones=conversaciones)
+            for usuario_id, (mensajes, conversaciones) in reales.items()
+            if usuario_id not in revisados
+        ]
+        if options['verbosity'] > 1:
+            for contador in nuevos:
+                self.stdout.write(f'Usuario {contador.usuario_id}: sin contador')
+
+        if not options['simular']:
+            ContadorNoLeidos.objects.bulk_update(
+                corregir, ['mensajes', 'conversaciones', 'fecha_actualizacion'], batch_size=500
+            )
+            ContadorNoLeidos.objects.bulk_create(nuevos, batch_size=500, ignore_conflicts=True)
+
+        estilo = self.style.WARNING if corregir else self.style.SUCCESS
+        accion = 'encontrados' if options['simular'] else 'corregidos'
+        self.stdout.write(estilo(
+            f'{len(revisados)} contadores revisados, {len(corregir)} desviados {accion}, '
+            f'{len(nuevos)} faltantes'
+        ))
+
+    def _reportar(self, usuario_id, guardado, esperado):
+        self.stdout.write(
+            f'Usuario {usuario_id}: {guardado[0]} mensajes / {guardado[1]} conversaciones, '
+            f'esperado {esperado[0]} / {esperado[1]}'
+        )
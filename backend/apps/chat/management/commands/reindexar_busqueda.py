@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from apps.chat import busqueda
+
+
+class Command(BaseCommand):
+    """
+    Reconstruye el índice de texto completo de los mensajes desde
+    chat_mensaje (y reinstala los triggers en SQLite).
+
+    Uso: python manage.py reindexar_busqueda
+    """
+    help = 'Reconstruye el índice de búsqueda de mensajes'
+
+    def handle(self, *args, **options):
+        busqueda.instalar_triggers(connection)
+        busqueda.reconstruir_indice(connection)
+        self.stdout.write(self.style.SUCCESS(
+            f'Índice de búsqueda reconstruido ({connection.vendor})'
+        ))
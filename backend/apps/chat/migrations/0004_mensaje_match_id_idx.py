@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_initial'),
+        ('matches', '0007_match_indices_actividad'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='mensaje',
+            name='chat_mensaj_match_i_312380_idx',
+        ),
+        migrations.AddIndex(
+            model_name='mensaje',
+            index=models.Index(fields=['match', 'id'], name='chat_mensaj_match_i_f70293_idx'),
+        ),
+    ]
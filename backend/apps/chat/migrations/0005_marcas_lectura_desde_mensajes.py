@@ -0,0 +1,91 @@
+from django.db import migrations
+from django.db.models import Count, F, Max, Q
+from django.db.models.functions import Coalesce
+
+
+CAMPOS = [
+    'ultimo_leido_usuario1', 'ultimo_leido_usuario2',
+    'fecha_lectura_usuario1', 'fecha_lectura_usuario2',
+]
+
+
+def calcular_marcas(apps, schema_editor):
+    """
+    Pasa el estado de lectura por mensaje (leido) a la marca de agua de cada
+    lado del match: el id del último mensaje leído que le enviaron.
+    """
+    Match = apps.get_model('matches', 'Match')
+    Mensaje = apps.get_model('chat', 'Mensaje')
+
+    leidos = Mensaje.objects.filter(leido=True).values(
+        'match_id', 'remitente_id'
+    ).annotate(hasta_id=Max('id'), fecha=Max('fecha_lectura'))
+    marcas = {(fila['match_id'], fila['remitente_id']): fila for fila in leidos.iterator()}
+
+    pendientes = []
+    for match in Match.objects.filter(id__in={m for m, _ in marcas}).iterator():
+        # usuario1 leyó lo que le envió usuario2 y viceversa
+        for lado, remitente_id in (('usuario1', match.usuario2_id), ('usuario2', match.usuario1_id)):
+            fila = marcas.get((match.id, remitente_id))
+            if fila:
+                setattr(match, f'ultimo_leido_{lado}', fila['hasta_id'])
+                setattr(match, f'fecha_lectura_{lado}', fila['fecha'])
+        pendientes.append(match)
+        if len(pendientes) >= 500:
+            Match.objects.bulk_update(pendientes, CAMPOS)
+            pendientes = []
+    if pendientes:
+        Match.objects.bulk_update(pendientes, CAMPOS)
+
+    recontar_no_leidos(Match, Mensaje)
+
+
+def recontar_no_leidos(Match, Mensaje):
+    """
+    Los contadores de no leídos pasan a ser los mensajes del otro usuario
+    después de la marca de cada lado (sin marca, todos)
+    """
+    def no_leidos(lado, remitente):
+        return Count('id', filter=Q(
+            remitente_id=F(f'match__{remitente}_id'),
+            id__gt=Coalesce(F(f'match__ultimo_leido_{lado}'), 0)
+        ))
+
+    conteos = {
+        fila['match_id']: fila
+        for fila in Mensaje.objects.values('match_id').annotate(
+            usuario1=no_leidos('usuario1', 'usuario2'),
+            usuario2=no_leidos('usuario2', 'usuario1'),
+        ).iterator()
+    }
+    pendientes = []
+    for match in Match.objects.only('id', 'no_leidos_usuario1', 'no_leidos_usuario2').iterator():
+        fila = conteos.get(match.id, {})
+        match.no_leidos_usuario1 = fila.get('usuario1', 0)
+        match.no_leidos_usuario2 = fila.get('usuario2', 0)
+        pendientes.append(match)
+        if len(pendientes) >= 500:
+            Match.objects.bulk_update(pendientes, ['no_leidos_usuario1', 'no_leidos_usuario2'])
+            pendientes = []
+    if pendientes:
+        Match.objects.bulk_update(pendientes, ['no_leidos_usuario1', 'no_leidos_usuario2'])
+
+
+def restaurar_leidos(apps, schema_editor):
+    Mensaje = apps.get_model('chat', 'Mensaje')
+    Mensaje.objects.filter(
+        Q(remitente=F('match__usuario1'), id__lte=F('match__ultimo_leido_usuario2')) |
+        Q(remitente=F('match__usuario2'), id__lte=F('match__ultimo_leido_usuario1'))
+    ).update(leido=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_mensaje_match_id_idx'),
+        ('matches', '0008_match_marcas_lectura'),
+    ]
+
+    operations = [
+        migrations.RunPython(calcular_marcas, restaurar_leidos),
+    ]
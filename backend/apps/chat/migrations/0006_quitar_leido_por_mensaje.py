@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:33
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_marcas_lectura_desde_mensajes'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='mensaje',
+            name='fecha_lectura',
+        ),
+        migrations.RemoveField(
+            model_name='mensaje',
+            name='leido',
+        ),
+    ]
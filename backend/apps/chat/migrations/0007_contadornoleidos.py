@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0006_quitar_leido_por_mensaje'),
+        ('usuarios', '0003_usuario_genero_fecha_nacimiento_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadorNoLeidos',
+            fields=[
+                ('usuario', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='contador_no_leidos', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('mensajes', models.PositiveIntegerField(default=0)),
+                ('conversaciones', models.PositiveIntegerField(default=0)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Contador de no leídos',
+                'verbose_name_plural': 'Contadores de no leídos',
+            },
+        ),
+    ]
@@ -0,0 +1,79 @@
+from django.db import migrations
+
+# Copia congelada del SQL de apps.chat.busqueda al crear esta migración: un
+# cambio posterior en ese módulo no debe cambiar lo que hace esta
+SQL_SQLITE = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS chat_mensaje_fts USING fts5(
+        contenido,
+        content='chat_mensaje',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chat_mensaje_fts_ai AFTER INSERT ON chat_mensaje BEGIN
+        INSERT INTO chat_mensaje_fts(rowid, contenido) VALUES (new.id, new.contenido);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chat_mensaje_fts_ad AFTER DELETE ON chat_mensaje BEGIN
+        INSERT INTO chat_mensaje_fts(chat_mensaje_fts, rowid, contenido)
+        VALUES ('delete', old.id, old.contenido);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chat_mensaje_fts_au AFTER UPDATE OF contenido ON chat_mensaje BEGIN
+        INSERT INTO chat_mensaje_fts(chat_mensaje_fts, rowid, contenido)
+        VALUES ('delete', old.id, old.contenido);
+        INSERT INTO chat_mensaje_fts(rowid, contenido) VALUES (new.id, new.contenido);
+    END
+    """,
+    "INSERT INTO chat_mensaje_fts(chat_mensaje_fts) VALUES ('rebuild')",
+]
+
+SQL_SQLITE_REVERSA = [
+    'DROP TRIGGER IF EXISTS chat_mensaje_fts_ai',
+    'DROP TRIGGER IF EXISTS chat_mensaje_fts_ad',
+    'DROP TRIGGER IF EXISTS chat_mensaje_fts_au',
+    'DROP TABLE IF EXISTS chat_mensaje_fts',
+]
+
+SQL_POSTGRES = [
+    """
+    CREATE INDEX IF NOT EXISTS chat_mensaje_contenido_fts_idx ON chat_mensaje
+    USING GIN (to_tsvector('spanish'::regconfig, COALESCE(contenido, '')))
+    """,
+]
+
+SQL_POSTGRES_REVERSA = ['DROP INDEX IF EXISTS chat_mensaje_contenido_fts_idx']
+
+
+def _ejecutar(schema_editor, por_motor):
+    sentencias = por_motor.get(schema_editor.connection.vendor, [])
+    with schema_editor.connection.cursor() as cursor:
+        for sql in sentencias:
+            cursor.execute(sql)
+
+
+def instalar_indice(apps, schema_editor):
+    _ejecutar(schema_editor, {'sqlite': SQL_SQLITE, 'postgresql': SQL_POSTGRES})
+
+
+def quitar_indice(apps, schema_editor):
+    _ejecutar(schema_editor, {'sqlite': SQL_SQLITE_REVERSA, 'postgresql': SQL_POSTGRES_REVERSA})
+
+
+class Migration(migrations.Migration):
+    """
+    Índice de texto completo de los mensajes: FTS5 en SQLite y GIN en
+    PostgreSQL (ver apps.chat.busqueda)
+    """
+
+    dependencies = [
+        ('chat', '0007_contadornoleidos'),
+    ]
+
+    operations = [
+        migrations.RunPython(instalar_indice, quitar_indice),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0008_busqueda_mensajes'),
+        ('matches', '0009_match_archivado_hasta_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivoConversacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('desde_id', models.BigIntegerField()),
+                ('hasta_id', models.BigIntegerField()),
+                ('cantidad', models.PositiveIntegerField()),
+                ('datos', models.BinaryField(help_text='Mensajes en JSON comprimido con zlib')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('match', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='archivos', to='matches.match')),
+            ],
+            options={
+                'verbose_name': 'Archivo de conversación',
+                'verbose_name_plural': 'Archivos de conversaciones',
+                'ordering': ['match', 'desde_id'],
+                'indexes': [models.Index(fields=['match', 'hasta_id'], name='chat_archiv_match_i_3c88d1_idx')],
+            },
+        ),
+    ]
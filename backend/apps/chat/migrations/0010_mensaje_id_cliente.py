@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0009_archivoconversacion'),
+        ('matches', '0010_swipe_id_cliente'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mensaje',
+            name='id_cliente',
+            field=models.CharField(blank=True, help_text='Clave de idempotencia que generó el cliente', max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='mensaje',
+            constraint=models.UniqueConstraint(condition=models.Q(('id_cliente__isnull', False)), fields=('remitente', 'id_cliente'), name='mensaje_remitente_id_cliente_unico'),
+        ),
+    ]
@@ -1,6 +1,19 @@
-from django.db import models
+import json
+import zlib
+from datetime import datetime
+
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, Count, Exists, F, Min, Q, When
+from django.db.models.functions import Greatest
 from apps.usuarios.models import Usuario
-from apps.matches.models import Match
+from apps.matches.models import Match, generar_preview
+from apps.sincronizacion.models import Cambio
+from . import tiempo_real
+from .coalescer import obtener_coalescedor
+
+# Valor por defecto de `tope` en ArchivoConversacion.limite_archivable
+_SIN_TOPE = object()
 
 
 # Create your models here.
@@ -28,44 +41,419 @@ class Mensaje(models.Model):
     
     fecha = models.DateTimeField(auto_now_add=True)
     
-    leido = models.BooleanField(
-        default=False,
-        help_text="Si el mensaje fue leído por el destinatario"
-    )
-    
-    fecha_lectura = models.DateTimeField(
+    id_cliente = models.CharField(
+        max_length=64,
         null=True,
         blank=True,
-        help_text="Cuándo fue leído el mensaje"
+        help_text="Clave de idempotencia que generó el cliente"
     )
     
     class Meta:
         verbose_name = 'Mensaje'
         verbose_name_plural = 'Mensajes'
         ordering = ['fecha']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['remitente', 'id_cliente'],
+                condition=models.Q(id_cliente__isnull=False),
+                name='mensaje_remitente_id_cliente_unico'
+            ),
+        ]
         indexes = [
-            models.Index(fields=['match', 'fecha']),
+            models.Index(fields=['match', 'id']),
             models.Index(fields=['remitente', 'fecha']),
         ]
     
     def __str__(self):
-        preview = self.contenido[:50] + '...' if len(self.contenido) > 50 else self.contenido
-        return f"{self.remitente.nombre_completo}: {preview}"
+        return f"{self.remitente.nombre_completo}: {generar_preview(self.contenido)}"
     
     def save(self, *args, **kwargs):
         """
-        Actualizar la fecha del último mensaje en el match
+        Al crear el mensaje se actualiza el resumen del match (fecha, preview
+        y no leídos del destinatario) en la misma transacción, o en lote
+        después del commit si CHAT_COALESCER_ACTIVO (apps.chat.coalescer)
         """
-        super().save(*args, **kwargs)
-        
-        # Actualizar ultimo_mensaje en el Match
-        self.match.ultimo_mensaje = self.fecha
-        self.match.save(update_fields=['ultimo_mensaje'])
+        es_nuevo = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if es_nuevo:
+                if settings.CHAT_COALESCER_ACTIVO:
+                    # El resumen del match se escribe después, en lote
+                    mensaje = self
+                    transaction.on_commit(lambda: obtener_coalescedor().agregar(mensaje))
+                else:
+                    self.match.registrar_mensaje(self)
+                    ContadorNoLeidos.sumar_mensajes(
+                        self.match, self.match.otro_usuario_id(self.remitente_id)
+                    )
+                Cambio.registrar(
+                    [self.match.usuario1_id, self.match.usuario2_id],
+                    Cambio.MENSAJE, self.id
+                )
+                tiempo_real.notificar_mensaje(self)
+    
+    @classmethod
+    def enviar(cls, match, remitente, contenido, id_cliente=None):
+        """
+        Crea el mensaje. Con `id_cliente` un reintento del mismo envío
+        retorna el mensaje original en lugar de duplicarlo.
+        """
+        try:
+            return cls.objects.create(
+                match=match,
+                remitente=remitente,
+                contenido=contenido,
+                id_cliente=id_cliente
+            )
+        except IntegrityError:
+            if id_cliente is None:
+                raise
+            return cls.objects.get(remitente=remitente, id_cliente=id_cliente)
+    
+    @classmethod
+    def marcar_leidos(cls, match, usuario, hasta_id=None):
+        """
+        Marca como leídos los mensajes que recibió `usuario` en el match
+        (todos, o hasta `hasta_id`). Solo se escribe la marca de agua en la
+        fila del match; los mensajes no se tocan. Retorna cuántos mensajes
+        se marcaron.
+        """
+        campo = match.campo_no_leidos(usuario.id)
+        with transaction.atomic():
+            # Bloquear la fila da el número exacto de no leídos de antes. Con
+            # el coalescedor puede ser 0 aunque haya mensajes nuevos que el
+            # usuario ya vio (con `hasta_id`), así que se marca de todos modos
+            pendientes = Match.objects.select_for_update().filter(
+                pk=match.pk
+            ).values_list(campo, flat=True).first()
+            if pendientes is None or not match.marcar_leidos_por(usuario.id, hasta_id):
+                return 0
+            restantes = match.no_leidos_de(usuario.id)
+            ContadorNoLeidos.ajustar(usuario.id, pendientes, restantes)
+            Cambio.registrar_lectura(match, usuario.id)
+            tiempo_real.notificar_leidos(match, usuario.id, match.ultimo_leido_de(usuario.id))
+        return max(pendientes - restantes, 0)
     
     def marcar_como_leido(self):
-        """Marca el mensaje como leído"""
-        if not self.leido:
-            from django.utils import timezone
-            self.leido = True
-            self.fecha_lectura = timezone.now()
-            self.save(update_fields=['leido', 'fecha_lectura'])
\ No newline at end of file
+        """Marca como leído este mensaje (y los anteriores del mismo match)"""
+        destinatario = self.match.obtener_otro_usuario(self.remitente)
+        return Mensaje.marcar_leidos(self.match, destinatario, hasta_id=self.id)
+
+
+
+class ContadorNoLeidos(models.Model):
+    """
+    Total de mensajes no leídos y de conversaciones con no leídos de un
+    usuario (el badge de la app), en matches activos. Se mantiene junto con
+    los contadores por lado de Match: suma al crear un mensaje y resta al
+    leer o desactivar un match. manage.py reconciliar_no_leidos lo recalcula
+    desde los mensajes y reporta las diferencias.
+    """
+    
+    usuario = models.OneToOneField(
+        Usuario,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='contador_no_leidos'
+    )
+    
+    mensajes = models.PositiveIntegerField(default=0)
+    
+    conversaciones = models.PositiveIntegerField(default=0)
+    
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Contador de no leídos'
+        verbose_name_plural = 'Contadores de no leídos'
+    
+    def __str__(self):
+        return f"{self.usuario_id}: {self.mensajes} mensajes en {self.conversaciones} conversaciones"
+    
+    @staticmethod
+    def calcular(usuario_ids=None):
+        """
+        Calcula desde la tabla de mensajes y las marcas de lectura
+        {usuario_id: (mensajes, conversaciones)} de los usuarios indicados (o
+        de todos) en una sola consulta agrupada. Los usuarios sin no leídos no
+        aparecen.
+        """
+        no_leidos = Mensaje.objects.filter(
+            Q(remitente=F('match__usuario1'), id__gt=F('match__ultimo_leido_usuario2')) |
+            Q(remitente=F('match__usuario2'), id__gt=F('match__ultimo_leido_usuario1')),
+            match__activo=True
+        ).annotate(
+            destinatario=Case(
+                When(remitente=F('match__usuario1'), then=F('match__usuario2')),
+                default=F('match__usuario1')
+            )
+        )
+        if usuario_ids is not None:
+            no_leidos = no_leidos.filter(
+                Q(match__usuario1__in=usuario_ids) | Q(match__usuario2__in=usuario_ids),
+                destinatario__in=usuario_ids
+            )
+        
+        filas = no_leidos.values('destinatario').annotate(
+            total=Count('id'),
+            total_conversaciones=Count('match', distinct=True)
+        ).order_by()
+        return {
+            fila['destinatario']: (fila['total'], fila['total_conversaciones'])
+            for fila in filas
+        }
+    
+    @classmethod
+    def recalcular(cls, usuario_id):
+        """Recalcula y guarda el contador de un usuario desde los mensajes"""
+        mensajes, conversaciones = cls.calcular([usuario_id]).get(usuario_id, (0, 0))
+        contador, _ = cls.objects.update_or_create(
+            usuario_id=usuario_id,
+            defaults={'mensajes': mensajes, 'conversaciones': conversaciones}
+        )
+        return contador
+    
+    @classmethod
+    def obtener(cls, usuario_id):
+        """Contador del usuario; si todavía no existe se calcula"""
+        contador = cls.objects.filter(usuario_id=usuario_id).first()
+        return contador or cls.recalcular(usuario_id)
+    
+    @classmethod
+    def sumar_mensajes(cls, match, destinatario_id, cantidad=1):
+        """
+        Suma `cantidad` mensajes no leídos al destinatario. Se llama después
+        de sumarlos al contador del match en la misma transacción: la
+        conversación es nueva para el badge si el contador del match quedó
+        exactamente en `cantidad`.
+        """
+        campo = match.campo_no_leidos(destinatario_id)
+        conversacion_nueva = Exists(Match.objects.filter(pk=match.pk, **{campo: cantidad}))
+        actualizados = cls.objects.filter(usuario_id=destinatario_id).update(
+            mensajes=F('mensajes') + cantidad,
+            conversaciones=F('conversaciones') + Case(
+                When(conversacion_nueva, then=1), default=0
+            )
+        )
+        if not actualizados:
+            cls.recalcular(destinatario_id)
+    
+    @classmethod
+    def ajustar(cls, usuario_id, antes, despues):
+        """
+        Aplica el cambio del contador de no leídos de un match del usuario
+        (de `antes` a `despues`); la conversación entra o sale del badge si
+        el contador pasa de o a 0
+        """
+        mensajes = despues - antes
+        conversaciones = (despues > 0) - (antes > 0)
+        if not mensajes and not conversaciones:
+            return
+        actualizados = cls.objects.filter(usuario_id=usuario_id).update(
+            mensajes=Greatest(F('mensajes') + mensajes, 0),
+            conversaciones=Greatest(F('conversaciones') + conversaciones, 0)
+        )
+        if not actualizados:
+            cls.recalcular(usuario_id)
+    
+    @classmethod
+    def descontar(cls, usuario_id, mensajes, conversaciones):
+        """Resta mensajes leídos (o de un match desactivado) del contador"""
+        if not mensajes and not conversaciones:
+            return
+        actualizados = cls.objects.filter(usuario_id=usuario_id).update(
+            mensajes=Greatest(F('mensajes') - mensajes, 0),
+            conversaciones=Greatest(F('conversaciones') - conversaciones, 0)
+        )
+        if not actualizados:
+            cls.recalcular(usuario_id)
+
+
+class ArchivoConversacion(models.Model):
+    """
+    Segmento archivado de una conversación: mensajes consecutivos (por id)
+    de un match en JSON comprimido con zlib. manage.py archivar_conversaciones
+    mueve aquí los mensajes viejos de matches inactivos o sin actividad
+    reciente, para que la tabla de mensajes y sus índices se mantengan
+    chicos. MensajesView los lee de aquí al paginar más atrás de lo que queda
+    en la tabla; los mensajes archivados ya no aparecen en la búsqueda.
+    
+    Solo se archivan mensajes cuyos cambios de sincronización ya se purgaron
+    (SINCRONIZACION_RETENCION_DIAS): un cliente que todavía puede recibirlos
+    en /api/sync/ los encuentra en la tabla.
+    
+    Todos los mensajes archivados de un match tienen id menor que los que
+    siguen en la tabla (Match.archivado_hasta_id marca el corte).
+    """
+    
+    match = models.ForeignKey(
+        Match,
+        on_delete=models.CASCADE,
+        related_name='archivos',
+        db_index=False  # Lo cubre el índice (match, hasta_id)
+    )
+    
+    desde_id = models.BigIntegerField()
+    
+    hasta_id = models.BigIntegerField()
+    
+    cantidad = models.PositiveIntegerField()
+    
+    datos = models.BinaryField(help_text="Mensajes en JSON comprimido con zlib")
+    
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Archivo de conversación'
+        verbose_name_plural = 'Archivos de conversaciones'
+        ordering = ['match', 'desde_id']
+        indexes = [
+            models.Index(fields=['match', 'hasta_id']),
+        ]
+    
+    def __str__(self):
+        return f"Match {self.match_id}: mensajes {self.desde_id}-{self.hasta_id}"
+    
+    @staticmethod
+    def comprimir(filas):
+        """Comprime filas de Mensaje.values('id', 'remitente_id', 'contenido', 'fecha')"""
+        datos = [
+            {**fila, 'fecha': fila['fecha'].isoformat()}
+            for fila in filas
+        ]
+        return zlib.compress(json.dumps(datos, separators=(',', ':')).encode(), 9)
+    
+    def filas(self):
+        """Los mensajes del segmento como dicts, en orden de id"""
+        filas = json.loads(zlib.decompress(self.datos))
+        for fila in filas:
+            fila['fecha'] = datetime.fromisoformat(fila['fecha'])
+        return filas
+    
+    @classmethod
+    def archivar(cls, match, hasta_id, tamano_segmento=500):
+        """
+        Mueve al archivo los mensajes del match con id <= hasta_id, en
+        segmentos de hasta `tamano_segmento` mensajes (cada uno en su propia
+        transacción). Retorna cuántos mensajes se archivaron.
+        """
+        total = 0
+        while True:
+            with transaction.atomic():
+                filas = list(Mensaje.objects.filter(
+                    match=match, id__lte=hasta_id
+                ).order_by('id').values('id', 'remitente_id', 'contenido', 'fecha')[:tamano_segmento])
+                if not filas:
+                    return total
+                ultimo_id = filas[-1]['id']
+                cls.objects.create(
+                    match=match,
+                    desde_id=filas[0]['id'],
+                    hasta_id=ultimo_id,
+                    cantidad=len(filas),
+                    datos=cls.comprimir(filas)
+                )
+                Mensaje.objects.filter(match=match, id__lte=ultimo_id).delete()
+                Match.objects.filter(pk=match.pk).update(archivado_hasta_id=ultimo_id)
+                match.archivado_hasta_id = ultimo_id
+            total += len(filas)
+    
+    @staticmethod
+    def tope_sincronizacion():
+        """
+        Id hasta el que se puede archivar sin romper la sincronización: el
+        anterior al primer mensaje que todavía tiene un Cambio (None si no
+        queda ninguno)
+        """
+        primero = Cambio.objects.filter(
+            id__gt=Cambio.horizonte(), tipo=Cambio.MENSAJE
+        ).aggregate(primero=Min('objeto_id'))['primero']
+        return None if primero is None else primero - 1
+    
+    @classmethod
+    def limite_archivable(cls, match, ventana, tope=_SIN_TOPE):
+        """
+        Id hasta el que se puede archivar el match. De un match activo se
+        dejan en la tabla los últimos `ventana` mensajes y todo lo que
+        alguno de los dos no ha leído (el badge se calcula desde la tabla).
+        Nunca pasa de `tope` (por defecto `tope_sincronizacion()`).
+        """
+        if tope is _SIN_TOPE:
+            tope = cls.tope_sincronizacion()
+        limite = cls._limite_archivable(match, ventana)
+        return limite if tope is None else min(limite, tope)
+    
+    @staticmethod
+    def _limite_archivable(match, ventana):
+        if not match.activo:
+            return match.id_ultimo_mensaje or 0
+        # Mensaje número ventana + 1 desde el final: de ahí hacia atrás se archiva
+        corte = list(Mensaje.objects.filter(match=match).order_by('-id').values_list(
+            'id', flat=True
+        )[ventana:ventana + 1])
+        if not corte:
+            return 0
+        return min(corte[0], match.ultimo_leido_usuario1, match.ultimo_leido_usuario2)
+    
+    @classmethod
+    def leer(cls, match, cantidad, antes_de=None, despues_de=None):
+        """
+        Hasta `cantidad` mensajes archivados del match como instancias de
+        Mensaje sin guardar: los anteriores a `antes_de` (del más nuevo al
+        más antiguo) o los posteriores a `despues_de` (del más antiguo al
+        más nuevo). Sin ninguno de los dos, los más nuevos del archivo.
+        """
+        filas = cls._filas_archivadas(match, cantidad, antes_de, despues_de)
+        if not filas:
+            return []
+        
+        usuarios = Usuario.objects.in_bulk([match.usuario1_id, match.usuario2_id])
+        mensajes = []
+        for fila in filas:
+            mensaje = Mensaje(match=match, **fila)
+            mensaje.remitente = usuarios.get(fila['remitente_id'])
+            mensajes.append(mensaje)
+        return mensajes
+    
+    @classmethod
+    def leer_filas(cls, match, cantidad, antes_de=None, despues_de=None):
+        """
+        Como `leer`, pero como filas con las columnas de
+        MensajeLigeroSerializer (las mismas que su .values())
+        """
+        filas = cls._filas_archivadas(match, cantidad, antes_de, despues_de)
+        if not filas:
+            return []
+        
+        nombres = dict(Usuario.objects.filter(
+            id__in=[match.usuario1_id, match.usuario2_id]
+        ).values_list('id', 'nombre_completo'))
+        for fila in filas:
+            fila['match_id'] = match.id
+            fila['remitente__nombre_completo'] = nombres.get(fila['remitente_id'])
+        return filas
+    
+    @classmethod
+    def _filas_archivadas(cls, match, cantidad, antes_de, despues_de):
+        segmentos = cls.objects.filter(match=match)
+        if despues_de is not None:
+            segmentos = segmentos.filter(hasta_id__gt=despues_de).order_by('hasta_id')
+        else:
+            if antes_de is not None:
+                segmentos = segmentos.filter(desde_id__lt=antes_de)
+            segmentos = segmentos.order_by('-hasta_id')
+        
+        filas = []
+        # Casi siempre basta un segmento; se descomprimen conforme se necesitan
+        for segmento in segmentos.iterator(chunk_size=2):
+            del_segmento = segmento.filas()
+            if despues_de is not None:
+                filas.extend(f for f in del_segmento if f['id'] > despues_de)
+            else:
+                filas.extend(
+                    f for f in reversed(del_segmento)
+                    if antes_de is None or f['id'] < antes_de
+                )
+            if len(filas) >= cantidad:
+                break
+        return filas[:cantidad]
@@ -1,6 +1,8 @@
 from rest_framework import serializers
 from .models import Mensaje
 from apps.matches.models import Match
+from cuceimatch.idempotencia import verificar_original
+from cuceimatch.serializacion import SerializadorLigero, columna, columna_fecha_hora, fecha_hora
 
 
 class MensajeSerializer(serializers.ModelSerializer):
@@ -8,6 +10,8 @@ class MensajeSerializer(serializers.ModelSerializer):
     Serializer para mensajes
     """
     es_propio = serializers.SerializerMethodField()
+    leido = serializers.SerializerMethodField()
+    fecha_lectura = serializers.SerializerMethodField()
     remitente_nombre = serializers.CharField(
         source='remitente.nombre_completo',
         read_only=True
@@ -20,16 +24,88 @@ class MensajeSerializer(serializers.ModelSerializer):
             'contenido', 'fecha', 'leido', 'fecha_lectura',
             'es_propio'
         ]
-        read_only_fields = ['id', 'fecha', 'leido', 'fecha_lectura']
+        read_only_fields = ['id', 'fecha']
+    
+    def _match(self, obj):
+        # Las vistas de una sola conversación pasan el match en el contexto
+        return self.context.get('match') or obj.match
+    
+    def get_leido(self, obj):
+        """Leído si está antes de la marca de agua del destinatario"""
+        return self._match(obj).mensaje_leido(obj)
+    
+    def get_fecha_lectura(self, obj):
+        """
+        Última vez que el destinatario leyó la conversación (se guarda una
+        fecha por lado, no por mensaje)
+        """
+        match = self._match(obj)
+        if not match.mensaje_leido(obj):
+            return None
+        fecha = match.fecha_lectura_de(match.otro_usuario_id(obj.remitente_id))
+        return serializers.DateTimeField().to_representation(fecha) if fecha else None
     
     def get_es_propio(self, obj):
         """Verifica si el mensaje es del usuario autenticado"""
         request = self.context.get('request')
         if request and request.user:
-            return obj.remitente == request.user
+            return obj.remitente_id == request.user.id
         return False
 
 
+class MensajeLigeroSerializer(SerializadorLigero):
+    """
+    Misma salida que MensajeSerializer sobre filas de .values() (ver
+    cuceimatch.serializacion) de una sola conversación: el match va en el
+    contexto y leído / fecha de lectura salen de sus marcas de agua, que se
+    calculan una vez por lista
+    """
+    columnas = ('id', 'match_id', 'remitente_id', 'remitente__nombre_completo', 'contenido', 'fecha')
+    
+    def plan(self, filas):
+        match = self.context['match']
+        request = self.context.get('request')
+        usuario_id = request.user.id if request and request.user else None
+        
+        # remitente_id -> (último id leído por el destinatario, fecha de lectura)
+        lectura = {}
+        for remitente_id in (match.usuario1_id, match.usuario2_id):
+            destinatario_id = match.otro_usuario_id(remitente_id)
+            lectura[remitente_id] = (
+                match.ultimo_leido_de(destinatario_id),
+                fecha_hora(match.fecha_lectura_de(destinatario_id))
+            )
+        
+        def leido(fila):
+            return fila['id'] <= lectura[fila['remitente_id']][0]
+        
+        def fecha_lectura(fila):
+            hasta_id, fecha = lectura[fila['remitente_id']]
+            return fecha if fila['id'] <= hasta_id else None
+        
+        return [
+            ('id', columna('id')),
+            ('match', columna('match_id')),
+            ('remitente', columna('remitente_id')),
+            ('remitente_nombre', columna('remitente__nombre_completo')),
+            ('contenido', columna('contenido')),
+            ('fecha', columna_fecha_hora('fecha')),
+            ('leido', leido),
+            ('fecha_lectura', fecha_lectura),
+            ('es_propio', lambda fila: fila['remitente_id'] == usuario_id),
+        ]
+
+
+class ResultadoBusquedaSerializer(MensajeSerializer):
+    """
+    Resultado de la búsqueda de mensajes (apps.chat.busqueda)
+    """
+    resaltado = serializers.CharField(read_only=True)
+    
+    class Meta(MensajeSerializer.Meta):
+        fields = MensajeSerializer.Meta.fields + ['resaltado']
+
+
 class EnviarMensajeSerializer(serializers.Serializer):
     """
     Serializer para enviar un nuevo mensaje
@@ -53,10 +129,15 @@ class EnviarMensajeSerializer(serializers.Serializer):
         match = self.context['match']
         remitente = self.context['request'].user
         
-        mensaje = Mensaje.objects.create(
-            match=match,
-            remitente=remitente,
-            contenido=validated_data['contenido']
+        # Con clave de idempotencia un reintento retorna el mensaje original,
+        # que debe ser el mismo envío (mismo match y contenido)
+        mensaje = Mensaje.enviar(
+            match,
+            remitente,
+            validated_data['contenido'],
+            id_cliente=self.context.get('id_cliente')
         )
         
-        return mensaje
\ No newline at end of file
+        return verificar_original(
+            mensaje, match_id=match.id, contenido=validated_data['contenido']
+        )
\ No newline at end of file
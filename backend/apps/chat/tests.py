@@ -1,3 +1,640 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from apps.matches.models import Match
+from apps.matches.tests import crear_usuario
+from apps.sincronizacion.models import Cambio
+from .coalescer import Coalescedor
+from .models import Mensaje, ContadorNoLeidos, ArchivoConversacion
+from .serializers import MensajeSerializer, MensajeLigeroSerializer
+
+
+class ResumenConversacionTests(TestCase):
+    """
+    El resumen guardado en Match se mantiene al enviar y al leer mensajes
+    """
+
+    def setUp(self):
+        self.ana = crear_usuario('ana')
+        self.beto = crear_usuario('beto', genero='hombre')
+        self.match = Match.objects.crear_entre(self.ana.id, self.beto.id)
+        self.client = APIClient()
+
+    def enviar(self, remitente, contenido):
+        self.client.force_authenticate(remitente)
+        return self.client.post(
+            f'/api/chat/{self.match.id}/enviar/', {'contenido': contenido}
+        )
+
+    def test_enviar_y_leer(self):
+        self.enviar(self.ana, 'Hola')
+        self.enviar(self.ana, 'x' * 80)
+
+        self.match.refresh_from_db()
+        self.assertEqual(self.match.preview_ultimo_mensaje, 'x' * 50 + '...')
+        self.assertEqual(self.match.remitente_ultimo_mensaje_id, self.ana.id)
+        self.assertEqual(self.match.no_leidos_de(self.beto.id), 2)
+        self.assertEqual(self.match.no_leidos_de(self.ana.id), 0)
+
+        self.client.force_authenticate(self.beto)
+        response = self.client.get('/api/chat/conversaciones/')
+        self.assertEqual(response.data['results'][0]['mensajes_no_leidos'], 2)
+
+        self.client.get(f'/api/chat/{self.match.id}/mensajes/')
+        self.match.refresh_from_db()
+        self.assertEqual(self.match.no_leidos_de(self.beto.id), 0)
+
+    def test_reintento_con_clave_no_duplica(self):
+        cache.clear()
+        self.client.force_authenticate(self.ana)
+        url = f'/api/chat/{self.match.id}/enviar/'
+        primera = self.client.post(url, {'contenido': 'Hola'}, HTTP_IDEMPOTENCY_KEY='m-1')
+        repetida = self.client.post(url, {'contenido': 'Hola'}, HTTP_IDEMPOTENCY_KEY='m-1')
+        self.assertEqual(repetida.data, primera.data)
+        self.assertEqual(repetida['Idempotent-Replayed'], 'true')
+
+        cache.clear()
+        repetida = self.client.post(url, {'contenido': 'Hola'}, HTTP_IDEMPOTENCY_KEY='m-1')
+        self.assertEqual(repetida.status_code, 201)
+        self.assertEqual(repetida.data['id'], primera.data['id'])
+        self.assertEqual(Mensaje.objects.count(), 1)
+        self.match.refresh_from_db()
+        self.assertEqual(self.match.no_leidos_de(self.beto.id), 1)
+
+    def test_clave_reutilizada_para_otro_mensaje(self):
+        cache.clear()
+        otro = Match.objects.crear_entre(self.ana.id, crear_usuario('carlos', genero='hombre').id)
+        self.client.force_authenticate(self.ana)
+        url = f'/api/chat/{self.match.id}/enviar/'
+        self.client.post(url, {'contenido': 'Hola'}, HTTP_IDEMPOTENCY_KEY='m-1')
+
+        response = self.client.post(url, {'contenido': 'Adiós'}, HTTP_IDEMPOTENCY_KEY='m-1')
+        self.assertEqual(response.status_code, 422)
+        cache.clear()
+        for url, contenido in ((url, 'Adiós'), (f'/api/chat/{otro.id}/enviar/', 'Hola')):
+            response = self.client.post(url, {'contenido': contenido}, HTTP_IDEMPOTENCY_KEY='m-1')
+            self.assertEqual(response.status_code, 422)
+        self.assertEqual(list(Mensaje.objects.values_list('match_id', 'contenido')), [(self.match.id, 'Hola')])
+
+    def test_recalcular_resumenes(self):
+        self.enviar(self.ana, 'Hola')
+        self.enviar(self.beto, 'Qué tal')
+        ultimo = Mensaje.objects.latest('id')
+
+        Match.objects.update(
+            id_ultimo_mensaje=None, preview_ultimo_mensaje='',
+            no_leidos_usuario1=0, no_leidos_usuario2=0
+        )
+        call_command('recalcular_resumenes', stdout=StringIO())
+
+        self.match.refresh_from_db()
+        self.assertEqual(self.match.id_ultimo_mensaje, ultimo.id)
+        self.assertEqual(self.match.preview_ultimo_mensaje, 'Qué tal')
+        self.assertEqual(self.match.no_leidos_de(self.ana.id), 1)
+        self.assertEqual(self.match.no_leidos_de(self.beto.id), 1)
+
+
+class MarcasLecturaMigracionTests(TransactionTestCase):
+    """0005 pasa el estado por mensaje a marcas y recuenta los no leídos"""
+
+    antes = [('chat', '0004_mensaje_match_id_idx'), ('matches', '0008_match_marcas_lectura')]
+    despues = [('chat', '0005_marcas_lectura_desde_mensajes')]
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        self.ultimas = executor.loader.graph.leaf_nodes()
+        executor.migrate(self.antes)
+        self.apps = MigrationExecutor(connection).loader.project_state(self.antes).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(self.ultimas)
+
+    def test_contadores_desde_la_marca(self):
+        Usuario = self.apps.get_model('usuarios', 'Usuario')
+        Match = self.apps.get_model('matches', 'Match')
+        Mensaje = self.apps.get_model('chat', 'Mensaje')
+        ana, beto = (
+            Usuario.objects.create(
+                username=nombre, email=f'{nombre}@test.com', url_credencial=f'https://test.com/{nombre}'
+            )
+            for nombre in ('ana', 'beto')
+        )
+        # Contadores desviados del estado por mensaje
+        match = Match.objects.create(usuario1=ana, usuario2=beto, no_leidos_usuario1=7, no_leidos_usuario2=7)
+        # beto leyó hasta el segundo mensaje de ana (el primero quedó sin marcar)
+        for leido in (False, True, False):
+            Mensaje.objects.create(match=match, remitente=ana, contenido='a', leido=leido)
+        Mensaje.objects.create(match=match, remitente=beto, contenido='b')
+
+        MigrationExecutor(connection).migrate(self.despues)
+        match = MigrationExecutor(connection).loader.project_state(self.despues).apps.get_model(
+            'matches', 'Match'
+        ).objects.get(pk=match.pk)
+        self.assertEqual((match.no_leidos_usuario1, match.no_leidos_usuario2), (1, 1))
+
+
+class ContadorNoLeidosTests(TestCase):
+
+    def setUp(self):
+        self.ana = crear_usuario('ana')
+        self.beto = crear_usuario('beto', genero='hombre')
+        self.carlos = crear_usuario('carlos', genero='hombre')
+        self.match_beto = Match.objects.crear_entre(self.ana.id, self.beto.id)
+        self.match_carlos = Match.objects.crear_entre(self.ana.id, self.carlos.id)
+        self.client = APIClient()
+        self.client.force_authenticate(self.ana)
+
+    def badge(self):
+        with self.assertNumQueries(1):
+            return self.client.get('/api/chat/no-leidos/').data
+
+    def test_sumar_leer_y_desactivar(self):
+        for _ in range(2):
+            Mensaje.objects.create(match=self.match_beto, remitente=self.beto, contenido='Hola')
+        Mensaje.objects.create(match=self.match_carlos, remitente=self.carlos, contenido='Hola')
+        Mensaje.objects.create(match=self.match_carlos, remitente=self.ana, contenido='Hola')
+        self.assertEqual(self.badge(), {'mensajes': 3, 'conversaciones': 2})
+
+        self.match_beto.refresh_from_db()
+        Mensaje.marcar_leidos(self.match_beto, self.ana)
+        self.assertEqual(self.badge(), {'mensajes': 1, 'conversaciones': 1})
+
+        self.client.delete(f'/api/matches/{self.match_carlos.id}/eliminar/')
+        self.assertEqual(self.badge(), {'mensajes': 0, 'conversaciones': 0})
+
+    def test_reconciliar(self):
+        Mensaje.objects.create(match=self.match_beto, remitente=self.beto, contenido='Hola')
+        ContadorNoLeidos.objects.filter(usuario=self.ana).update(mensajes=7)
+
+        salida = StringIO()
+        call_command('reconciliar_no_leidos', '--simular', stdout=salida)
+        self.assertIn(f'Usuario {self.ana.id}: 7 mensajes', salida.getvalue())
+        self.assertEqual(ContadorNoLeidos.objects.get(usuario=self.ana).mensajes, 7)
+
+        call_command('reconciliar_no_leidos', stdout=StringIO())
+        self.assertEqual(ContadorNoLeidos.objects.get(usuario=self.ana).mensajes, 1)
+
+
+class CoalescedorTests(TestCase):
+
+    def setUp(self):
+        self.ana = crear_usuario('ana')
+        self.beto = crear_usuario('beto', genero='hombre')
+        self.match = Match.objects.crear_entre(self.ana.id, self.beto.id)
+        for usuario in (self.ana, self.beto):
+            ContadorNoLeidos.obtener(usuario.id)
+
+    @override_settings(CHAT_COALESCER_ACTIVO=True)
+    def test_un_update_por_match_y_sin_retroceder(self):
+        # Intervalo largo: el búfer solo se vacía a mano
+        coalescedor = Coalescedor(intervalo=3600)
+        with mock.patch('apps.chat.models.obtener_coalescedor', return_value=coalescedor):
+            with self.captureOnCommitCallbacks(execute=True):
+                primero = Mensaje.objects.create(match=self.match, remitente=self.beto, contenido='1')
+                Mensaje.objects.create(match=self.match, remitente=self.beto, contenido='2')
+                ultimo = Mensaje.objects.create(match=self.match, remitente=self.ana, contenido='3')
+
+        self.match.refresh_from_db()
+        self.assertIsNone(self.match.id_ultimo_mensaje)
+
+        # Candado, UPDATE con el recuento y lectura del match + badge de cada
+        # destinatario + cambios para la sincronización (y el savepoint)
+        with self.assertNumQueries(8):
+            self.assertEqual(coalescedor.vaciar(), 1)
+        self.match.refresh_from_db()
+        self.assertEqual(self.match.id_ultimo_mensaje, ultimo.id)
+        self.assertEqual(self.match.no_leidos_de(self.ana.id), 2)
+        self.assertEqual(self.match.no_leidos_de(self.beto.id), 1)
+        self.assertEqual(ContadorNoLeidos.obtener(self.ana.id).conversaciones, 1)
+
+        # Un lote atrasado no retrocede el último mensaje
+        Match.objects.filter(pk=self.match.pk).aplicar_actividad(
+            Match.datos_ultimo_mensaje(primero)
+        )
+        self.match.refresh_from_db()
+        self.assertEqual(self.match.preview_ultimo_mensaje, '3')
+
+    @override_settings(CHAT_COALESCER_ACTIVO=True, SINCRONIZACION_RETRASO=0)
+    def test_sincronizacion_ve_el_resumen(self):
+        coalescedor = Coalescedor(intervalo=3600)
+        client = APIClient()
+        client.force_authenticate(self.ana)
+        cursor = client.get('/api/sync/').data['cursor']
+        with mock.patch('apps.chat.models.obtener_coalescedor', return_value=coalescedor):
+            with self.captureOnCommitCallbacks(execute=True):
+                mensaje = Mensaje.objects.create(match=self.match, remitente=self.beto, contenido='Hola')
+        coalescedor.vaciar()
+
+        datos = client.get('/api/sync/', {'since': cursor}).data
+        self.assertEqual([m['id'] for m in datos['mensajes']], [mensaje.id])
+        self.assertEqual(len(datos['matches']), 1)
+        self.assertEqual(datos['matches'][0]['ultimo_mensaje_preview']['contenido'], 'Hola')
+        self.assertEqual(datos['matches'][0]['mensajes_no_leidos'], 1)
+
+    @override_settings(CHAT_COALESCER_ACTIVO=True)
+    def test_leido_antes_de_vaciar(self):
+        coalescedor = Coalescedor(intervalo=3600)
+        client = APIClient()
+        client.force_authenticate(self.ana)
+        with mock.patch('apps.chat.models.obtener_coalescedor', return_value=coalescedor):
+            with self.captureOnCommitCallbacks(execute=True):
+                Mensaje.objects.create(match=self.match, remitente=self.beto, contenido='1')
+            coalescedor.vaciar()
+            with self.captureOnCommitCallbacks(execute=True):
+                ultimo = Mensaje.objects.create(match=self.match, remitente=self.beto, contenido='2')
+
+            # ana ve el mensaje que todavía no está en el resumen del match
+            response = client.get(f'/api/chat/{self.match.id}/mensajes/')
+            self.assertEqual(response.data['mensajes'][-1]['id'], ultimo.id)
+            self.match.refresh_from_db()
+            self.assertEqual(self.match.ultimo_leido_de(self.ana.id), ultimo.id)
+
+            coalescedor.vaciar()
+        self.match.refresh_from_db()
+        self.assertEqual(self.match.id_ultimo_mensaje, ultimo.id)
+        self.assertEqual(self.match.no_leidos_de(self.ana.id), 0)
+        contador = ContadorNoLeidos.obtener(self.ana.id)
+        self.assertEqual((contador.mensajes, contador.conversaciones), (0, 0))
+
+    @override_settings(CHAT_COALESCER_ACTIVO=True)
+    def test_varios_procesos_no_desvian_los_contadores(self):
+        # Dos búferes (dos procesos) con mensajes del mismo match
+        procesos = [Coalescedor(intervalo=3600), Coalescedor(intervalo=3600)]
+        for proceso in procesos:
+            with mock.patch('apps.chat.models.obtener_coalescedor', return_value=proceso):
+                with self.captureOnCommitCallbacks(execute=True):
+                    Mensaje.objects.create(match=self.match, remitente=self.beto, contenido='x')
+
+        # El segundo vacía, ana lee todo y después vacía el primero
+        procesos[1].vaciar()
+        self.match.refresh_from_db()
+        self.assertEqual(Mensaje.marcar_leidos(self.match, self.ana), 2)
+        procesos[0].vaciar()
+
+        self.match.refresh_from_db()
+        self.assertEqual(self.match.no_leidos_de(self.ana.id), 0)
+        contador = ContadorNoLeidos.obtener(self.ana.id)
+        self.assertEqual((contador.mensajes, contador.conversaciones), (0, 0))
+        self.assertEqual(ContadorNoLeidos.calcular([self.ana.id]), {})
+
+
+class HistorialMensajesTests(TestCase):
+
+    def setUp(self):
+        self.ana = crear_usuario('ana')
+        self.beto = crear_usuario('beto', genero='hombre')
+        self.match = Match.objects.crear_entre(self.ana.id, self.beto.id)
+        self.ids = [
+            Mensaje.objects.create(
+                match=self.match, remitente=self.ana, contenido=str(i)
+            ).id
+            for i in range(5)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.ana)
+        self.url = f'/api/chat/{self.match.id}/mensajes/'
+
+    def ids_de(self, response):
+        return [m['id'] for m in response.data['mensajes']]
+
+    def test_hacia_atras_y_nuevos(self):
+        # match + mensajes; ana no tiene no leídos, así que no se marca nada
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, {'limit': 2})
+        self.assertEqual(self.ids_de(response), self.ids[3:])
+        self.assertTrue(response.data['has_more'])
+
+        response = self.client.get(self.url, {'limit': 3, 'before_id': self.ids[3]})
+        self.assertEqual(self.ids_de(response), self.ids[:3])
+        self.assertFalse(response.data['has_more'])
+
+        response = self.client.get(self.url, {'limit': 2, 'after_id': self.ids[1]})
+        self.assertEqual(self.ids_de(response), self.ids[2:4])
+        self.assertTrue(response.data['has_more'])
+
+    def test_marca_de_agua_de_lectura(self):
+        self.client.force_authenticate(self.beto)
+        # match + bloquearlo + UPDATE de la fila + releerla + badge + secuencia
+        # de cambios (y el savepoint); la tabla de mensajes no se escribe
+        with self.assertNumQueries(8):
+            self.client.post(
+                f'/api/chat/{self.match.id}/marcar-leidos/', {'hasta_id': self.ids[2]}
+            )
+        self.match.refresh_from_db()
+        self.assertEqual(self.match.ultimo_leido_de(self.beto.id), self.ids[2])
+        self.assertEqual(self.match.no_leidos_de(self.beto.id), 2)
+
+        self.client.force_authenticate(self.ana)
+        response = self.client.get(self.url)
+        self.assertEqual(
+            [m['leido'] for m in response.data['mensajes']],
+            [True, True, True, False, False]
+        )
+        self.assertIsNotNone(response.data['mensajes'][0]['fecha_lectura'])
+        self.assertIsNone(response.data['mensajes'][4]['fecha_lectura'])
+
+        # La marca no retrocede
+        Mensaje.marcar_leidos(self.match, self.beto, hasta_id=self.ids[0])
+        self.match.refresh_from_db()
+        self.assertEqual(self.match.ultimo_leido_de(self.beto.id), self.ids[2])
+
+    def test_serializador_ligero_igual_al_de_drf(self):
+        for i in range(3):
+            Mensaje.objects.create(match=self.match, remitente=self.beto, contenido=f'ñ {i}')
+        Mensaje.marcar_leidos(self.match, self.beto, hasta_id=self.ids[2])
+        Mensaje.marcar_leidos(self.match, self.ana)
+        self.match.refresh_from_db()
+        mensajes = Mensaje.objects.filter(match=self.match).order_by('id')
+
+        for usuario in (self.ana, self.beto):
+            request = Request(APIRequestFactory().get(self.url))
+            request.user = usuario
+            contexto = {'request': request, 'match': self.match}
+            self.assertEqual(
+                MensajeLigeroSerializer(
+                    MensajeLigeroSerializer.filas(mensajes), many=True, context=contexto
+                ).data,
+                MensajeSerializer(mensajes.select_related('remitente'), many=True, context=contexto).data
+            )
+
+            # Los mensajes archivados también
+            if usuario == self.ana:
+                ArchivoConversacion.archivar(self.match, self.ids[3])
+            self.assertEqual(
+                MensajeLigeroSerializer(
+                    ArchivoConversacion.leer_filas(self.match, 10), many=True, context=contexto
+                ).data,
+                MensajeSerializer(
+                    ArchivoConversacion.leer(self.match, 10), many=True, context=contexto
+                ).data
+            )
+
+    def test_parametros_invalidos(self):
+        response = self.client.get(self.url, {'before_id': 1, 'after_id': 2})
+        self.assertEqual(response.status_code, 400)
+
+        otro = crear_usuario('carlos', genero='hombre')
+        self.client.force_authenticate(otro)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+class BusquedaMensajesTests(TestCase):
+
+    def setUp(self):
+        self.ana = crear_usuario('ana')
+        self.beto = crear_usuario('beto', genero='hombre')
+        self.carlos = crear_usuario('carlos', genero='hombre')
+        self.match = Match.objects.crear_entre(self.ana.id, self.beto.id)
+        otro = Match.objects.crear_entre(self.beto.id, self.carlos.id)
+        for contenido in ['Vamos por un café', 'El cafe de la biblioteca', 'Nos vemos']:
+            Mensaje.objects.create(match=self.match, remitente=self.beto, contenido=contenido)
+        # De otra conversación: ana no lo debe ver
+        Mensaje.objects.create(match=otro, remitente=self.beto, contenido='café <b>gratis</b>')
+        self.client = APIClient()
+        self.client.force_authenticate(self.ana)
+
+    def test_busca_paginado_y_resaltado(self):
+        response = self.client.get('/api/chat/buscar/', {'q': 'cafe', 'limit': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 1)
+        primero = response.data['results'][0]
+
+        siguiente = self.client.get(response.data['next'])
+        self.assertIsNone(siguiente.data['next'])
+        contenidos = {primero['contenido'], siguiente.data['results'][0]['contenido']}
+        self.assertEqual(contenidos, {'Vamos por un café', 'El cafe de la biblioteca'})
+        self.assertIn('<mark>', primero['resaltado'])
+
+        # Prefijos, en una sola conversación; el HTML del mensaje se escapa
+        response = self.client.get(f'/api/chat/{self.match.id}/buscar/', {'q': 'bibli'})
+        self.assertEqual(
+            response.data['results'][0]['resaltado'], 'El cafe de la <mark>biblioteca</mark>'
+        )
+        self.client.force_authenticate(self.carlos)
+        response = self.client.get('/api/chat/buscar/', {'q': 'gratis'})
+        self.assertEqual(
+            response.data['results'][0]['resaltado'], 'café &lt;b&gt;<mark>gratis</mark>&lt;/b&gt;'
+        )
+
+    def test_indice_sigue_cambios_y_errores(self):
+        mensaje = Mensaje.objects.get(contenido='Nos vemos')
+        mensaje.contenido = 'Nos vemos en la biblioteca'
+        mensaje.save()
+        Mensaje.objects.filter(contenido__startswith='El cafe').delete()
+        response = self.client.get('/api/chat/buscar/', {'q': 'biblioteca'})
+        self.assertEqual([m['id'] for m in response.data['results']], [mensaje.id])
+
+        self.assertEqual(self.client.get('/api/chat/buscar/', {'q': '"*'}).status_code, 400)
+        otro = Match.objects.exclude(pk=self.match.pk).get()
+        self.assertEqual(
+            self.client.get(f'/api/chat/{otro.id}/buscar/', {'q': 'cafe'}).status_code, 404
+        )
+
+
+class ArchivoConversacionTests(TestCase):
+
+    def setUp(self):
+        self.ana = crear_usuario('ana')
+        self.beto = crear_usuario('beto', genero='hombre')
+        self.match = Match.objects.crear_entre(self.ana.id, self.beto.id)
+        self.ids = [
+            Mensaje.objects.create(
+                match=self.match, remitente=(self.ana, self.beto)[i % 2], contenido=str(i)
+            ).id
+            for i in range(12)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.ana)
+        self.url = f'/api/chat/{self.match.id}/mensajes/'
+
+    def archivar(self, purgar=True):
+        if purgar:
+            call_command('purgar_cambios', dias=0, stdout=StringIO())
+        call_command(
+            'archivar_conversaciones', dias=0, ventana=3, segmento=4, stdout=StringIO()
+        )
+        self.match.refresh_from_db()
+
+    @override_settings(SINCRONIZACION_RETRASO=0)
+    def test_no_archiva_lo_que_falta_sincronizar(self):
+        Mensaje.marcar_leidos(self.match, self.ana)
+        Mensaje.marcar_leidos(self.match, self.beto)
+
+        # Con los cambios de los mensajes todavía sin purgar no se archiva nada
+        self.archivar(purgar=False)
+        self.assertEqual(Mensaje.objects.count(), 12)
+        response = self.client.get('/api/sync/', {'since': 0})
+        self.assertEqual([m['id'] for m in response.data['mensajes']], self.ids)
+
+        # Purgados los cambios de los primeros seis, se archiva hasta ahí
+        Cambio.objects.filter(tipo=Cambio.MENSAJE, objeto_id__lte=self.ids[5]).update(
+            fecha=timezone.now() - timedelta(days=2)
+        )
+        call_command('purgar_cambios', dias=1, stdout=StringIO())
+        self.assertEqual(ArchivoConversacion.tope_sincronizacion(), self.ids[6] - 1)
+        self.archivar(purgar=False)
+        self.assertEqual(self.match.archivado_hasta_id, self.ids[5])
+        response = self.client.get('/api/sync/', {'since': Cambio.horizonte()})
+        self.assertEqual([m['id'] for m in response.data['mensajes']], self.ids[6:])
+
+    def test_respeta_no_leidos(self):
+        # beto no ha leído nada de ana: no se archiva nada de un match activo
+        Mensaje.marcar_leidos(self.match, self.ana)
+        self.archivar()
+        self.assertEqual(Mensaje.objects.count(), 12)
+
+        Mensaje.marcar_leidos(self.match, self.beto, hasta_id=self.ids[5])
+        self.archivar()
+        self.assertEqual(self.match.archivado_hasta_id, self.ids[5])
+        self.assertEqual(Mensaje.objects.count(), 6)
+
+    def test_historial_sigue_en_el_archivo(self):
+        Mensaje.marcar_leidos(self.match, self.ana)
+        Mensaje.marcar_leidos(self.match, self.beto)
+        self.archivar()
+        self.assertEqual(Mensaje.objects.count(), 3)
+        self.assertEqual(
+            list(ArchivoConversacion.objects.values_list('cantidad', flat=True)), [4, 4, 1]
+        )
+
+        # Hacia atrás en páginas de 5: 3 de la tabla + 2 del archivo, y 5 + 2 del archivo
+        vistos = []
+        response = self.client.get(self.url, {'limit': 5})
+        while True:
+            mensajes = response.data['mensajes']
+            vistos = [m['id'] for m in mensajes] + vistos
+            if not response.data['has_more']:
+                break
+            response = self.client.get(self.url, {'limit': 5, 'before_id': mensajes[0]['id']})
+        self.assertEqual(vistos, self.ids)
+        self.assertEqual(mensajes[1]['remitente_nombre'], self.beto.nombre_completo)
+        self.assertTrue(mensajes[1]['leido'])
+
+        # Hacia adelante desde el archivo hasta la tabla
+        response = self.client.get(self.url, {'limit': 7, 'after_id': self.ids[2]})
+        self.assertEqual([m['id'] for m in response.data['mensajes']], self.ids[3:10])
+        self.assertTrue(response.data['has_more'])
+
+        # Un match desactivado se archiva completo
+        Match.objects.filter(pk=self.match.pk).update(activo=False)
+        self.archivar()
+        self.assertFalse(Mensaje.objects.exists())
+        self.assertEqual(self.match.archivado_hasta_id, self.ids[-1])
+
+
+class WebSocketChatTests(TransactionTestCase):
+    """
+    Los eventos se publican al confirmar la transacción, por eso se usa
+    TransactionTestCase
+    """
+
+    def setUp(self):
+        self.ana = crear_usuario('ana')
+        self.beto = crear_usuario('beto', genero='hombre')
+        self.match = Match.objects.crear_entre(self.ana.id, self.beto.id)
+
+    def conectar(self, ruta, usuario=None):
+        from cuceimatch.asgi import application
+
+        token = f'token={AccessToken.for_user(usuario)}' if usuario else ''
+        return ApplicationCommunicator(application, {
+            'type': 'websocket',
+            'path': ruta,
+            'query_string': token.encode(),
+        })
+
+    async def recibir_json(self, socket):
+        salida = await socket.receive_output(timeout=5)
+        self.assertEqual(salida['type'], 'websocket.send')
+        return json.loads(salida['text'])
+
+    async def test_mensajes_y_leidos(self):
+        ruta = f'/ws/chat/{self.match.id}/'
+        socket_ana = self.conectar(ruta, self.ana)
+        await socket_ana.send_input({'type': 'websocket.connect'})
+        self.assertEqual((await socket_ana.receive_output(timeout=5))['type'], 'websocket.accept')
+
+        eventos_beto = self.conectar('/ws/eventos/', self.beto)
+        await eventos_beto.send_input({'type': 'websocket.connect'})
+        self.assertEqual((await eventos_beto.receive_output(timeout=5))['type'], 'websocket.accept')
+
+        # Mensaje por el socket: eco para ana y aviso en el canal de beto
+        await socket_ana.send_input({
+            'type': 'websocket.receive',
+            'text': json.dumps({'tipo': 'mensaje', 'contenido': 'Hola'}),
+        })
+        evento = await self.recibir_json(socket_ana)
+        self.assertEqual(evento['tipo'], 'mensaje')
+        self.assertTrue(evento['mensaje']['es_propio'])
+        evento = await self.recibir_json(eventos_beto)
+        self.assertEqual(evento['mensaje']['contenido'], 'Hola')
+        self.assertFalse(evento['mensaje']['es_propio'])
+
+        # Mensaje por REST y confirmación de lectura
+        client = APIClient()
+        client.force_authenticate(self.beto)
+        await sync_to_async(client.post)(
+            f'/api/chat/{self.match.id}/enviar/', {'contenido': 'Qué tal'}
+        )
+        evento = await self.recibir_json(socket_ana)
+        self.assertEqual(evento['mensaje']['contenido'], 'Qué tal')
+        self.assertFalse(evento['mensaje']['es_propio'])
+
+        await sync_to_async(client.post)(f'/api/chat/{self.match.id}/marcar-leidos/')
+        evento = await self.recibir_json(socket_ana)
+        self.assertEqual(evento['tipo'], 'leidos')
+        self.assertEqual(evento['lector_id'], self.beto.id)
+
+        await socket_ana.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await eventos_beto.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await socket_ana.wait(timeout=5)
+        await eventos_beto.wait(timeout=5)
+
+    async def test_id_cliente_reutilizado(self):
+        socket = self.conectar(f'/ws/chat/{self.match.id}/', self.ana)
+        await socket.send_input({'type': 'websocket.connect'})
+        self.assertEqual((await socket.receive_output(timeout=5))['type'], 'websocket.accept')
+
+        for contenido in ('Hola', 'Hola', 'Adiós'):
+            await socket.send_input({
+                'type': 'websocket.receive',
+                'text': json.dumps({'tipo': 'mensaje', 'contenido': contenido, 'id_cliente': 'm-1'}),
+            })
+        # Solo el primero se guarda y se reparte; el reintento igual no
+        # responde (el evento y el error llegan por tareas distintas)
+        eventos = {}
+        for _ in range(2):
+            evento = await self.recibir_json(socket)
+            eventos[evento['tipo']] = evento
+        self.assertEqual(eventos['mensaje']['mensaje']['contenido'], 'Hola')
+        self.assertEqual(eventos['error']['error']['codigo'], 'clave_reutilizada')
+        self.assertEqual(await sync_to_async(Mensaje.objects.count)(), 1)
+
+        await socket.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await socket.wait(timeout=5)
+
+    async def test_rechaza_sin_token_o_ajeno(self):
+        socket = self.conectar('/ws/eventos/')
+        await socket.send_input({'type': 'websocket.connect'})
+        self.assertEqual((await socket.receive_output(timeout=5))['code'], 4401)
+
+        carlos = await sync_to_async(crear_usuario)('carlos', genero='hombre')
+        socket = self.conectar(f'/ws/chat/{self.match.id}/', carlos)
+        await socket.send_input({'type': 'websocket.connect'})
+        self.assertEqual((await socket.receive_output(timeout=5))['code'], 4404)
@@ -0,0 +1,147 @@
+"""
+Publicación de eventos en tiempo real (mensajes nuevos, confirmaciones de
+lectura y matches nuevos) hacia los WebSockets (apps.chat.websocket).
+
+Los eventos se publican en canales:
+- `match:<id>`: la conversación abierta de un match
+- `usuario:<id>`: todo lo que le interesa a un usuario (matches nuevos y
+  mensajes de cualquier conversación)
+
+El backend de pub/sub se elige con settings.CHAT_PUBSUB_BACKEND. MemoriaPubSub
+reparte los eventos dentro del mismo proceso (un solo nodo y pruebas); para
+varios nodos basta otra clase con la misma interfaz (`publicar` y
+`suscribir`) sobre un broker compartido.
+
+Los eventos se publican después del commit de la transacción que los
+produce, así un cliente nunca recibe algo que después se revierte.
+"""
+import asyncio
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+def canal_match(match_id):
+    return f'match:{match_id}'
+
+
+def canal_usuario(usuario_id):
+    return f'usuario:{usuario_id}'
+
+
+class Suscripcion:
+    """
+    Cola de eventos de un canal para un consumidor asíncrono. Se itera con
+    `async for` y se debe cerrar al terminar
+    """
+
+    def __init__(self, pubsub, canales):
+        self.pubsub = pubsub
+        self.canales = canales
+        self.loop = asyncio.get_running_loop()
+        self.cola = asyncio.Queue()
+
+    def entregar(self, evento):
+        """Agrega un evento a la cola (se puede llamar desde cualquier hilo)"""
+        self.loop.call_soon_threadsafe(self.cola.put_nowait, evento)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.cola.get()
+
+    def cerrar(self):
+        self.pubsub.cancelar(self)
+
+
+class MemoriaPubSub:
+    """
+    Pub/sub en memoria del proceso. `publicar` es síncrono y seguro entre
+    hilos (las vistas corren en el pool de hilos del servidor ASGI)
+    """
+
+    def __init__(self):
+        self._suscripciones = {}
+        self._lock = threading.Lock()
+
+    def suscribir(self, *canales):
+        """Crea una suscripción a los canales (desde el event loop)"""
+        suscripcion = Suscripcion(self, canales)
+        with self._lock:
+            for canal in canales:
+                self._suscripciones.setdefault(canal, set()).add(suscripcion)
+        return suscripcion
+
+    def cancelar(self, suscripcion):
+        with self._lock:
+            for canal in suscripcion.canales:
+                suscriptores = self._suscripciones.get(canal)
+                if suscriptores is not None:
+                    suscriptores.discard(suscripcion)
+                    if not suscriptores:
+                        del self._suscripciones[canal]
+
+    def publicar(self, canal, evento):
+        with self._lock:
+            suscriptores = list(self._suscripciones.get(canal, ()))
+        for suscripcion in suscriptores:
+            suscripcion.entregar(evento)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def obtener_pubsub():
+    """Instancia única del backend configurado en CHAT_PUBSUB_BACKEND"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = import_string(settings.CHAT_PUBSUB_BACKEND)()
+    return _backend
+
+
+def publicar(canal, evento):
+    """Publica el evento cuando se confirme la transacción actual"""
+    transaction.on_commit(lambda: obtener_pubsub().publicar(canal, evento))
+
+
+def notificar_mensaje(mensaje):
+    """
+    Mensaje nuevo: a la conversación y al canal del destinatario. `es_propio`
+    depende de quién lo recibe, así que lo agrega cada WebSocket
+    """
+    from .serializers import MensajeSerializer
+
+    datos = dict(MensajeSerializer(mensaje).data)
+    datos.pop('es_propio', None)
+    evento = {'tipo': 'mensaje', 'match_id': mensaje.match_id, 'mensaje': datos}
+    publicar(canal_match(mensaje.match_id), evento)
+    publicar(canal_usuario(mensaje.match.otro_usuario_id(mensaje.remitente_id)), evento)
+
+
+def notificar_leidos(match, lector_id, hasta_id):
+    """
+    Confirmación de lectura para el otro lado de la conversación: el lector
+    leyó todos los mensajes hasta `hasta_id`
+    """
+    publicar(canal_match(match.id), {
+        'tipo': 'leidos',
+        'match_id': match.id,
+        'lector_id': lector_id,
+        'hasta_id': hasta_id,
+    })
+
+
+def notificar_match(match):
+    """Match nuevo: a cada uno de los dos usuarios"""
+    for usuario_id in (match.usuario1_id, match.usuario2_id):
+        publicar(canal_usuario(usuario_id), {
+            'tipo': 'match',
+            'match_id': match.id,
+            'otro_usuario_id': match.otro_usuario_id(usuario_id),
+        })
@@ -7,6 +7,13 @@ urlpatterns = [
     # Obtener conversaciones
     path('conversaciones/', views.ConversacionesView.as_view(), name='conversaciones'),
     
+    # Badge de no leídos
+    path('no-leidos/', views.NoLeidosView.as_view(), name='no_leidos'),
+    
+    # Búsqueda en todas las conversaciones o en una
+    path('buscar/', views.BuscarMensajesView.as_view(), name='buscar'),
+    path('<int:match_id>/buscar/', views.BuscarMensajesView.as_view(), name='buscar_en_match'),
+    
     # Mensajes de un match específico
     path('<int:match_id>/mensajes/', views.MensajesView.as_view(), name='mensajes'),
     
@@ -1,120 +1,197 @@
 from rest_framework import status, generics
 from rest_framework.views import APIView
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Q
 
-from .models import Mensaje
-from .serializers import MensajeSerializer, EnviarMensajeSerializer
+from .models import Mensaje, ContadorNoLeidos, ArchivoConversacion
+from .serializers import (
+    MensajeSerializer, MensajeLigeroSerializer, EnviarMensajeSerializer, ResultadoBusquedaSerializer
+)
+from .busqueda import BusquedaMensajes, BusquedaPagination, terminos
 from apps.matches.models import Match
-from apps.matches.serializers import MatchSerializer
+from apps.matches.serializers import MatchLigeroSerializer
+from apps.matches.paginacion import KeysetPagination
+from cuceimatch.condicional import VersionETagMixin
+from cuceimatch.idempotencia import IdempotenciaMixin
 
 
-class ConversacionesView(generics.ListAPIView):
+class ConversacionesView(VersionETagMixin, generics.ListAPIView):
     """
     GET /api/chat/conversaciones/
-    Lista todas las conversaciones (matches con mensajes)
+    Lista todas las conversaciones (matches con mensajes), paginadas por cursor
+    Query params:
+    - cursor: cursor opaco de la siguiente página (campo `next`)
+    - limit: conversaciones por página (default: 20, máximo: 100)
+    Responde 304 si If-None-Match coincide (no hubo mensajes ni cambios)
     """
     permission_classes = [IsAuthenticated]
-    serializer_class = MatchSerializer
+    serializer_class = MatchLigeroSerializer
+    pagination_class = KeysetPagination
+    
+    def get_version(self, request):
+        return Match.objects.version_listas(request.user.id)
     
     def get_queryset(self):
         usuario = self.request.user
-        return Match.objects.filter(
-            Q(usuario1=usuario) | Q(usuario2=usuario),
-            activo=True
-        ).exclude(
-            mensajes__isnull=True
-        ).order_by('-ultimo_mensaje')
+        return MatchLigeroSerializer.filas(Match.objects.del_usuario(usuario).filter(
+            activo=True,
+            id_ultimo_mensaje__isnull=False
+        ).order_by('-ultimo_mensaje', '-id'))
+    
+    def get_ramas(self, queryset):
+        return queryset.por_participante(self.request.user)
 
 
 class MensajesView(generics.ListAPIView):
     """
     GET /api/chat/<match_id>/mensajes/
-    Obtiene todos los mensajes de una conversación
+    Obtiene los mensajes de una conversación, paginados por id (keyset)
     Query params:
-    - limit: número de mensajes a retornar (default: 50)
-    - before_id: ID del mensaje para paginación
+    - limit: número de mensajes a retornar (default: 50, máximo: 100)
+    - before_id: mensajes anteriores a este id (historial hacia atrás)
+    - after_id: mensajes posteriores a este id (solo los nuevos)
+    Sin before_id ni after_id retorna los más recientes. Los mensajes vienen
+    del más antiguo al más nuevo y `has_more` indica si hay más en la
+    dirección pedida. Al pasar de los mensajes de la tabla se sigue con los
+    archivados (ArchivoConversacion) sin que el cliente lo note.
     """
     permission_classes = [IsAuthenticated]
-    serializer_class = MensajeSerializer
+    serializer_class = MensajeLigeroSerializer
+    limite_default = 50
+    limite_maximo = 100
     
     def get_queryset(self):
-        match_id = self.kwargs.get('match_id')
-        usuario = self.request.user
-        
+        return MensajeLigeroSerializer.filas(Mensaje.objects.filter(
+            match_id=self.kwargs['match_id']
+        ))
+    
+    def _parametro_id(self, nombre):
+        valor = self.request.query_params.get(nombre)
+        if valor is None:
+            return None
+        try:
+            return int(valor)
+        except ValueError:
+            raise ValidationError({nombre: 'Debe ser un número entero'})
+    
+    def list(self, request, *args, **kwargs):
         # Verificar que el match exista y el usuario sea parte de él
         try:
-            match = Match.objects.get(
-                Q(usuario1=usuario) | Q(usuario2=usuario),
-                pk=match_id,
-                activo=True
+            match = Match.objects.obtener_de_usuario(
+                request.user, self.kwargs['match_id'], activo=True
             )
         except Match.DoesNotExist:
-            return Mensaje.objects.none()
-        
-        mensajes = Mensaje.objects.filter(match=match)
+            return Response(
+                {'error': 'Match no encontrado'},
+                status=status.HTTP_404_NOT_FOUND
+            )
         
-        # Paginación simple con before_id
-        before_id = self.request.query_params.get('before_id')
-        if before_id:
-            mensajes = mensajes.filter(id__lt=before_id)
+        before_id = self._parametro_id('before_id')
+        after_id = self._parametro_id('after_id')
+        if before_id is not None and after_id is not None:
+            raise ValidationError('Usa before_id o after_id, no ambos')
         
-        # Límite de mensajes
-        limit = int(self.request.query_params.get('limit', 50))
+        try:
+            limit = int(request.query_params.get('limit', self.limite_default))
+        except ValueError:
+            raise ValidationError({'limit': 'Debe ser un número entero'})
+        limit = max(1, min(limit, self.limite_maximo))
         
-        return mensajes.order_by('-fecha')[:limit]
-    
-    def list(self, request, *args, **kwargs):
+        # Se pide uno de más para saber si hay más mensajes sin un COUNT. Los
+        # mensajes archivados son todos anteriores a los de la tabla, así que
+        # el archivo se lee antes (hacia adelante) o después (hacia atrás)
         queryset = self.get_queryset()
+        if after_id is not None:
+            mensajes = []
+            if after_id < match.archivado_hasta_id:
+                mensajes = ArchivoConversacion.leer_filas(match, limit + 1, despues_de=after_id)
+            if len(mensajes) <= limit:
+                mensajes += queryset.filter(id__gt=after_id).order_by('id')[:limit + 1 - len(mensajes)]
+            has_more = len(mensajes) > limit
+            mensajes = mensajes[:limit]
+        else:
+            if before_id is not None:
+                queryset = queryset.filter(id__lt=before_id)
+            mensajes = list(queryset.order_by('-id')[:limit + 1])
+            if len(mensajes) <= limit and match.archivado_hasta_id:
+                mensajes += ArchivoConversacion.leer_filas(
+                    match, limit + 1 - len(mensajes),
+                    antes_de=mensajes[-1]['id'] if mensajes else before_id
+                )
+            has_more = len(mensajes) > limit
+            # Invertir orden para mostrar del más antiguo al más nuevo
+            mensajes = mensajes[:limit][::-1]
         
-        # Marcar mensajes del otro usuario como leídos
-        match_id = self.kwargs.get('match_id')
-        try:
-            match = Match.objects.get(
-                Q(usuario1=request.user) | Q(usuario2=request.user),
-                pk=match_id
-            )
-            
-            # Obtener el otro usuario
-            otro_usuario = match.obtener_otro_usuario(request.user)
-            
-            # Marcar mensajes no leídos del otro usuario como leídos
-            Mensaje.objects.filter(
-                match=match,
-                remitente=otro_usuario,
-                leido=False
-            ).update(leido=True)
-            
-        except Match.DoesNotExist:
-            pass
-        
-        serializer = self.get_serializer(queryset, many=True)
+        # Marcar mensajes no leídos del otro usuario como leídos. Con el
+        # coalescedor la página puede traer mensajes que el resumen del match
+        # todavía no incluye: esos se marcan por id
+        visto = max(
+            (m['id'] for m in mensajes if m['remitente_id'] != request.user.id), default=0
+        )
+        if visto > (match.id_ultimo_mensaje or 0):
+            Mensaje.marcar_leidos(match, request.user, hasta_id=visto)
+        elif match.no_leidos_de(request.user.id):
+            Mensaje.marcar_leidos(match, request.user)
         
-        # Invertir orden para mostrar del más antiguo al más nuevo
+        serializer = self.get_serializer(
+            mensajes, many=True,
+            context={**self.get_serializer_context(), 'match': match}
+        )
         return Response({
-            'mensajes': list(reversed(serializer.data)),
-            'total': queryset.count()
+            'mensajes': serializer.data,
+            'has_more': has_more
         })
 
 
-class EnviarMensajeView(APIView):
+class BuscarMensajesView(generics.ListAPIView):
+    """
+    GET /api/chat/buscar/?q=texto
+    GET /api/chat/<match_id>/buscar/?q=texto
+    Busca en los mensajes de las conversaciones activas del usuario (o de
+    una sola), ordenados por relevancia y paginados por cursor. Cada
+    resultado trae `resaltado`: el contenido como HTML escapado con las
+    coincidencias entre <mark> y </mark>
+    Query params:
+    - q: palabras a buscar (cada una como prefijo)
+    - cursor: cursor opaco de la siguiente página (campo `next`)
+    - limit: resultados por página (default: 20, máximo: 100)
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = ResultadoBusquedaSerializer
+    pagination_class = BusquedaPagination
+    
+    def get_queryset(self):
+        texto = self.request.query_params.get('q', '')
+        if not terminos(texto):
+            raise ValidationError({'q': 'Escribe al menos una palabra'})
+        
+        match_id = self.kwargs.get('match_id')
+        if match_id is not None:
+            try:
+                Match.objects.obtener_de_usuario(self.request.user, match_id, activo=True)
+            except Match.DoesNotExist:
+                raise NotFound('Match no encontrado')
+        return BusquedaMensajes(self.request.user, texto, match_id)
+
+
+class EnviarMensajeView(IdempotenciaMixin, APIView):
     """
     POST /api/chat/<match_id>/enviar/
     Envía un nuevo mensaje
     Body: {
         "contenido": "Texto del mensaje"
     }
+    Header opcional: Idempotency-Key (los reintentos con la misma clave
+    reciben la respuesta original y no duplican el mensaje)
     """
     permission_classes = [IsAuthenticated]
     
     def post(self, request, match_id):
         # Verificar que el match exista y el usuario sea parte de él
         try:
-            match = Match.objects.get(
-                Q(usuario1=request.user) | Q(usuario2=request.user),
-                pk=match_id,
-                activo=True
+            match = Match.objects.obtener_de_usuario(
+                request.user, match_id, activo=True
             )
         except Match.DoesNotExist:
             return Response(
@@ -125,7 +202,11 @@ class EnviarMensajeView(APIView):
         # Validar y crear mensaje
         serializer = EnviarMensajeSerializer(
             data=request.data,
-            context={'request': request, 'match': match}
+            context={
+                'request': request,
+                'match': match,
+                'id_cliente': self.clave_idempotencia
+            }
         )
         serializer.is_valid(raise_exception=True)
         mensaje = serializer.save()
@@ -140,16 +221,18 @@ class EnviarMensajeView(APIView):
 class MarcarLeidosView(APIView):
     """
     POST /api/chat/<match_id>/marcar-leidos/
-    Marca todos los mensajes del otro usuario como leídos
+    Marca los mensajes del otro usuario como leídos (mueve la marca de agua
+    de lectura del match)
+    Body (opcional): {
+        "hasta_id": id del último mensaje leído (default: todos)
+    }
     """
     permission_classes = [IsAuthenticated]
     
     def post(self, request, match_id):
         try:
-            match = Match.objects.get(
-                Q(usuario1=request.user) | Q(usuario2=request.user),
-                pk=match_id,
-                activo=True
+            match = Match.objects.obtener_de_usuario(
+                request.user, match_id, activo=True
             )
         except Match.DoesNotExist:
             return Response(
@@ -157,16 +240,31 @@ class MarcarLeidosView(APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        # Obtener el otro usuario
-        otro_usuario = match.obtener_otro_usuario(request.user)
+        hasta_id = request.data.get('hasta_id')
+        if hasta_id is not None:
+            try:
+                hasta_id = int(hasta_id)
+            except (TypeError, ValueError):
+                raise ValidationError({'hasta_id': 'Debe ser un número entero'})
         
         # Marcar mensajes como leídos
-        mensajes_actualizados = Mensaje.objects.filter(
-            match=match,
-            remitente=otro_usuario,
-            leido=False
-        ).update(leido=True)
+        mensajes_actualizados = Mensaje.marcar_leidos(match, request.user, hasta_id)
         
         return Response({
             'message': f'{mensajes_actualizados} mensajes marcados como leídos'
-        }, status=status.HTTP_200_OK)
\ No newline at end of file
+        }, status=status.HTTP_200_OK)
+
+
+class NoLeidosView(APIView):
+    """
+    GET /api/chat/no-leidos/
+    Total de mensajes no leídos y de conversaciones con no leídos (badge)
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        contador = ContadorNoLeidos.obtener(request.user.id)
+        return Response({
+            'mensajes': contador.mensajes,
+            'conversaciones': contador.conversaciones
+        })
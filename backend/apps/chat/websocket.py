@@ -0,0 +1,192 @@
+"""
+WebSockets del chat, servidos directamente sobre ASGI (cuceimatch.asgi).
+
+Rutas (el token de acceso JWT va en la query string: ?token=<access>):
+- /ws/chat/<match_id>/: eventos de la conversación (mensajes nuevos y
+  confirmaciones de lectura). Acepta frames JSON:
+    {"tipo": "mensaje", "contenido": "..."}  envía un mensaje (acepta
+                                             "id_cliente" para no duplicar
+                                             reintentos; reusarlo con otro
+                                             contenido da el error
+                                             "clave_reutilizada", como el
+                                             422 de REST)
+    {"tipo": "leidos", "hasta_id": 123}      marca como leídos los recibidos
+                                             (hasta_id es opcional)
+- /ws/eventos/: eventos del usuario (matches nuevos y mensajes de cualquier
+  conversación). No acepta frames.
+
+Los eventos llegan por el pub/sub de apps.chat.tiempo_real, así que los
+mensajes enviados por REST (EnviarMensajeView) y por el socket se reparten
+igual.
+"""
+import asyncio
+import json
+import re
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+from apps.matches.models import Match
+from cuceimatch.idempotencia import CLAVE_VALIDA, ClaveReutilizada, verificar_original
+from .models import Mensaje
+from .serializers import EnviarMensajeSerializer
+from .tiempo_real import obtener_pubsub, canal_match, canal_usuario
+
+# Códigos de cierre (rango 4000-4999 reservado para la aplicación)
+CIERRE_NO_AUTENTICADO = 4401
+CIERRE_NO_ENCONTRADO = 4404
+
+RUTA_CHAT = re.compile(r'^/ws/chat/(?P<match_id>\d+)/$')
+RUTA_EVENTOS = re.compile(r'^/ws/eventos/$')
+
+
+def _con_conexion(funcion):
+    """
+    Corre código síncrono del ORM desde el socket. Las conexiones viven mucho
+    más que una petición HTTP, así que se cierran las conexiones vencidas
+    antes y después, como al terminar cada request
+    """
+    def envoltura(*args, **kwargs):
+        close_old_connections()
+        try:
+            return funcion(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(envoltura)
+
+
+@_con_conexion
+def autenticar(scope):
+    """Usuario del token en la query string o None"""
+    token = parse_qs(scope.get('query_string', b'').decode()).get('token')
+    if not token:
+        return None
+    autenticacion = JWTAuthentication()
+    try:
+        usuario = autenticacion.get_user(autenticacion.get_validated_token(token[0]))
+    except (InvalidToken, AuthenticationFailed):
+        return None
+    return usuario if usuario.is_active else None
+
+
+@_con_conexion
+def obtener_match(usuario, match_id):
+    try:
+        return Match.objects.obtener_de_usuario(usuario, match_id, activo=True)
+    except Match.DoesNotExist:
+        return None
+
+
+@_con_conexion
+def enviar_mensaje(usuario, match_id, datos):
+    """Crea el mensaje; retorna None o los errores de validación"""
+    try:
+        match = Match.objects.obtener_de_usuario(usuario, match_id, activo=True)
+    except Match.DoesNotExist:
+        return {'error': 'Match no encontrado'}
+    serializer = EnviarMensajeSerializer(data=datos)
+    if not serializer.is_valid():
+        return serializer.errors
+    id_cliente = datos.get('id_cliente')
+    if id_cliente is not None and not (isinstance(id_cliente, str) and CLAVE_VALIDA.match(id_cliente)):
+        return {'id_cliente': 'Debe tener de 1 a 64 letras, números o - _ . :'}
+    contenido = serializer.validated_data['contenido']
+    mensaje = Mensaje.enviar(match, usuario, contenido, id_cliente)
+    try:
+        verificar_original(mensaje, match_id=match.id, contenido=contenido)
+    except ClaveReutilizada as exc:
+        return {'detail': exc.detail, 'codigo': exc.default_code}
+    return None
+
+
+@_con_conexion
+def marcar_leidos(usuario, match_id, hasta_id=None):
+    try:
+        match = Match.objects.obtener_de_usuario(usuario, match_id, activo=True)
+    except Match.DoesNotExist:
+        return
+    Mensaje.marcar_leidos(match, usuario, hasta_id)
+
+
+async def _enviar_json(send, datos):
+    await send({
+        'type': 'websocket.send',
+        'text': json.dumps(datos, cls=DjangoJSONEncoder),
+    })
+
+
+async def aplicacion_websocket(scope, receive, send):
+    """Aplicación ASGI para los scopes de tipo websocket"""
+    mensaje = await receive()
+    if mensaje['type'] != 'websocket.connect':
+        return
+
+    ruta_chat = RUTA_CHAT.match(scope['path'])
+    if not ruta_chat and not RUTA_EVENTOS.match(scope['path']):
+        await send({'type': 'websocket.close', 'code': CIERRE_NO_ENCONTRADO})
+        return
+
+    usuario = await autenticar(scope)
+    if usuario is None:
+        await send({'type': 'websocket.close', 'code': CIERRE_NO_AUTENTICADO})
+        return
+
+    match_id = None
+    if ruta_chat:
+        match_id = int(ruta_chat['match_id'])
+        if await obtener_match(usuario, match_id) is None:
+            await send({'type': 'websocket.close', 'code': CIERRE_NO_ENCONTRADO})
+            return
+        canal = canal_match(match_id)
+    else:
+        canal = canal_usuario(usuario.id)
+
+    # Suscribirse antes de aceptar para no perder eventos
+    suscripcion = obtener_pubsub().suscribir(canal)
+    await send({'type': 'websocket.accept'})
+
+    async def emitir():
+        async for evento in suscripcion:
+            if evento['tipo'] == 'mensaje':
+                datos = dict(evento['mensaje'])
+                datos['es_propio'] = datos['remitente'] == usuario.id
+                evento = {**evento, 'mensaje': datos}
+            await _enviar_json(send, evento)
+
+    async def escuchar():
+        while True:
+            mensaje = await receive()
+            if mensaje['type'] == 'websocket.disconnect':
+                return
+            if mensaje['type'] != 'websocket.receive' or match_id is None:
+                continue
+            try:
+                frame = json.loads(mensaje.get('text') or '')
+            except ValueError:
+                await _enviar_json(send, {'tipo': 'error', 'error': 'JSON inválido'})
+                continue
+            if not isinstance(frame, dict):
+                continue
+            if frame.get('tipo') == 'mensaje':
+                errores = await enviar_mensaje(usuario, match_id, frame)
+                if errores:
+                    await _enviar_json(send, {'tipo': 'error', 'error': errores})
+            elif frame.get('tipo') == 'leidos':
+                hasta_id = frame.get('hasta_id')
+                if hasta_id is not None and not isinstance(hasta_id, int):
+                    await _enviar_json(send, {'tipo': 'error', 'error': 'hasta_id inválido'})
+                    continue
+                await marcar_leidos(usuario, match_id, hasta_id)
+
+    tareas = [asyncio.ensure_future(emitir()), asyncio.ensure_future(escuchar())]
+    try:
+        await asyncio.wait(tareas, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        suscripcion.cerrar()
+        for tarea in tareas:
+            tarea.cancel()
+        await asyncio.gather(*tareas, return_exceptions=True)
@@ -43,14 +43,21 @@ class MatchAdmin(admin.ModelAdmin):
         'usuario2__email'
     ]
     date_hierarchy = 'fecha'
-    readonly_fields = ['fecha', 'ultimo_mensaje']
+    readonly_fields = [
+        'fecha', 'ultimo_mensaje', 'id_ultimo_mensaje',
+        'preview_ultimo_mensaje', 'remitente_ultimo_mensaje',
+        'no_leidos_usuario1', 'no_leidos_usuario2',
+        'ultimo_leido_usuario1', 'ultimo_leido_usuario2',
+        'fecha_lectura_usuario1', 'fecha_lectura_usuario2',
+        'archivado_hasta_id'
+    ]
     
     def get_usuarios(self, obj):
         return f"{obj.usuario1.nombre_completo} ↔ {obj.usuario2.nombre_completo}"
     get_usuarios.short_description = 'Match'
     
     def tiene_mensajes(self, obj):
-        return obj.mensajes.exists()
+        return obj.id_ultimo_mensaje is not None
     tiene_mensajes.boolean = True
     tiene_mensajes.short_description = '¿Tienen mensajes?'
     
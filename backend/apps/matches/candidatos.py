@@ -0,0 +1,119 @@
+"""
+Generación de candidatos para el deck de swipes
+"""
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from apps.usuarios.models import Usuario
+from apps.perfiles.models import Perfil, Foto
+from . import ranking
+from .vistos import obtener_vistos
+
+# Cuántos candidatos no vistos se puntúan en cada relleno del deck
+LOTE_RANKING = 2000
+
+# Cuántas filas elegibles (vistas o no) se revisan como máximo por relleno
+LIMITE_ESCANEO = 20000
+
+
+def candidatos_elegibles(usuario):
+    """
+    Queryset con todos los usuarios que le pueden aparecer a `usuario`
+    (verificados, activos, con perfil completo y al menos una foto). No
+    excluye a los que ya vio.
+
+    Todo se filtra en la base de datos y en ambos sentidos: el candidato debe
+    ser del género y rango de edad que busca el usuario, y el usuario del
+    género y rango de edad que busca el candidato.
+    """
+    candidatos = Usuario.objects.filter(
+        verificado=True,
+        activo=True,
+        perfil_completo=True,
+        genero__in=usuario.get_generos_buscados(),
+        buscando__in=usuario.get_buscando_compatibles()
+    ).exclude(
+        id=usuario.id
+    ).filter(
+        Exists(Foto.objects.filter(usuario=OuterRef('pk')))
+    )
+
+    perfil = Perfil.objects.filter(usuario=usuario).only(
+        'edad_minima', 'edad_maxima'
+    ).first()
+    if perfil:
+        nacido_despues_de, nacido_hasta = Usuario.rango_fecha_nacimiento(
+            perfil.edad_minima, perfil.edad_maxima
+        )
+        candidatos = candidatos.filter(
+            fecha_nacimiento__gt=nacido_despues_de,
+            fecha_nacimiento__lte=nacido_hasta
+        )
+
+    edad = usuario.edad
+    if edad is not None:
+        candidatos = candidatos.filter(
+            perfil__edad_minima__lte=edad,
+            perfil__edad_maxima__gte=edad
+        )
+
+    return candidatos
+
+
+def generar_candidatos(usuario, limite, excluir=(), desde=None):
+    """
+    Retorna hasta `limite` ids de candidatos que el usuario todavía no ha
+    visto, ordenados por afinidad de intereses y actividad reciente.
+
+    Los elegibles se recorren del más al menos activo y los ya vistos se
+    filtran en memoria contra el ConjuntoVistos del usuario hasta juntar
+    LOTE_RANKING; el lote se ordena con apps.matches.ranking. Para que un
+    usuario que ya vio casi todo no recorra el pool completo en cada relleno,
+    se revisan a lo más LIMITE_ESCANEO filas y se retorna un cursor para que
+    el siguiente relleno siga desde ahí.
+
+    Args:
+        usuario: Usuario para el que se generan los candidatos
+        limite: número máximo de ids a retornar
+        excluir: ids que ya están en el deck y no deben repetirse
+        desde: cursor (ultima_actividad, id) de un relleno anterior
+
+    Returns:
+        (ids, cursor); el cursor es None si se llegó al final de los elegibles
+    """
+    vistos = obtener_vistos(usuario.id)
+    excluir = set(excluir)
+
+    filas = candidatos_elegibles(usuario)
+    if desde is not None:
+        actividad, id_ = desde
+        filas = filas.filter(
+            Q(ultima_actividad__lt=actividad) | Q(ultima_actividad=actividad, id__lt=id_)
+        )
+    filas = filas.order_by(
+        '-ultima_actividad', '-id'
+    ).values_list('id', 'perfil__intereses_mascara', 'ultima_actividad')[:LIMITE_ESCANEO]
+
+    ids, mascaras, horas_inactivo = [], [], []
+    ahora = timezone.now()
+    escaneadas = 0
+    cursor = None
+    for id_, mascara, ultima_actividad in filas.iterator(chunk_size=500):
+        escaneadas += 1
+        cursor = (ultima_actividad, id_)
+        if id_ in vistos or id_ in excluir:
+            continue
+        ids.append(id_)
+        mascaras.append(mascara or 0)
+        horas_inactivo.append((ahora - ultima_actividad).total_seconds() / 3600)
+        if len(ids) >= LOTE_RANKING:
+            break
+    if len(ids) < LOTE_RANKING and escaneadas < LIMITE_ESCANEO:
+        # Se acabaron los elegibles
+        cursor = None
+
+    mascara_usuario = Perfil.objects.filter(
+        usuario=usuario
+    ).values_list('intereses_mascara', flat=True).first() or 0
+
+    return ranking.ordenar(ids, mascara_usuario, mascaras, horas_inactivo)[:limite], cursor
@@ -0,0 +1,153 @@
+"""
+Deck de candidatos precalculado por usuario.
+
+El deck es una cola ordenada de ids guardada en la caché. CandidatosView
+solo lee la cabeza de la cola, cada swipe saca al usuario destino y, cuando
+quedan menos de DECK_MINIMO ids, un worker en segundo plano la rellena con
+nuevos candidatos.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+
+from .candidatos import generar_candidatos
+
+logger = logging.getLogger(__name__)
+
+# Un solo worker basta: el relleno es una consulta por usuario y así no se
+# abren demasiadas conexiones a la base de datos
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='deck')
+
+# Cuánto tiempo se recuerda que un usuario ya no tiene candidatos nuevos
+TTL_AGOTADO = 5 * 60
+TTL_CANDADO = 60
+
+
+def _clave(usuario_id):
+    return f'deck:{usuario_id}'
+
+
+def _clave_candado(usuario_id):
+    return f'deck:{usuario_id}:rellenando'
+
+
+def _clave_agotado(usuario_id):
+    return f'deck:{usuario_id}:agotado'
+
+
+def _clave_cursor(usuario_id):
+    return f'deck:{usuario_id}:cursor'
+
+
+def leer_deck(usuario_id):
+    """Retorna la cola completa de ids (lista vacía si no existe)"""
+    return cache.get(_clave(usuario_id)) or []
+
+
+def _guardar(usuario_id, ids):
+    cache.set(_clave(usuario_id), ids, settings.DECK_TTL)
+
+
+def rellenar_deck(usuario):
+    """
+    Agrega candidatos al final del deck hasta llegar a DECK_TAMANO.
+    Retorna el número de ids agregados.
+    """
+    if not cache.add(_clave_candado(usuario.id), True, TTL_CANDADO):
+        # Ya hay otro relleno en curso para este usuario
+        return 0
+
+    try:
+        actuales = leer_deck(usuario.id)
+        faltantes = settings.DECK_TAMANO - len(actuales)
+        if faltantes <= 0:
+            return 0
+
+        # Cada relleno revisa una ventana de los elegibles y sigue desde
+        # donde se quedó el anterior; al llegar al final vuelve a empezar. Si
+        # en toda la vuelta no hubo candidatos nuevos el deck está agotado
+        desde, vuelta_vacia = cache.get(_clave_cursor(usuario.id)) or (None, True)
+        nuevos, cursor = generar_candidatos(usuario, faltantes, excluir=actuales, desde=desde)
+        vuelta_vacia = vuelta_vacia and not nuevos
+        if cursor is not None:
+            cache.set(_clave_cursor(usuario.id), (cursor, vuelta_vacia), settings.DECK_TTL)
+        else:
+            cache.delete(_clave_cursor(usuario.id))
+            if vuelta_vacia:
+                cache.set(_clave_agotado(usuario.id), True, TTL_AGOTADO)
+        if not nuevos:
+            return 0
+
+        # Volver a leer: pudo haber swipes mientras se generaban candidatos.
+        # Un descarte entre esta lectura y el set se puede perder (ver
+        # descartar_del_deck)
+        actuales = leer_deck(usuario.id)
+        en_deck = set(actuales)
+        _guardar(usuario.id, actuales + [i for i in nuevos if i not in en_deck])
+        return len(nuevos)
+    finally:
+        cache.delete(_clave_candado(usuario.id))
+
+
+def _rellenar_en_segundo_plano(usuario):
+    try:
+        rellenar_deck(usuario)
+    except Exception:
+        logger.exception('Error rellenando el deck del usuario %s', usuario.id)
+    finally:
+        close_old_connections()
+
+
+def programar_relleno(usuario):
+    """Rellena el deck en el worker (o en línea si el modo asíncrono está apagado)"""
+    if settings.DECK_RELLENO_ASINCRONO:
+        _executor.submit(_rellenar_en_segundo_plano, usuario)
+    else:
+        rellenar_deck(usuario)
+
+
+def obtener_deck(usuario, cantidad):
+    """
+    Retorna los primeros `cantidad` ids del deck sin sacarlos de la cola.
+
+    Si el deck no existe se llena en línea (primera vez o caché expirada);
+    si quedó por debajo de DECK_MINIMO se programa un relleno en segundo plano.
+    """
+    ids = leer_deck(usuario.id)
+
+    if cache.get(_clave_agotado(usuario.id)):
+        return ids[:cantidad]
+
+    if not ids:
+        rellenar_deck(usuario)
+        ids = leer_deck(usuario.id)
+    elif len(ids) < settings.DECK_MINIMO:
+        programar_relleno(usuario)
+        if not settings.DECK_RELLENO_ASINCRONO:
+            ids = leer_deck(usuario.id)
+
+    return ids[:cantidad]
+
+
+def descartar_del_deck(usuario_id, descartados):
+    """
+    Saca de la cola los ids indicados (swipes o candidatos que ya no son válidos).
+
+    No toma el candado del relleno: un relleno concurrente puede volver a
+    escribir la cola con un id ya descartado. Es seguro porque CandidatosView
+    filtra la cabeza del deck contra los vistos y candidatos_elegibles al
+    leerla y vuelve a descartar lo que ya no vale.
+    """
+    descartados = set(descartados)
+    ids = leer_deck(usuario_id)
+    restantes = [i for i in ids if i not in descartados]
+    if len(restantes) != len(ids):
+        _guardar(usuario_id, restantes)
+
+
+def invalidar_deck(usuario_id):
+    """Borra el deck (p. ej. cuando el usuario cambia sus preferencias)"""
+    cache.delete_many([_clave(usuario_id), _clave_agotado(usuario_id), _clave_cursor(usuario_id)])
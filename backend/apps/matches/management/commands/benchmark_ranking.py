@@ -0,0 +1,62 @@
+import random
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from apps.matches import ranking
+from apps.perfiles.models import INTERESES_DISPONIBLES
+
+
+class Command(BaseCommand):
+    """
+    Compara el ranking vectorizado con NumPy contra un ciclo en Python
+    fila por fila, con datos sintéticos (no usa la base de datos).
+
+    Uso: python manage.py benchmark_ranking --candidatos 5000 --repeticiones 50
+    """
+    help = 'Benchmark del ranking de candidatos (NumPy vs ciclo en Python)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--candidatos', type=int, default=5000)
+        parser.add_argument('--repeticiones', type=int, default=50)
+
+    def handle(self, *args, **options):
+        n = options['candidatos']
+        repeticiones = options['repeticiones']
+        bits = len(INTERESES_DISPONIBLES)
+
+        rng = random.Random(0)
+
+        def mascara_aleatoria():
+            return sum(1 << i for i in rng.sample(range(bits), rng.randint(1, 6)))
+
+        mascara_usuario = mascara_aleatoria()
+        ids = list(range(n))
+        mascaras = [mascara_aleatoria() for _ in range(n)]
+        horas = [rng.uniform(0, 24 * 30) for _ in range(n)]
+
+        # Verificar que ambas implementaciones coinciden
+        esperado = ranking.puntuar_python(mascara_usuario, mascaras, horas)
+        obtenido = ranking.puntuar(mascara_usuario, mascaras, horas)
+        if not np.allclose(esperado, obtenido):
+            self.stderr.write(self.style.ERROR('Los puntajes no coinciden'))
+            return
+
+        def medir(funcion):
+            inicio = time.perf_counter()
+            for _ in range(repeticiones):
+                funcion()
+            return (time.perf_counter() - inicio) / repeticiones * 1000
+
+        def con_python():
+            puntajes = ranking.puntuar_python(mascara_usuario, mascaras, horas)
+            return [i for _, i in sorted(zip(puntajes, ids), key=lambda p: -p[0])]
+
+        ms_python = medir(con_python)
+        ms_numpy = medir(lambda: ranking.ordenar(ids, mascara_usuario, mascaras, horas))
+
+        self.stdout.write(f'Candidatos por lote: {n} ({repeticiones} repeticiones)')
+        self.stdout.write(f'  Ciclo en Python: {ms_python:8.2f} ms')
+        self.stdout.write(f'  NumPy:           {ms_numpy:8.2f} ms')
+        self.stdout.write(self.style.SUCCESS(f'  Aceleración:     {ms_python / ms_numpy:8.1f}x'))
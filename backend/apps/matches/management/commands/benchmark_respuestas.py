@@ -0,0 +1,219 @@
+import time
+import uuid
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+from django.utils.text import compress_string
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from apps.chat.models import Mensaje
+from apps.chat.serializers import MensajeSerializer, MensajeLigeroSerializer
+from apps.matches.models import Match
+from apps.matches.serializers import MatchSerializer, MatchLigeroSerializer
+from apps.perfiles.models import Perfil, Foto
+from apps.usuarios.models import Usuario
+from apps.usuarios.tarjetas import obtener_tarjetas
+from cuceimatch.middleware import brotli
+from cuceimatch.renderers import ORJSONRenderer
+
+
+class Command(BaseCommand):
+    """
+    Mide serialización, render (JSONRenderer de DRF vs orjson) y tamaño
+    comprimido de un deck de --deck tarjetas y una lista de --matches
+    matches, con las tarjetas en caché como en producción. También compara
+    los serializers de DRF con los ligeros (cuceimatch.serializacion) en una
+    página de --mensajes mensajes y en la lista de matches, consulta
+    incluida. Los datos se crean dentro de una transacción que se revierte
+    al terminar.
+
+    Uso: python manage.py benchmark_respuestas --deck 20 --matches 200 --mensajes 50 --repeticiones 100
+    """
+    help = 'Benchmark de serialización, render JSON y compresión de respuestas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--deck', type=int, default=20)
+        parser.add_argument('--matches', type=int, default=200)
+        parser.add_argument('--mensajes', type=int, default=50)
+        parser.add_argument('--repeticiones', type=int, default=100)
+
+    def handle(self, *args, **options):
+        # La petición de prueba usa el host 'testserver'
+        with override_settings(ALLOWED_HOSTS=['testserver']), transaction.atomic():
+            yo, otros = self._crear_datos(max(options['deck'], options['matches']))
+            request = Request(APIRequestFactory().get('/api/matches/'))
+            request.user = yo
+
+            ids = [u.id for u in otros]
+            deck_ids = ids[:options['deck']]
+            obtener_tarjetas(ids, request)  # Tarjetas en caché
+
+            def deck():
+                tarjetas = obtener_tarjetas(deck_ids, request)
+                candidatos = [tarjetas[i] for i in deck_ids]
+                return {'candidatos': candidatos, 'total': len(candidatos)}
+
+            matches = list(Match.objects.del_usuario(yo).order_by('-ultimo_mensaje', '-id')[:options['matches']])
+
+            def lista():
+                return {
+                    'next': None,
+                    'results': MatchSerializer(matches, many=True, context={'request': request}).data,
+                }
+
+            self._reportar(f'Deck de {len(deck_ids)} tarjetas', deck, options['repeticiones'])
+            self._reportar(f'Lista de {len(matches)} matches', lista, options['repeticiones'])
+
+            consulta = Match.objects.del_usuario(yo).order_by('-ultimo_mensaje', '-id')[:options['matches']]
+            contexto = {'request': request}
+            self._comparar(
+                f'Lista de {len(matches)} matches',
+                lambda: MatchSerializer(consulta, many=True, context=contexto).data,
+                lambda: MatchLigeroSerializer(
+                    MatchLigeroSerializer.filas(consulta), many=True, context=contexto
+                ).data,
+                len(matches), options['repeticiones']
+            )
+
+            match = matches[0]
+            self._crear_mensajes(match, options['mensajes'])
+            mensajes = Mensaje.objects.filter(match=match).order_by('-id')[:options['mensajes']]
+            contexto = {'request': request, 'match': match}
+            self._comparar(
+                f'Página de {options["mensajes"]} mensajes',
+                lambda: MensajeSerializer(
+                    mensajes.select_related('remitente'), many=True, context=contexto
+                ).data,
+                lambda: MensajeLigeroSerializer(
+                    MensajeLigeroSerializer.filas(mensajes), many=True, context=contexto
+                ).data,
+                options['mensajes'], options['repeticiones']
+            )
+
+            # Las tarjetas guardadas quedan bajo versiones de perfiles que se
+            # descartan, así que nadie las vuelve a leer
+            transaction.set_rollback(True)
+
+    def _reportar(self, titulo, generar, repeticiones):
+        datos = generar()
+        drf = JSONRenderer().render(datos)
+        rapido = ORJSONRenderer().render(datos)
+        if drf != rapido:
+            self.stderr.write(self.style.ERROR(f'{titulo}: los renderers no coinciden'))
+            return
+
+        def medir(funcion):
+            inicio = time.perf_counter()
+            for _ in range(repeticiones):
+                funcion()
+            return (time.perf_counter() - inicio) / repeticiones * 1000
+
+        ms_serializar = medir(generar)
+        ms_drf = medir(lambda: JSONRenderer().render(datos))
+        ms_orjson = medir(lambda: ORJSONRenderer().render(datos))
+
+        self.stdout.write(f'{titulo} ({repeticiones} repeticiones)')
+        self.stdout.write(f'  Serialización:        {ms_serializar:8.3f} ms')
+        self.stdout.write(f'  Render JSONRenderer:  {ms_drf:8.3f} ms')
+        self.stdout.write(f'  Render orjson:        {ms_orjson:8.3f} ms')
+        self.stdout.write(self.style.SUCCESS(f'  Aceleración render:   {ms_drf / ms_orjson:8.1f}x'))
+        self.stdout.write(f'  Tamaño JSON:          {len(drf) / 1024:8.1f} KB')
+        self.stdout.write(f'  Tamaño gzip:          {len(compress_string(drf)) / 1024:8.1f} KB')
+        if brotli is not None:
+            self.stdout.write(f'  Tamaño brotli:        {len(brotli.compress(drf, quality=5)) / 1024:8.1f} KB')
+
+    def _comparar(self, titulo, drf, ligero, objetos, repeticiones):
+        if drf() != ligero():
+            self.stderr.write(self.style.ERROR(f'{titulo}: los serializers no coinciden'))
+            return
+
+        def medir(funcion):
+            inicio = time.perf_counter()
+            for _ in range(repeticiones):
+                funcion()
+            return (time.perf_counter() - inicio) / repeticiones * 1000
+
+        ms_drf = medir(drf)
+        ms_ligero = medir(ligero)
+        self.stdout.write(f'{titulo}, consulta + serialización ({repeticiones} repeticiones)')
+        self.stdout.write(
+            f'  Serializer de DRF:    {ms_drf:8.3f} ms ({ms_drf * 1000 / objetos:7.1f} µs por objeto)'
+        )
+        self.stdout.write(
+            f'  Serializer ligero:    {ms_ligero:8.3f} ms ({ms_ligero * 1000 / objetos:7.1f} µs por objeto)'
+        )
+        self.stdout.write(self.style.SUCCESS(f'  Aceleración:          {ms_drf / ms_ligero:8.1f}x'))
+
+    def _crear_mensajes(self, match, cantidad):
+        Mensaje.objects.bulk_create([
+            Mensaje(
+                match=match,
+                remitente_id=(match.usuario1_id, match.usuario2_id)[i % 2],
+                contenido=f'Mensaje {i}: ¿vamos por unos tacos saliendo de clase?'
+            )
+            for i in range(cantidad)
+        ])
+        # La mitad leída por cada lado
+        ultimo_leido = Mensaje.objects.filter(match=match).order_by('id').values_list(
+            'id', flat=True
+        )[cantidad // 2]
+        Match.objects.filter(pk=match.pk).update(
+            ultimo_leido_usuario1=ultimo_leido, ultimo_leido_usuario2=ultimo_leido,
+            fecha_lectura_usuario1=timezone.now(), fecha_lectura_usuario2=timezone.now()
+        )
+        match.refresh_from_db()
+
+    def _crear_datos(self, cantidad):
+        def usuario(clave):
+            u = Usuario(
+                username=f'benchmark_{clave}',
+                email=f'benchmark_{clave}@benchmark.local',
+                nombre_completo=f'Benchmark {clave}',
+                codigo_udg=f'benchmark_{clave}',
+                url_credencial=f'https://benchmark.local/{clave}',
+                vigencia='DIC-2099',
+                fecha_nacimiento=date(2003, 5, 17),
+                genero='mujer',
+                carrera='Ingeniería en Computación',
+                verificado=True,
+                perfil_completo=True
+            )
+            u.set_unusable_password()
+            return u
+
+        usuarios = Usuario.objects.bulk_create(
+            [usuario(uuid.uuid4().hex[:12]) for _ in range(cantidad + 1)]
+        )
+        yo, otros = usuarios[0], usuarios[1:]
+        Perfil.objects.bulk_create([
+            Perfil(
+                usuario=u,
+                bio='Me gusta el café, la música y salir a correr por Olímpica.',
+                intereses=['Música', 'Deportes', 'Cine']
+            )
+            for u in otros
+        ])
+        Foto.objects.bulk_create([
+            Foto(usuario=u, imagen=f'fotos_perfil/{u.username}_{orden}.jpg', orden=orden, es_principal=orden == 0)
+            for u in otros
+            for orden in range(3)
+        ])
+        ahora = timezone.now()
+        Match.objects.bulk_create([
+            Match(
+                usuario1_id=min(yo.id, u.id),
+                usuario2_id=max(yo.id, u.id),
+                ultimo_mensaje=ahora - timedelta(minutes=i),
+                id_ultimo_mensaje=i + 1,
+                preview_ultimo_mensaje='Nos vemos mañana en la biblioteca del CUCEI...',
+                remitente_ultimo_mensaje_id=u.id,
+                no_leidos_usuario1=i % 3,
+            )
+            for i, u in enumerate(otros)
+        ])
+        return yo, otros
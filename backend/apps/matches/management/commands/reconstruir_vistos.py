@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from apps.matches.models import Swipe
+from apps.matches.vistos import reconstruir_vistos
+
+
+class Command(BaseCommand):
+    """
+    Reconstruye los conjuntos de vistos desde la tabla de swipes.
+
+    Uso: python manage.py reconstruir_vistos [--usuario ID ...]
+    """
+    help = 'Reconstruye los conjuntos de usuarios vistos desde la tabla de swipes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--usuario',
+            type=int,
+            nargs='+',
+            help='Ids de usuario a reconstruir (por defecto todos los que tienen swipes)'
+        )
+
+    def handle(self, *args, **options):
+        usuario_ids = options['usuario'] or Swipe.objects.order_by(
+            'usuario_origen_id'
+        ).values_list('usuario_origen_id', flat=True).distinct()
+
+        total = 0
+        for usuario_id in usuario_ids:
+            conjunto = reconstruir_vistos(usuario_id)
+            total += 1
+            if options['verbosity'] > 1:
+                self.stdout.write(f'Usuario {usuario_id}: {len(conjunto)} vistos')
+
+        self.stdout.write(self.style.SUCCESS(f'{total} conjuntos reconstruidos'))
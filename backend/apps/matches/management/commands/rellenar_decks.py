@@ -0,0 +1,43 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.usuarios.models import Usuario
+from apps.matches.deck import leer_deck, rellenar_deck
+
+
+class Command(BaseCommand):
+    """
+    Rellena por adelantado los decks de candidatos de los usuarios activos.
+    Pensado para correr periódicamente (cron) además del relleno en línea.
+
+    Uso: python manage.py rellenar_decks --horas 24
+    """
+    help = 'Rellena los decks de candidatos que están por debajo del mínimo'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--horas',
+            type=int,
+            default=24,
+            help='Solo usuarios con actividad en las últimas N horas'
+        )
+
+    def handle(self, *args, **options):
+        desde = timezone.now() - timedelta(hours=options['horas'])
+        usuarios = Usuario.objects.filter(
+            verificado=True,
+            activo=True,
+            perfil_completo=True,
+            ultima_actividad__gte=desde
+        )
+
+        rellenados = 0
+        for usuario in usuarios.iterator():
+            if len(leer_deck(usuario.id)) < settings.DECK_MINIMO:
+                if rellenar_deck(usuario):
+                    rellenados += 1
+
+        self.stdout.write(self.style.SUCCESS(f'{rellenados} decks rellenados'))
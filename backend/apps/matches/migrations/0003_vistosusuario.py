@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matches', '0002_initial'),
+        ('usuarios', '0002_alter_tokentemporal_codigo_udg_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VistosUsuario',
+            fields=[
+                ('usuario', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='vistos', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('datos', models.BinaryField(default=bytes, help_text='ConjuntoVistos serializado')),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Vistos de usuario',
+                'verbose_name_plural': 'Vistos de usuarios',
+            },
+        ),
+    ]
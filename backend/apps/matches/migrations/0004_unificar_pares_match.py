@@ -0,0 +1,40 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:13
+
+from django.db import migrations
+
+
+def unificar_pares(apps, schema_editor):
+    """
+    Ordena los pares (usuario1 < usuario2) y elimina matches duplicados
+    antes de crear la restricción única. Se conserva el match más antiguo de
+    cada par y los mensajes de los duplicados se mueven a él.
+    """
+    Match = apps.get_model('matches', 'Match')
+    Mensaje = apps.get_model('chat', 'Mensaje')
+
+    conservados = {}
+    duplicados = []
+    filas = Match.objects.order_by('id').values_list('id', 'usuario1_id', 'usuario2_id')
+    for match_id, usuario1_id, usuario2_id in filas.iterator():
+        par = (min(usuario1_id, usuario2_id), max(usuario1_id, usuario2_id))
+        if par in conservados:
+            Mensaje.objects.filter(match_id=match_id).update(match_id=conservados[par])
+            duplicados.append(match_id)
+            continue
+        conservados[par] = match_id
+        if usuario1_id > usuario2_id:
+            Match.objects.filter(id=match_id).update(usuario1_id=par[0], usuario2_id=par[1])
+
+    Match.objects.filter(id__in=duplicados).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matches', '0003_vistosusuario'),
+        ('chat', '0003_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(unificar_pares, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matches', '0004_unificar_pares_match'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='match',
+            name='matches_mat_usuario_ce2225_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='match',
+            constraint=models.UniqueConstraint(fields=('usuario1', 'usuario2'), name='match_par_unico'),
+        ),
+        migrations.AddConstraint(
+            model_name='match',
+            constraint=models.CheckConstraint(condition=models.Q(('usuario1__lt', models.F('usuario2'))), name='match_par_ordenado'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matches', '0005_match_par_unico'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='match',
+            name='id_ultimo_mensaje',
+            field=models.BigIntegerField(blank=True, help_text='Id del último mensaje enviado', null=True),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='no_leidos_usuario1',
+            field=models.PositiveIntegerField(default=0, help_text='Mensajes de usuario2 que usuario1 no ha leído'),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='no_leidos_usuario2',
+            field=models.PositiveIntegerField(default=0, help_text='Mensajes de usuario1 que usuario2 no ha leído'),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='preview_ultimo_mensaje',
+            field=models.CharField(blank=True, help_text='Primeros caracteres del último mensaje', max_length=53),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='remitente_ultimo_mensaje',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
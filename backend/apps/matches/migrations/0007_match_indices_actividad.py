@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matches', '0006_match_resumen_conversacion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(fields=['usuario1', 'activo', '-ultimo_mensaje', '-id'], name='match_usuario1_actividad_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(fields=['usuario2', 'activo', '-ultimo_mensaje', '-id'], name='match_usuario2_actividad_idx'),
+        ),
+    ]
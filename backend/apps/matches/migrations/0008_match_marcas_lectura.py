@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matches', '0007_match_indices_actividad'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='match',
+            name='fecha_lectura_usuario1',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='fecha_lectura_usuario2',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='ultimo_leido_usuario1',
+            field=models.BigIntegerField(default=0, help_text='Id del último mensaje que leyó usuario1'),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='ultimo_leido_usuario2',
+            field=models.BigIntegerField(default=0, help_text='Id del último mensaje que leyó usuario2'),
+        ),
+    ]
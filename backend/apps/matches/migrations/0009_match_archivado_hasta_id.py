@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matches', '0008_match_marcas_lectura'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='match',
+            name='archivado_hasta_id',
+            field=models.BigIntegerField(default=0, help_text='Id del último mensaje archivado (0 si no hay archivo)'),
+        ),
+    ]
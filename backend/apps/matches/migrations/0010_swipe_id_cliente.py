@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matches', '0009_match_archivado_hasta_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='swipe',
+            name='id_cliente',
+            field=models.CharField(blank=True, help_text='Clave de idempotencia que generó el cliente', max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='swipe',
+            constraint=models.UniqueConstraint(condition=models.Q(('id_cliente__isnull', False)), fields=('usuario_origen', 'id_cliente'), name='swipe_origen_id_cliente_unico'),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.2.7 on 2026-10-18 16:07
+
+from array import array
+from itertools import groupby
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Copia congelada del formato de apps.matches.vistos
+LIMITE_ARREGLO = 4096
+TAMANO_BITMAP = 1 << 13
+
+
+def _contenedor(bajos):
+    """(cardinalidad, bytes) de los 16 bits bajos ordenados y sin repetir"""
+    if len(bajos) <= LIMITE_ARREGLO:
+        return len(bajos), array('H', bajos).tobytes()
+    bitmap = bytearray(TAMANO_BITMAP)
+    for bajo in bajos:
+        bitmap[bajo >> 3] |= 1 << (bajo & 7)
+    return len(bajos), bytes(bitmap)
+
+
+def construir_contenedores(apps, schema_editor):
+    """Los conjuntos se vuelven a construir desde los swipes, por contenedor"""
+    Swipe = apps.get_model('matches', 'Swipe')
+    VistosUsuario = apps.get_model('matches', 'VistosUsuario')
+    ContenedorVistos = apps.get_model('matches', 'ContenedorVistos')
+
+    VistosUsuario.objects.all().delete()
+    pares = Swipe.objects.order_by('usuario_origen_id', 'usuario_destino_id').values_list(
+        'usuario_origen_id', 'usuario_destino_id'
+    ).distinct()
+    for usuario_id, filas in groupby(pares.iterator(), key=lambda par: par[0]):
+        ids = [destino for _, destino in filas]
+        fila = VistosUsuario.objects.create(usuario_id=usuario_id, total=len(ids))
+        contenedores = []
+        for clave, grupo in groupby(ids, key=lambda id_: id_ >> 16):
+            cardinalidad, datos = _contenedor([id_ & 0xFFFF for id_ in grupo])
+            contenedores.append(ContenedorVistos(
+                vistos=fila, clave=clave, cardinalidad=cardinalidad, datos=datos
+            ))
+        ContenedorVistos.objects.bulk_create(contenedores)
+
+
+def borrar_conjuntos(apps, schema_editor):
+    # Sin fila, el código anterior reconstruye el conjunto al pedirlo
+    apps.get_model('matches', 'VistosUsuario').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matches', '0010_swipe_id_cliente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContenedorVistos',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.PositiveIntegerField(help_text='16 bits altos de los ids')),
+                ('cardinalidad', models.PositiveIntegerField()),
+                ('datos', models.BinaryField(help_text='Arreglo de uint16 o bitmap de 8 KB')),
+                ('vistos', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='contenedores', to='matches.vistosusuario')),
+            ],
+            options={
+                'verbose_name': 'Contenedor de vistos',
+                'verbose_name_plural': 'Contenedores de vistos',
+                'constraints': [models.UniqueConstraint(fields=('vistos', 'clave'), name='contenedor_vistos_unico')],
+            },
+        ),
+        migrations.RunPython(construir_contenedores, borrar_conjuntos),
+        migrations.RemoveField(
+            model_name='vistosusuario',
+            name='datos',
+        ),
+    ]
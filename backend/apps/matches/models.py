@@ -1,5 +1,9 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from apps.usuarios.models import Usuario
+from apps.chat import tiempo_real
+from apps.sincronizacion.models import Cambio
 
 # Create your models here.
 class Swipe(models.Model):
@@ -38,12 +42,26 @@ class Swipe(models.Model):
     )
     
     fecha = models.DateTimeField(auto_now_add=True)
+    
+    id_cliente = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True,
+        help_text="Clave de idempotencia que generó el cliente"
+    )
 
     class Meta:
         verbose_name = 'Swipe'
         verbose_name_plural = 'Swipes'
         ordering = ['-fecha']
         unique_together = ['usuario_origen', 'usuario_destino']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['usuario_origen', 'id_cliente'],
+                condition=models.Q(id_cliente__isnull=False),
+                name='swipe_origen_id_cliente_unico'
+            ),
+        ]
         indexes = [
             models.Index(fields=['usuario_origen', 'tipo']),
             models.Index(fields=['usuario_destino', 'tipo']),
@@ -54,42 +72,340 @@ class Swipe(models.Model):
     
     def save(self, *args, **kwargs):
         """
-        Al guardar, verificar si hay match mutuo
+        Al guardar, verificar si hay match mutuo.
+        
+        El swipe, el conjunto de vistos y el match se escriben en una sola
+        transacción; el match creado (o existente) queda en `self.match`.
         """
-        super().save(*args, **kwargs)
+        es_nuevo = self._state.adding
+        es_like = self.tipo in (self.LIKE, self.SUPER_LIKE)
+        self.match = None
+        
+        with transaction.atomic():
+            if es_nuevo and es_like:
+                bloquear_usuarios([self.usuario_origen_id, self.usuario_destino_id])
+            
+            super().save(*args, **kwargs)
+            
+            if es_nuevo:
+                from .vistos import registrar_vistos
+                registrar_vistos(self.usuario_origen_id, [self.usuario_destino_id])
+            
+            # Solo procesar si es un like
+            if es_like:
+                self.match = self.verificar_match()
+                if self.match:
+                    Cambio.registrar_matches([self.match])
+                    tiempo_real.notificar_match(self.match)
         
-        # Solo procesar si es un like
-        if self.tipo == self.LIKE or self.tipo == self.SUPER_LIKE:
-            self.verificar_match()
+        if es_nuevo:
+            # Sacar al usuario destino del deck de candidatos
+            from .deck import descartar_del_deck
+            descartar_del_deck(self.usuario_origen_id, [self.usuario_destino_id])
+
+    @classmethod
+    def crear_lote(cls, usuario_origen, items):
+        """
+        Registra varios swipes de un mismo usuario con un número fijo de
+        consultas: inserción masiva, una sola búsqueda de likes recíprocos y
+        creación masiva de los matches nuevos.
+        
+        Args:
+            usuario_origen: Usuario que hace los swipes
+            items: lista ordenada de dicts con 'usuario_destino' (id) y 'tipo'
+        
+        Returns:
+            lista (en el mismo orden) de dicts con el resultado de cada swipe:
+            'estado' ('creado', 'duplicado' o 'invalido') y 'match_id'
+        """
+        from .vistos import bloquear_vistos, guardar_vistos
+        from .deck import descartar_del_deck
+        
+        resultados = [
+            {
+                'usuario_destino': item['usuario_destino'],
+                'tipo': item['tipo'],
+                'estado': 'invalido',
+                'match_id': None,
+            }
+            for item in items
+        ]
+        destinos = {item['usuario_destino'] for item in items}
+        
+        with transaction.atomic():
+            # Bloquear a los usuarios evita perder matches cuando dos likes
+            # recíprocos llegan al mismo tiempo
+            bloquear_usuarios([usuario_origen.id, *destinos])
+            
+            # Bloquear el conjunto de vistos serializa los swipes concurrentes
+            # del mismo usuario, así que sirve para detectar duplicados
+            fila_vistos, vistos = bloquear_vistos(usuario_origen.id, destinos)
+            
+            validos = set(
+                Usuario.objects.filter(
+                    id__in=destinos, activo=True
+                ).exclude(
+                    id=usuario_origen.id
+                ).values_list('id', flat=True)
+            )
+            
+            nuevos = []
+            for resultado in resultados:
+                destino = resultado['usuario_destino']
+                if destino not in validos:
+                    continue
+                if destino in vistos:
+                    resultado['estado'] = 'duplicado'
+                    continue
+                vistos.add(destino)
+                resultado['estado'] = 'creado'
+                nuevos.append(cls(
+                    usuario_origen=usuario_origen,
+                    usuario_destino_id=destino,
+                    tipo=resultado['tipo']
+                ))
+            
+            if not nuevos:
+                return resultados
+            
+            cls.objects.bulk_create(nuevos)
+            guardar_vistos(fila_vistos, vistos)
+            
+            # Likes recíprocos de todos los likes del lote en una consulta
+            likes = [s.usuario_destino_id for s in nuevos if s.tipo in (cls.LIKE, cls.SUPER_LIKE)]
+            reciprocos = set(
+                cls.objects.filter(
+                    usuario_origen_id__in=likes,
+                    usuario_destino=usuario_origen,
+                    tipo__in=[cls.LIKE, cls.SUPER_LIKE]
+                ).values_list('usuario_origen_id', flat=True)
+            )
+            
+            matches = {}
+            if reciprocos:
+                # Inserción tolerante a conflictos: si el match ya existía la
+                # restricción única lo ignora
+                Match.objects.bulk_create(
+                    [Match(usuario1_id=a, usuario2_id=b) for a, b in (
+                        Match.par_canonico(usuario_origen.id, otro_id) for otro_id in reciprocos
+                    )],
+                    ignore_conflicts=True
+                )
+                # Con el par canónico el usuario de origen es usuario1 para
+                # los ids mayores y usuario2 para los menores
+                for match in Match.objects.filter(
+                    models.Q(usuario1=usuario_origen, usuario2_id__in=[i for i in reciprocos if i > usuario_origen.id]) |
+                    models.Q(usuario2=usuario_origen, usuario1_id__in=[i for i in reciprocos if i < usuario_origen.id])
+                ):
+                    matches[match.otro_usuario_id(usuario_origen.id)] = match
+                    tiempo_real.notificar_match(match)
+                Cambio.registrar_matches(matches.values())
+        
+        for resultado in resultados:
+            match = matches.get(resultado['usuario_destino'])
+            if resultado['estado'] == 'creado' and match:
+                resultado['match_id'] = match.id
+        
+        descartar_del_deck(usuario_origen.id, [s.usuario_destino_id for s in nuevos])
+        return resultados
 
     def verificar_match(self):
         """
-        Verifica si existe un like recíproco y crea un match
+        Verifica si existe un like recíproco y crea el match.
+        Retorna el match (nuevo o existente) o None.
         """
         # Buscar si el usuario_destino también le dio like al usuario_origen
         like_reciproco = Swipe.objects.filter(
-            usuario_origen=self.usuario_destino,
-            usuario_destino=self.usuario_origen,
+            usuario_origen_id=self.usuario_destino_id,
+            usuario_destino_id=self.usuario_origen_id,
             tipo__in=[self.LIKE, self.SUPER_LIKE]
         ).exists()
         
         if like_reciproco:
-            # Verificar que no exista ya un match
-            match_existe = Match.objects.filter(
-                models.Q(usuario1=self.usuario_origen, usuario2=self.usuario_destino) |
-                models.Q(usuario1=self.usuario_destino, usuario2=self.usuario_origen)
-            ).exists()
-            
-            if not match_existe:
-                # Crear el match
-                Match.objects.create(
-                    usuario1=self.usuario_origen,
-                    usuario2=self.usuario_destino
-                )
+            return Match.objects.crear_entre(self.usuario_origen_id, self.usuario_destino_id)
+        return None
+
+
+def bloquear_usuarios(usuario_ids):
+    """
+    Bloquea (select_for_update) las filas de los usuarios en orden de id para
+    que los swipes cruzados entre ellos se serialicen sin deadlocks. Debe
+    llamarse dentro de una transacción.
+    """
+    list(
+        Usuario.objects.select_for_update().filter(
+            id__in=set(usuario_ids)
+        ).order_by('id').values_list('id', flat=True)
+    )
+
+
+class VistosUsuario(models.Model):
+    """
+    Conjunto compacto (bitmap) de los usuarios a los que un usuario ya les
+    hizo swipe. Evita el NOT IN sobre la tabla de swipes al generar candidatos
+    (ver apps.matches.vistos). Los ids están en ContenedorVistos; esta fila
+    lleva el total y su candado serializa los swipes del usuario
+    """
+
+    usuario = models.OneToOneField(
+        Usuario,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='vistos'
+    )
+
+    total = models.PositiveIntegerField(default=0)
+
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Vistos de usuario'
+        verbose_name_plural = 'Vistos de usuarios'
+
+    def __str__(self):
+        return f"{self.usuario.nombre_completo}: {self.total} vistos"
+
+
+class ContenedorVistos(models.Model):
+    """
+    Los ids vistos de un usuario con los mismos 16 bits altos (`clave`).
+    Un swipe solo vuelve a escribir el contenedor de su destino
+    """
+
+    vistos = models.ForeignKey(
+        VistosUsuario,
+        on_delete=models.CASCADE,
+        related_name='contenedores'
+    )
+
+    clave = models.PositiveIntegerField(help_text="16 bits altos de los ids")
+
+    cardinalidad = models.PositiveIntegerField()
+
+    datos = models.BinaryField(help_text="Arreglo de uint16 o bitmap de 8 KB")
+
+    class Meta:
+        verbose_name = 'Contenedor de vistos'
+        verbose_name_plural = 'Contenedores de vistos'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['vistos', 'clave'],
+                name='contenedor_vistos_unico'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.vistos_id}/{self.clave}: {self.cardinalidad} vistos"
+
+
+# Caracteres del último mensaje que se guardan en Match para las listas
+LARGO_PREVIEW = 50
+
+
+def generar_preview(contenido):
+    """Recorta el contenido de un mensaje para mostrarlo en las listas"""
+    if len(contenido) > LARGO_PREVIEW:
+        return contenido[:LARGO_PREVIEW] + '...'
+    return contenido
+
+
+class MatchQuerySet(models.QuerySet):
+
+    def entre(self, usuario_a_id, usuario_b_id):
+        """Filtra el match de un par de usuarios (búsqueda directa por par canónico)"""
+        usuario1_id, usuario2_id = Match.par_canonico(usuario_a_id, usuario_b_id)
+        return self.filter(usuario1_id=usuario1_id, usuario2_id=usuario2_id)
+
+    def del_usuario(self, usuario):
+        """Filtra los matches en los que participa el usuario"""
+        return self.filter(models.Q(usuario1=usuario) | models.Q(usuario2=usuario))
+
+    def por_participante(self, usuario):
+        """
+        Divide el queryset en una consulta por columna de participante
+        (usuario1 y usuario2) para que cada una use su propio índice en lugar
+        del OR. Lo usa la paginación por keyset (apps.matches.paginacion)
+        """
+        return [self.filter(usuario1=usuario), self.filter(usuario2=usuario)]
+
+    def aplicar_actividad(self, ultimo, recuentos=None, **incrementos):
+        """
+        Aplica en un solo UPDATE el último mensaje (`ultimo`, ver
+        Match.datos_ultimo_mensaje) y suma los `incrementos` a los contadores
+        de no leídos; `recuentos` ({campo: expresión}, ver
+        Match.contar_no_leidos) los reemplaza en lugar de sumar. El resumen
+        solo avanza: si la fila ya tiene un mensaje más nuevo se conserva, así
+        que el orden en que se aplican las actividades no importa.
+        """
+        es_mas_nuevo = (
+            models.Q(id_ultimo_mensaje__isnull=True) |
+            models.Q(id_ultimo_mensaje__lt=ultimo['id_ultimo_mensaje'])
+        )
+        cambios = {
+            campo: models.Case(
+                models.When(es_mas_nuevo, then=models.Value(valor)),
+                default=models.F(campo),
+                output_field=Match._meta.get_field(campo)
+            )
+            for campo, valor in ultimo.items()
+        }
+        for campo, cantidad in incrementos.items():
+            cambios[campo] = models.F(campo) + cantidad
+        cambios.update(recuentos or {})
+        return self.update(**cambios)
+
+    def version_listas(self, usuario_id):
+        """
+        Versión de las listas de matches y conversaciones del usuario (ETag
+        de MisMatchesView y ConversacionesView), en una consulta: su último
+        Cambio de sincronización y el último mensaje de sus matches activos.
+        El último mensaje cubre los resúmenes que el coalescedor escribe
+        después de registrar el cambio.
+        """
+        def ultimo_mensaje(campo):
+            return models.Subquery(
+                self.filter(**{campo: models.OuterRef('pk'), 'activo': True}).values(campo).annotate(
+                    maximo=models.Max('ultimo_mensaje')
+                ).values('maximo')
+            )
+
+        return Usuario.objects.filter(pk=usuario_id).annotate(
+            ultimo_cambio=models.Subquery(
+                Cambio.objects.filter(usuario=models.OuterRef('pk')).order_by('-id').values('id')[:1]
+            ),
+            ultimo_mensaje1=ultimo_mensaje('usuario1'),
+            ultimo_mensaje2=ultimo_mensaje('usuario2'),
+        ).values_list('ultimo_cambio', 'ultimo_mensaje1', 'ultimo_mensaje2').first()
+
+    def obtener_de_usuario(self, usuario, pk, **filtros):
+        """
+        Obtiene un match por pk y verifica en Python que el usuario sea parte
+        de él (evita el OR entre usuario1 y usuario2).
+        Lanza Match.DoesNotExist si no existe o no es del usuario.
+        """
+        match = self.get(pk=pk, **filtros)
+        if not match.tiene_usuario(usuario):
+            raise Match.DoesNotExist
+        return match
+
+    def crear_entre(self, usuario_a_id, usuario_b_id):
+        """
+        Crea el match de un par si no existe y lo retorna. Usa una inserción
+        tolerante a conflictos (la restricción única del par) en lugar de
+        verificar antes si existe.
+        """
+        usuario1_id, usuario2_id = Match.par_canonico(usuario_a_id, usuario_b_id)
+        self.bulk_create(
+            [Match(usuario1_id=usuario1_id, usuario2_id=usuario2_id)],
+            ignore_conflicts=True
+        )
+        return self.get(usuario1_id=usuario1_id, usuario2_id=usuario2_id)
+
 
 class Match(models.Model):
     """
-    Representa un match entre dos usuarios
+    Representa un match entre dos usuarios.
+    El par siempre se guarda ordenado (usuario1_id < usuario2_id)
     """
     
     usuario1 = models.ForeignKey(
@@ -118,13 +434,88 @@ class Match(models.Model):
         help_text="Fecha del último mensaje enviado"
     )
     
+    # Resumen de la conversación, se mantiene en la misma transacción en la
+    # que se crean o se leen los mensajes (ver chat.Mensaje)
+    id_ultimo_mensaje = models.BigIntegerField(
+        null=True,
+        blank=True,
+        help_text="Id del último mensaje enviado"
+    )
+    
+    preview_ultimo_mensaje = models.CharField(
+        max_length=LARGO_PREVIEW + 3,
+        blank=True,
+        help_text="Primeros caracteres del último mensaje"
+    )
+    
+    remitente_ultimo_mensaje = models.ForeignKey(
+        Usuario,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        db_index=False
+    )
+    
+    no_leidos_usuario1 = models.PositiveIntegerField(
+        default=0,
+        help_text="Mensajes de usuario2 que usuario1 no ha leído"
+    )
+    
+    no_leidos_usuario2 = models.PositiveIntegerField(
+        default=0,
+        help_text="Mensajes de usuario1 que usuario2 no ha leído"
+    )
+    
+    # Confirmaciones de lectura: cada lado guarda hasta qué mensaje leyó
+    # (marca de agua), en lugar de marcar cada mensaje como leído
+    ultimo_leido_usuario1 = models.BigIntegerField(
+        default=0,
+        help_text="Id del último mensaje que leyó usuario1"
+    )
+    
+    ultimo_leido_usuario2 = models.BigIntegerField(
+        default=0,
+        help_text="Id del último mensaje que leyó usuario2"
+    )
+    
+    fecha_lectura_usuario1 = models.DateTimeField(null=True, blank=True)
+    
+    fecha_lectura_usuario2 = models.DateTimeField(null=True, blank=True)
+    
+    # Mensajes movidos al archivo (apps.chat.models.ArchivoConversacion)
+    archivado_hasta_id = models.BigIntegerField(
+        default=0,
+        help_text="Id del último mensaje archivado (0 si no hay archivo)"
+    )
+    
+    objects = MatchQuerySet.as_manager()
+    
     class Meta:
         verbose_name = 'Match'
         verbose_name_plural = 'Matches'
         ordering = ['-fecha']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['usuario1', 'usuario2'],
+                name='match_par_unico'
+            ),
+            models.CheckConstraint(
+                condition=models.Q(usuario1__lt=models.F('usuario2')),
+                name='match_par_ordenado'
+            ),
+        ]
         indexes = [
-            models.Index(fields=['usuario1', 'usuario2']),
             models.Index(fields=['fecha']),
+            # Listas de matches y conversaciones (paginación por keyset)
+            models.Index(
+                fields=['usuario1', 'activo', '-ultimo_mensaje', '-id'],
+                name='match_usuario1_actividad_idx'
+            ),
+            models.Index(
+                fields=['usuario2', 'activo', '-ultimo_mensaje', '-id'],
+                name='match_usuario2_actividad_idx'
+            ),
         ]
 
     def __str__(self):
@@ -134,18 +525,146 @@ class Match(models.Model):
         """
         Asegurar que usuario1.id < usuario2.id para evitar duplicados
         """
-        if self.usuario1.id > self.usuario2.id:
-            self.usuario1, self.usuario2 = self.usuario2, self.usuario1
+        self.usuario1_id, self.usuario2_id = self.par_canonico(self.usuario1_id, self.usuario2_id)
         super().save(*args, **kwargs)
 
+    @staticmethod
+    def par_canonico(usuario_a_id, usuario_b_id):
+        """Retorna el par de ids en el orden en que se guarda (menor, mayor)"""
+        if usuario_a_id > usuario_b_id:
+            return usuario_b_id, usuario_a_id
+        return usuario_a_id, usuario_b_id
+
     def tiene_usuario(self, usuario):
         """Verifica si un usuario es parte del match"""
-        return self.usuario1 == usuario or self.usuario2 == usuario
+        return usuario.id in (self.usuario1_id, self.usuario2_id)
+
+    def otro_usuario_id(self, usuario_id):
+        """Retorna el id del otro usuario del match"""
+        if self.usuario1_id == usuario_id:
+            return self.usuario2_id
+        elif self.usuario2_id == usuario_id:
+            return self.usuario1_id
+        return None
+
+    def _campo(self, prefijo, usuario_id):
+        """Nombre del campo por lado (`<prefijo>_usuario1` o `_usuario2`)"""
+        if usuario_id == self.usuario1_id:
+            return f'{prefijo}_usuario1'
+        return f'{prefijo}_usuario2'
+
+    def campo_no_leidos(self, usuario_id):
+        """Nombre del contador de no leídos del usuario indicado"""
+        return self._campo('no_leidos', usuario_id)
+
+    def no_leidos_de(self, usuario_id):
+        """Mensajes que el usuario indicado no ha leído"""
+        return getattr(self, self.campo_no_leidos(usuario_id))
+
+    def ultimo_leido_de(self, usuario_id):
+        """Id del último mensaje que leyó el usuario indicado"""
+        return getattr(self, self._campo('ultimo_leido', usuario_id))
+
+    def fecha_lectura_de(self, usuario_id):
+        """Cuándo leyó por última vez el usuario indicado"""
+        return getattr(self, self._campo('fecha_lectura', usuario_id))
+
+    def mensaje_leido(self, mensaje):
+        """Si el destinatario del mensaje ya lo leyó (según su marca de agua)"""
+        destinatario_id = self.otro_usuario_id(mensaje.remitente_id)
+        return mensaje.id <= self.ultimo_leido_de(destinatario_id)
+
+    def marcar_leidos_por(self, usuario_id, hasta_id=None):
+        """
+        Mueve la marca de agua de lectura del usuario con un solo UPDATE de la
+        fila del match. Sin `hasta_id` marca hasta el último mensaje del
+        resumen (y el contador de no leídos queda en 0). Con `hasta_id` marca
+        hasta el último mensaje que existe con ese id o menor, aunque el
+        resumen todavía no lo incluya (apps.chat.coalescer). La marca nunca
+        retrocede. Retorna True si cambió.
+        """
+        from apps.chat.models import Mensaje
+        
+        campo_leido = self._campo('ultimo_leido', usuario_id)
+        campo_no_leidos = self.campo_no_leidos(usuario_id)
+        cambios = {
+            campo_leido: models.F('id_ultimo_mensaje'),
+            self._campo('fecha_lectura', usuario_id): timezone.now(),
+        }
+        
+        if hasta_id is None:
+            filas = Match.objects.filter(
+                pk=self.pk, id_ultimo_mensaje__gt=models.F(campo_leido)
+            )
+            cambios[campo_no_leidos] = 0
+        else:
+            hasta = Mensaje.objects.filter(
+                match=models.OuterRef('pk'), id__lte=hasta_id
+            )
+            filas = Match.objects.filter(
+                models.Exists(hasta.filter(id__gt=models.OuterRef(campo_leido))),
+                pk=self.pk
+            )
+            cambios[campo_leido] = models.Subquery(hasta.order_by('-id').values('id')[:1])
+            # Los no leídos que quedan se cuentan después de la nueva marca
+            cambios[campo_no_leidos] = Coalesce(models.Subquery(
+                Mensaje.objects.filter(
+                    match=models.OuterRef('pk'),
+                    remitente_id=self.otro_usuario_id(usuario_id),
+                    id__gt=hasta_id
+                ).values('match').annotate(
+                    total=models.Count('id')
+                ).values('total')[:1]
+            ), 0)
+        
+        if not filas.update(**cambios):
+            return False
+        self.refresh_from_db(fields=[
+            campo_leido, campo_no_leidos, self._campo('fecha_lectura', usuario_id)
+        ])
+        return True
+
+    def contar_no_leidos(self, usuario_id):
+        """
+        Expresión para un UPDATE de la fila del match: mensajes del otro
+        usuario después de la marca de lectura (actual) de `usuario_id`
+        """
+        from apps.chat.models import Mensaje
+        
+        return Coalesce(models.Subquery(
+            Mensaje.objects.filter(
+                match=models.OuterRef('pk'),
+                remitente_id=self.otro_usuario_id(usuario_id),
+                id__gt=models.OuterRef(self._campo('ultimo_leido', usuario_id))
+            ).values('match').annotate(
+                total=models.Count('id')
+            ).values('total')[:1]
+        ), 0)
+
+    def registrar_mensaje(self, mensaje):
+        """
+        Actualiza el resumen (último mensaje y no leídos del destinatario) con
+        un solo UPDATE. Debe llamarse en la transacción que crea el mensaje
+        """
+        campo = self.campo_no_leidos(self.otro_usuario_id(mensaje.remitente_id))
+        Match.objects.filter(pk=self.pk).aplicar_actividad(
+            Match.datos_ultimo_mensaje(mensaje), **{campo: 1}
+        )
+
+    @staticmethod
+    def datos_ultimo_mensaje(mensaje):
+        """Campos del resumen que se toman del último mensaje"""
+        return {
+            'ultimo_mensaje': mensaje.fecha,
+            'id_ultimo_mensaje': mensaje.id,
+            'preview_ultimo_mensaje': generar_preview(mensaje.contenido),
+            'remitente_ultimo_mensaje_id': mensaje.remitente_id,
+        }
 
     def obtener_otro_usuario(self, usuario):
         """Retorna el otro usuario del match"""
-        if self.usuario1 == usuario:
+        if self.usuario1_id == usuario.id:
             return self.usuario2
-        elif self.usuario2 == usuario:
+        elif self.usuario2_id == usuario.id:
             return self.usuario1
-        return None
\ No newline at end of file
+        return None
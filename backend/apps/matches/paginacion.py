@@ -0,0 +1,143 @@
+"""
+Paginación por keyset (cursor) para las listas de matches y conversaciones.
+
+Orden: `ultimo_mensaje` descendente (los matches sin mensajes al final) y
+`id` descendente como desempate. El cursor es opaco (base64 del último
+par (ultimo_mensaje, id) de la página) y cada página es un rango del índice:
+no hay COUNT ni OFFSET, y una página no se recorre aunque lleguen mensajes
+nuevos mientras el cliente pagina.
+
+Si la vista define `get_ramas(queryset)`, cada rama (p. ej. una consulta por
+columna de participante) se pagina por separado con su propio índice y los
+resultados se mezclan en Python. Las filas pueden ser instancias o dicts de
+.values() (cuceimatch.serializacion).
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+_SIN_CURSOR = object()
+
+
+class KeysetPagination(BasePagination):
+    campo = 'ultimo_mensaje'
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    mensaje_cursor_invalido = 'Cursor inválido'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        limite = self.get_page_size(request)
+        cursor = self.decodificar_cursor(request)
+
+        ramas = view.get_ramas(queryset) if hasattr(view, 'get_ramas') else [queryset]
+        filas = []
+        for rama in ramas:
+            filas.extend(self._pagina_de_rama(rama, cursor, limite + 1))
+        filas.sort(key=self._clave_orden, reverse=True)
+
+        pagina = filas[:limite]
+        self.siguiente = None
+        if len(filas) > limite:
+            ultima = pagina[-1]
+            self.siguiente = self.codificar_cursor(
+                self._valor(ultima, self.campo), self._valor(ultima, 'id')
+            )
+        return pagina
+
+    def _pagina_de_rama(self, queryset, cursor, cantidad):
+        """
+        Lee hasta `cantidad` filas después del cursor. Las filas con y sin
+        valor se leen como dos rangos separados para que cada uno use el
+        índice sin depender de cómo ordena los NULL cada base de datos.
+        """
+        campo = self.campo
+        filas = []
+
+        if cursor is _SIN_CURSOR or cursor[0] is not None:
+            con_valor = queryset.filter(**{f'{campo}__isnull': False})
+            if cursor is not _SIN_CURSOR:
+                valor, id_ = cursor
+                con_valor = con_valor.filter(
+                    Q(**{f'{campo}__lt': valor}) | Q(**{campo: valor, 'id__lt': id_})
+                )
+            filas = list(con_valor.order_by(f'-{campo}', '-id')[:cantidad])
+
+        if len(filas) < cantidad:
+            sin_valor = queryset.filter(**{f'{campo}__isnull': True})
+            if cursor is not _SIN_CURSOR and cursor[0] is None:
+                sin_valor = sin_valor.filter(id__lt=cursor[1])
+            filas.extend(sin_valor.order_by('-id')[:cantidad - len(filas)])
+
+        return filas
+
+    def _clave_orden(self, fila):
+        valor = self._valor(fila, self.campo)
+        return (valor is not None, valor.timestamp() if valor else 0, self._valor(fila, 'id'))
+
+    @staticmethod
+    def _valor(fila, campo):
+        return fila[campo] if isinstance(fila, dict) else getattr(fila, campo)
+
+    def get_page_size(self, request):
+        try:
+            tamano = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(tamano, self.max_page_size))
+
+    def decodificar_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return _SIN_CURSOR
+        try:
+            datos = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            valor = datos['v']
+            return (
+                self.valor_desde_cursor(valor) if valor is not None else None,
+                int(datos['id'])
+            )
+        except (binascii.Error, ValueError, KeyError, TypeError):
+            raise NotFound(self.mensaje_cursor_invalido)
+
+    def valor_desde_cursor(self, valor):
+        return datetime.fromisoformat(valor)
+
+    def valor_para_cursor(self, valor):
+        return valor.isoformat()
+
+    def codificar_cursor(self, valor, id_):
+        datos = json.dumps({
+            'v': self.valor_para_cursor(valor) if valor is not None else None,
+            'id': id_,
+        }, separators=(',', ':'))
+        cursor = base64.urlsafe_b64encode(datos.encode()).decode()
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, cursor
+        )
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.siguiente,
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
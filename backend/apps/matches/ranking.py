@@ -0,0 +1,65 @@
+"""
+Ranking vectorizado de candidatos.
+
+Cada perfil tiene sus intereses codificados como bitmask
+(Perfil.intereses_mascara). Un lote completo de candidatos se puntúa de una
+vez con NumPy: similitud de Jaccard entre intereses (popcount de AND / OR)
+combinada con qué tan reciente fue su última actividad.
+"""
+import numpy as np
+
+PESO_INTERESES = 0.7
+PESO_RECIENTE = 0.3
+
+# Vida media de la actividad: alguien activo hace 3 días vale la mitad
+VIDA_MEDIA_HORAS = 72
+
+
+def puntuar(mascara_usuario, mascaras, horas_inactivo):
+    """
+    Calcula el puntaje de cada candidato del lote.
+
+    Args:
+        mascara_usuario: bitmask de intereses del usuario que ve el deck
+        mascaras: arreglo uint64 con el bitmask de cada candidato
+        horas_inactivo: arreglo float con las horas desde su última actividad
+
+    Returns:
+        arreglo float64 con el puntaje (mayor es mejor)
+    """
+    mascaras = np.asarray(mascaras, dtype=np.uint64)
+    propia = np.uint64(mascara_usuario)
+
+    comunes = np.bitwise_count(mascaras & propia).astype(np.float64)
+    union = np.bitwise_count(mascaras | propia).astype(np.float64)
+    jaccard = np.divide(comunes, union, out=np.zeros_like(comunes), where=union > 0)
+
+    horas = np.maximum(np.asarray(horas_inactivo, dtype=np.float64), 0)
+    recencia = np.exp2(-horas / VIDA_MEDIA_HORAS)
+
+    return PESO_INTERESES * jaccard + PESO_RECIENTE * recencia
+
+
+def ordenar(ids, mascara_usuario, mascaras, horas_inactivo):
+    """Retorna `ids` ordenados de mayor a menor puntaje"""
+    if not len(ids):
+        return []
+    puntajes = puntuar(mascara_usuario, mascaras, horas_inactivo)
+    # Orden estable: a igual puntaje se respeta el orden de entrada
+    orden = np.argsort(-puntajes, kind='stable')
+    return np.asarray(ids)[orden].tolist()
+
+
+def puntuar_python(mascara_usuario, mascaras, horas_inactivo):
+    """
+    Implementación fila por fila equivalente a `puntuar`. Solo se usa como
+    referencia en el benchmark (manage.py benchmark_ranking)
+    """
+    puntajes = []
+    for mascara, horas in zip(mascaras, horas_inactivo):
+        mascara = int(mascara)
+        union = (mascara | mascara_usuario).bit_count()
+        jaccard = (mascara & mascara_usuario).bit_count() / union if union else 0.0
+        recencia = 2 ** (-max(horas, 0) / VIDA_MEDIA_HORAS)
+        puntajes.append(PESO_INTERESES * jaccard + PESO_RECIENTE * recencia)
+    return puntajes
@@ -1,6 +1,10 @@
+from django.db import IntegrityError, models
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 from .models import Swipe, Match
-from apps.usuarios.serializers import UsuarioPerfilSerializer
+from apps.usuarios.tarjetas import obtener_tarjetas, obtener_tarjeta
+from cuceimatch.idempotencia import verificar_original
+from cuceimatch.serializacion import SerializadorLigero, columna, columna_fecha_hora
 
 
 class SwipeSerializer(serializers.ModelSerializer):
@@ -20,24 +24,75 @@ class SwipeSerializer(serializers.ModelSerializer):
             )
         return value
     
-    def validate(self, attrs):
-        """Validar que no exista ya un swipe"""
+    def create(self, validated_data):
+        """
+        Crear el swipe. No se verifica antes si ya existe: la restricción
+        única (usuario_origen, usuario_destino) rechaza el duplicado
+        """
         usuario_origen = self.context['request'].user
-        usuario_destino = attrs['usuario_destino']
-        
-        if Swipe.objects.filter(
-            usuario_origen=usuario_origen,
-            usuario_destino=usuario_destino
-        ).exists():
-            raise serializers.ValidationError(
-                "Ya hiciste swipe a este usuario"
-            )
-        
-        return attrs
+        validated_data['usuario_origen'] = usuario_origen
+        validated_data['id_cliente'] = self.context.get('id_cliente')
+        try:
+            return super().create(validated_data)
+        except IntegrityError:
+            # Reintento de un swipe ya guardado con la misma clave
+            original = self._original(usuario_origen, validated_data['id_cliente'])
+            if original is not None:
+                return verificar_original(
+                    original,
+                    usuario_destino_id=validated_data['usuario_destino'].id,
+                    tipo=validated_data['tipo']
+                )
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: ["Ya hiciste swipe a este usuario"]
+            })
+
     
-    def create(self, validated_data):
-        validated_data['usuario_origen'] = self.context['request'].user
-        return super().create(validated_data)
+    def _original(self, usuario_origen, id_cliente):
+        if id_cliente is None:
+            return None
+        swipe = Swipe.objects.filter(
+            usuario_origen=usuario_origen, id_cliente=id_cliente
+        ).first()
+        if swipe is not None:
+            swipe.match = None
+            if swipe.tipo in (Swipe.LIKE, Swipe.SUPER_LIKE):
+                swipe.match = Match.objects.entre(
+                    swipe.usuario_origen_id, swipe.usuario_destino_id
+                ).filter(activo=True).first()
+        return swipe
+
+
+class SwipeLoteItemSerializer(serializers.Serializer):
+    """
+    Un swipe dentro de un lote (el usuario destino se valida en bloque)
+    """
+    usuario_destino = serializers.IntegerField(min_value=1)
+    tipo = serializers.ChoiceField(choices=Swipe.TIPO_CHOICES)
+
+
+class SwipeLoteSerializer(serializers.Serializer):
+    """
+    Serializer para registrar varios swipes en una sola petición
+    """
+    swipes = SwipeLoteItemSerializer(many=True, allow_empty=False, max_length=100)
+
+
+class MatchListSerializer(serializers.ListSerializer):
+    """
+    Carga las tarjetas de todos los otros usuarios de la lista con una sola
+    lectura a la caché antes de serializar cada match
+    """
+    
+    def to_representation(self, data):
+        matches = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        request = self.context.get('request')
+        if request:
+            self._context['tarjetas'] = obtener_tarjetas(
+                [m.otro_usuario_id(request.user.id) for m in matches],
+                request
+            )
+        return super().to_representation(matches)
 
 
 class MatchSerializer(serializers.ModelSerializer):
@@ -55,46 +110,97 @@ class MatchSerializer(serializers.ModelSerializer):
             'ultimo_mensaje', 'ultimo_mensaje_preview',
             'mensajes_no_leidos'
         ]
+        list_serializer_class = MatchListSerializer
     
     def get_otro_usuario(self, obj):
-        """Obtiene el otro usuario del match"""
+        """Obtiene la tarjeta (en caché) del otro usuario del match"""
         request = self.context.get('request')
         if not request:
             return None
         
-        otro_usuario = obj.obtener_otro_usuario(request.user)
-        if otro_usuario:
-            return UsuarioPerfilSerializer(
-                otro_usuario,
-                context=self.context
-            ).data
-        return None
+        otro_usuario_id = obj.otro_usuario_id(request.user.id)
+        if otro_usuario_id is None:
+            return None
+        
+        tarjetas = self.context.get('tarjetas', {})
+        if otro_usuario_id in tarjetas:
+            return tarjetas[otro_usuario_id]
+        return obtener_tarjeta(otro_usuario_id, request)
     
     def get_ultimo_mensaje_preview(self, obj):
-        """Obtiene preview del último mensaje"""
-        ultimo_msg = obj.mensajes.order_by('-fecha').first()
-        if ultimo_msg:
-            preview = ultimo_msg.contenido[:50]
-            if len(ultimo_msg.contenido) > 50:
-                preview += '...'
-            return {
-                'contenido': preview,
-                'remitente_id': ultimo_msg.remitente.id,
-                'fecha': ultimo_msg.fecha
-            }
-        return None
+        """Preview del último mensaje (resumen guardado en el match)"""
+        if obj.id_ultimo_mensaje is None:
+            return None
+        return {
+            'contenido': obj.preview_ultimo_mensaje,
+            'remitente_id': obj.remitente_ultimo_mensaje_id,
+            'fecha': obj.ultimo_mensaje
+        }
     
     def get_mensajes_no_leidos(self, obj):
-        """Cuenta mensajes no leídos del otro usuario"""
+        """Mensajes del otro usuario que el usuario autenticado no ha leído"""
         request = self.context.get('request')
-        if not request:
+        if not request or not obj.tiene_usuario(request.user):
             return 0
+        return obj.no_leidos_de(request.user.id)
+
+
+class MatchLigeroSerializer(SerializadorLigero):
+    """
+    Misma salida que MatchSerializer sobre filas de .values() (ver
+    cuceimatch.serializacion), para las listas de matches y conversaciones
+    """
+    columnas = (
+        'id', 'fecha', 'activo', 'usuario1_id', 'usuario2_id',
+        'ultimo_mensaje', 'id_ultimo_mensaje', 'preview_ultimo_mensaje',
+        'remitente_ultimo_mensaje_id', 'no_leidos_usuario1', 'no_leidos_usuario2'
+    )
+    
+    def plan(self, filas):
+        request = self.context.get('request')
+        usuario_id = request.user.id if request else None
+        
+        def otro_usuario_id(fila):
+            if fila['usuario1_id'] == usuario_id:
+                return fila['usuario2_id']
+            if fila['usuario2_id'] == usuario_id:
+                return fila['usuario1_id']
+            return None
+        
+        tarjetas = {}
+        if request:
+            tarjetas = obtener_tarjetas([otro_usuario_id(fila) for fila in filas], request)
         
-        otro_usuario = obj.obtener_otro_usuario(request.user)
-        if not otro_usuario:
+        def otro_usuario(fila):
+            otro_id = otro_usuario_id(fila)
+            if otro_id is None:
+                return None
+            if otro_id in tarjetas:
+                return tarjetas[otro_id]
+            return obtener_tarjeta(otro_id, request)
+        
+        def preview(fila):
+            if fila['id_ultimo_mensaje'] is None:
+                return None
+            return {
+                'contenido': fila['preview_ultimo_mensaje'],
+                'remitente_id': fila['remitente_ultimo_mensaje_id'],
+                'fecha': fila['ultimo_mensaje']
+            }
+        
+        def no_leidos(fila):
+            if fila['usuario1_id'] == usuario_id:
+                return fila['no_leidos_usuario1']
+            if fila['usuario2_id'] == usuario_id:
+                return fila['no_leidos_usuario2']
             return 0
         
-        return obj.mensajes.filter(
-            remitente=otro_usuario,
-            leido=False
-        ).count()
\ No newline at end of file
+        return [
+            ('id', columna('id')),
+            ('fecha', columna_fecha_hora('fecha')),
+            ('activo', columna('activo')),
+            ('otro_usuario', otro_usuario),
+            ('ultimo_mensaje', columna_fecha_hora('ultimo_mensaje')),
+            ('ultimo_mensaje_preview', preview),
+            ('mensajes_no_leidos', no_leidos),
+        ]
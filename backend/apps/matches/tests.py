@@ -1,3 +1,802 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import threading
+from array import array
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test.utils import CaptureQueriesContext
+from django.test import (
+    SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+)
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from apps.usuarios.models import Usuario
+from apps.perfiles.models import Perfil, Foto
+from apps.usuarios import tarjetas
+from apps.usuarios.tarjetas import obtener_tarjeta
+from apps.chat.models import Mensaje
+from cuceimatch.renderers import ORJSONRenderer, ORJSONParser
+from . import ranking
+from .models import Match, Swipe, VistosUsuario, ContenedorVistos
+from .vistos import ConjuntoVistos, LIMITE_ARREGLO, obtener_vistos, registrar_vistos
+from .deck import (
+    obtener_deck, rellenar_deck, leer_deck, descartar_del_deck, invalidar_deck,
+    _guardar, _clave_agotado, _clave_candado
+)
+from .serializers import MatchSerializer, MatchLigeroSerializer
+
+
+def crear_usuario(nombre, genero='mujer', buscando='ambos', fotos=1):
+    usuario = Usuario.objects.create_user(
+        username=nombre,
+        email=f'{nombre}@test.com',
+        password='test1234',
+        nombre_completo=nombre.title(),
+        codigo_udg=f'test_{nombre}',
+        url_credencial=f'https://test.com/{nombre}',
+        vigencia='DIC-2030',
+        fecha_nacimiento=date(date.today().year - 21, 1, 1),
+        genero=genero,
+        buscando=buscando,
+        verificado=True,
+        activo=True,
+        perfil_completo=True
+    )
+    Perfil.objects.create(usuario=usuario, bio='Hola', intereses=['Música'])
+    for orden in range(fotos):
+        Foto.objects.create(
+            usuario=usuario,
+            imagen=f'fotos_perfil/{nombre}_{orden}.jpg',
+            orden=orden
+        )
+    return usuario
+
+
+@override_settings(DECK_RELLENO_ASINCRONO=False, DECK_MINIMO=5)
+class ConsultasTarjetasTests(TestCase):
+    """
+    El número de consultas para serializar tarjetas no depende de cuántas sean
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = crear_usuario('yo', genero='hombre')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def test_candidatos_sin_n_mas_1(self):
+        for i in range(12):
+            crear_usuario(f'candidata{i}', fotos=3)
+
+        # Llenar el deck y la caché de tarjetas fuera de la medición
+        self.client.get('/api/matches/candidatos/')
+
+        # Con el deck y las tarjetas en caché: vistos + perfil + validación
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/matches/candidatos/')
+
+        candidatos = response.data['candidatos']
+        self.assertEqual(len(candidatos), 12)
+        self.assertEqual(
+            [f['orden'] for f in candidatos[0]['fotos']],
+            [0, 1, 2]
+        )
+
+    def test_mis_matches_sin_n_mas_1(self):
+        for i in range(5):
+            Match.objects.create(
+                usuario1=self.usuario,
+                usuario2=crear_usuario(f'match{i}', fotos=2)
+            )
+
+        # versión (ETag) + matches (con y sin mensajes, por cada columna de
+        # participante) + versiones de las tarjetas + tarjetas (usuarios con
+        # perfil + fotos); el resumen de mensajes viene en la fila del match
+        with self.assertNumQueries(1 + 4 + 1 + 2):
+            self.client.get('/api/matches/')
+
+        # Con las tarjetas en caché
+        with self.assertNumQueries(1 + 4 + 1):
+            response = self.client.get('/api/matches/')
+
+        self.assertEqual(len(response.data['results']), 5)
+        otro = response.data['results'][0]['otro_usuario']
+        self.assertEqual(len(otro['fotos']), 2)
+        self.assertEqual(otro['perfil']['bio'], 'Hola')
+
+
+class PaginacionMatchesTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = crear_usuario('yo', genero='hombre')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def test_recorrer_con_cursor(self):
+        ahora = timezone.now()
+        ids = []
+        for i in range(7):
+            otro = crear_usuario(f'match{i}')
+            match = Match.objects.crear_entre(self.usuario.id, otro.id)
+            # Dos matches con la misma fecha y tres sin mensajes
+            if i < 4:
+                Match.objects.filter(pk=match.pk).update(
+                    ultimo_mensaje=ahora - timedelta(minutes=min(i, 2))
+                )
+            ids.append(match.id)
+        # Con mensajes por fecha e id descendentes, luego sin mensajes por id
+        esperados = [ids[i] for i in (0, 1, 3, 2, 6, 5, 4)]
+
+        obtenidos = []
+        url = '/api/matches/?limit=3'
+        while url:
+            response = self.client.get(url)
+            self.assertNotIn('count', response.data)
+            obtenidos.extend(m['id'] for m in response.data['results'])
+            url = response.data['next']
+
+        self.assertEqual(obtenidos, esperados)
+
+    def test_cursor_invalido(self):
+        response = self.client.get('/api/matches/?cursor=no-es-un-cursor')
+        self.assertEqual(response.status_code, 404)
+
+
+class TarjetasCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_invalidacion_al_cambiar_fotos(self):
+        usuario = crear_usuario('ana', fotos=1)
+        self.assertEqual(len(obtener_tarjeta(usuario.id)['fotos']), 1)
+        # En caché: solo la versión
+        with self.assertNumQueries(1):
+            vieja = obtener_tarjeta(usuario.id)
+        version = Perfil.version_de(usuario.id)
+
+        Foto.objects.create(usuario=usuario, imagen='fotos_perfil/ana_1.jpg', orden=1)
+        # Una lectura que empezó antes del cambio guarda la tarjeta vieja
+        # después de confirmarlo: queda bajo la versión anterior
+        cache.set(tarjetas._clave(usuario.id, version), vieja)
+        with self.assertNumQueries(3):
+            tarjeta = obtener_tarjeta(usuario.id)
+        self.assertEqual(len(tarjeta['fotos']), 2)
+
+        with self.assertNumQueries(1):
+            obtener_tarjeta(usuario.id)
+
+    def test_sin_perfil_no_se_guarda(self):
+        usuario = crear_usuario('ana')
+        Perfil.objects.filter(usuario=usuario).delete()
+        self.assertIsNone(obtener_tarjeta(usuario.id)['perfil'])
+        self.assertIsNone(cache.get(tarjetas._clave(usuario.id, None)))
+
+    def test_prefijo_por_request(self):
+        usuario = crear_usuario('ana')
+        request = APIRequestFactory().get('/')
+
+        foto = obtener_tarjeta(usuario.id, request)['fotos'][0]
+        self.assertEqual(foto['imagen_url'], 'http://testserver/media/fotos_perfil/ana_0.jpg')
+        self.assertEqual(
+            obtener_tarjeta(usuario.id)['fotos'][0]['imagen_url'],
+            '/media/fotos_perfil/ana_0.jpg'
+        )
+
+
+class SwipeIdempotenteTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.ana = crear_usuario('ana')
+        self.beto = crear_usuario('beto', genero='hombre')
+        self.client = APIClient()
+
+    def swipe(self, usuario, destino, clave):
+        self.client.force_authenticate(usuario)
+        return self.client.post(
+            '/api/matches/swipe/',
+            {'usuario_destino': destino.id, 'tipo': 'like'},
+            HTTP_IDEMPOTENCY_KEY=clave
+        )
+
+    def test_reintento_repite_la_respuesta(self):
+        self.swipe(self.beto, self.ana, 'b-1')
+        primera = self.swipe(self.ana, self.beto, 'a-1')
+        self.assertEqual(primera.status_code, 201)
+        self.assertTrue(primera.data['match'])
+
+        # Desde la caché: solo se autentica, nada de validar ni escribir
+        with self.assertNumQueries(0):
+            repetida = self.swipe(self.ana, self.beto, 'a-1')
+        self.assertEqual(repetida.status_code, 201)
+        self.assertEqual(repetida.data, primera.data)
+        self.assertEqual(repetida['Idempotent-Replayed'], 'true')
+
+        # Sin la caché la fila guardada con la clave da el mismo resultado
+        cache.clear()
+        repetida = self.swipe(self.ana, self.beto, 'a-1')
+        self.assertEqual(repetida.status_code, 201)
+        self.assertEqual(repetida.data['swipe']['id'], primera.data['swipe']['id'])
+        self.assertTrue(repetida.data['match'])
+
+        # Otra clave para el mismo destino sigue siendo un swipe repetido
+        self.assertEqual(self.swipe(self.ana, self.beto, 'a-2').status_code, 400)
+        self.assertEqual(self.swipe(self.ana, self.beto, 'no válida').status_code, 400)
+
+    def test_clave_reutilizada_para_otro_destino(self):
+        carla = crear_usuario('carla')
+        self.assertEqual(self.swipe(self.ana, self.beto, 'a-1').status_code, 201)
+
+        # En la caché y, sin ella, en la fila guardada con la clave
+        self.assertEqual(self.swipe(self.ana, carla, 'a-1').status_code, 422)
+        cache.clear()
+        self.assertEqual(self.swipe(self.ana, carla, 'a-1').status_code, 422)
+        self.assertFalse(Swipe.objects.filter(usuario_destino=carla).exists())
+
+
+class GetCondicionalTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.ana = crear_usuario('ana')
+        self.beto = crear_usuario('beto', genero='hombre')
+        self.client = APIClient()
+        self.client.force_authenticate(self.ana)
+
+    def revalidar(self, url, etag, consultas):
+        with self.assertNumQueries(consultas):
+            return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_matches_y_conversaciones(self):
+        match = Match.objects.crear_entre(self.ana.id, self.beto.id)
+        for url in ('/api/matches/', '/api/chat/conversaciones/'):
+            response = self.client.get(url)
+            self.assertEqual(response['Cache-Control'], 'private, no-cache')
+            # Solo la versión; ni matches ni serializadores
+            self.assertEqual(self.revalidar(url, response['ETag'], 1).status_code, 304)
+
+            Mensaje.objects.create(match=match, remitente=self.beto, contenido=url)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_perfil(self):
+        url = '/api/perfiles/mi-perfil/'
+        response = self.client.get(url)
+        self.assertEqual(self.revalidar(url, response['ETag'], 1).status_code, 304)
+        # Sin Last-Modified: If-Modified-Since no da 304 tras un cambio en el mismo segundo
+        self.assertNotIn('Last-Modified', response)
+        Foto.objects.create(usuario=self.ana, imagen='fotos_perfil/ana_8.jpg', orden=2)
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_MODIFIED_SINCE='Tue, 01 Jan 2030 00:00:00 GMT').status_code, 200
+        )
+
+        # Una foto nueva cambia la versión del perfil y de /api/usuarios/perfil/
+        etag_usuario = self.client.get('/api/usuarios/perfil/')['ETag']
+        Foto.objects.create(usuario=self.ana, imagen='fotos_perfil/ana_9.jpg', orden=1)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+        self.assertEqual(
+            self.client.get('/api/usuarios/perfil/', HTTP_IF_NONE_MATCH=etag_usuario).status_code, 200
+        )
+
+        # ultima_actividad cambia sin tocar el perfil: también cambia el ETag
+        etag_usuario = self.client.get('/api/usuarios/perfil/')['ETag']
+        self.ana.save(update_fields=['ultima_actividad'])
+        self.client.force_authenticate(Usuario.objects.get(pk=self.ana.pk))
+        self.assertEqual(
+            self.client.get('/api/usuarios/perfil/', HTTP_IF_NONE_MATCH=etag_usuario).status_code, 200
+        )
+
+        response = self.client.get('/api/perfiles/intereses/')
+        self.assertEqual(response['Cache-Control'], 'private, max-age=86400')
+        self.assertEqual(self.revalidar('/api/perfiles/intereses/', response['ETag'], 0).status_code, 304)
+
+
+class RespuestasJSONTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = crear_usuario('yo', genero='hombre')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        for i in range(5):
+            match = Match.objects.crear_entre(self.usuario.id, crear_usuario(f'match{i}', fotos=2).id)
+            Mensaje.objects.create(match=match, remitente=self.usuario, contenido='Hola\u2028ñ')
+
+    def test_orjson_igual_que_drf(self):
+        datos = self.client.get('/api/matches/').data
+        self.assertEqual(ORJSONRenderer().render(datos), JSONRenderer().render(datos))
+        self.assertEqual(
+            ORJSONParser().parse(io.BytesIO(ORJSONRenderer().render(datos))),
+            json.loads(JSONRenderer().render(datos))
+        )
+
+        response = self.client.post(
+            '/api/matches/swipe/',
+            {'usuario_destino': crear_usuario('otra').id, 'tipo': 'like'},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+
+    def test_compresion(self):
+        response = self.client.get('/api/matches/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(json.loads(gzip.decompress(response.content)), json.loads(
+            self.client.get('/api/matches/').content
+        ))
+        # El ETag pasa a débil y sigue sirviendo para el 304
+        self.assertTrue(response['ETag'].startswith('W/'))
+        response = self.client.get(
+            '/api/matches/', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+
+        # Debajo del tamaño mínimo no se comprime
+        response = self.client.get('/api/chat/no-leidos/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+
+class MatchLigeroTests(TestCase):
+
+    def test_igual_al_de_drf(self):
+        cache.clear()
+        yo = crear_usuario('yo', genero='hombre')
+        con_mensajes = Match.objects.crear_entre(yo.id, crear_usuario('ana', fotos=2).id)
+        Match.objects.crear_entre(yo.id, crear_usuario('bety', fotos=0).id)
+        Mensaje.objects.create(match=con_mensajes, remitente=yo, contenido='Hola')
+        Mensaje.objects.create(
+            match=con_mensajes, remitente_id=con_mensajes.otro_usuario_id(yo.id), contenido='¿Qué tal?'
+        )
+        matches = Match.objects.order_by('id')
+
+        for usuario in (yo, crear_usuario('ajena')):
+            request = Request(APIRequestFactory().get('/api/matches/'))
+            request.user = usuario
+            contexto = {'request': request}
+            self.assertEqual(
+                MatchLigeroSerializer(MatchLigeroSerializer.filas(matches), many=True, context=contexto).data,
+                MatchSerializer(matches, many=True, context=contexto).data
+            )
+
+
+@override_settings(DECK_RELLENO_ASINCRONO=False, DECK_TAMANO=4, DECK_MINIMO=2)
+class DeckTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = crear_usuario('yo', genero='hombre')
+        self.candidatas = [crear_usuario(f'candidata{i}') for i in range(6)]
+
+    def test_llenado_y_relleno(self):
+        # El primer acceso llena el deck en línea hasta DECK_TAMANO
+        ids = obtener_deck(self.usuario, 10)
+        self.assertEqual(len(ids), 4)
+        self.assertEqual(leer_deck(self.usuario.id), ids)
+        self.assertTrue(set(ids) <= {c.id for c in self.candidatas})
+
+        # Leer no saca ids de la cola
+        self.assertEqual(obtener_deck(self.usuario, 2), ids[:2])
+
+        # Debajo de DECK_MINIMO se rellena al final, sin repetir lo que queda
+        descartar_del_deck(self.usuario.id, ids[:3])
+        self.assertEqual(leer_deck(self.usuario.id), ids[3:])
+        rellenado = obtener_deck(self.usuario, 10)
+        self.assertEqual(rellenado[0], ids[3])
+        self.assertEqual(len(set(rellenado)), 4)
+
+    def test_agotado(self):
+        Usuario.objects.filter(id__in=[c.id for c in self.candidatas]).update(activo=False)
+        self.assertEqual(obtener_deck(self.usuario, 10), [])
+        self.assertTrue(cache.get(_clave_agotado(self.usuario.id)))
+
+        # Mientras dure la marca no se vuelve a consultar la base de datos
+        Usuario.objects.filter(id__in=[c.id for c in self.candidatas]).update(activo=True)
+        with self.assertNumQueries(0):
+            self.assertEqual(obtener_deck(self.usuario, 10), [])
+
+        invalidar_deck(self.usuario.id)
+        self.assertEqual(len(obtener_deck(self.usuario, 10)), 4)
+
+    def test_candado_de_relleno(self):
+        cache.add(_clave_candado(self.usuario.id), True)
+        with self.assertNumQueries(0):
+            self.assertEqual(rellenar_deck(self.usuario), 0)
+        self.assertEqual(leer_deck(self.usuario.id), [])
+
+        cache.delete(_clave_candado(self.usuario.id))
+        self.assertEqual(rellenar_deck(self.usuario), 4)
+        # El candado se suelta al terminar
+        self.assertIsNone(cache.get(_clave_candado(self.usuario.id)))
+
+    def test_swipe_descarta_y_la_vista_filtra(self):
+        client = APIClient()
+        client.force_authenticate(self.usuario)
+        ids = [c['id'] for c in client.get('/api/matches/candidatos/').data['candidatos']]
+
+        client.post('/api/matches/swipe/', {'usuario_destino': ids[0], 'tipo': 'dislike'})
+        self.assertNotIn(ids[0], leer_deck(self.usuario.id))
+
+        # Un relleno concurrente que vuelve a escribir el id ya visto
+        _guardar(self.usuario.id, ids)
+        candidatos = client.get('/api/matches/candidatos/').data['candidatos']
+        self.assertNotIn(ids[0], [c['id'] for c in candidatos])
+        self.assertNotIn(ids[0], leer_deck(self.usuario.id))
+
+
+class VistosTests(TestCase):
+
+    def test_arreglo_y_bitmap(self):
+        # Un grupo de 16 bits con pocos ids es arreglo; al pasar el límite es bitmap
+        ids = list(range(70000, 70000 + LIMITE_ARREGLO)) + [5, 1 << 20]
+        conjunto = ConjuntoVistos(ids)
+        self.assertTrue(all(isinstance(c, array) for c in conjunto._contenedores.values()))
+        self.assertTrue(conjunto.add(70000 + LIMITE_ARREGLO))
+        self.assertIsInstance(conjunto._contenedores[70000 >> 16], bytearray)
+        self.assertFalse(conjunto.add(70001))
+        ids.append(70000 + LIMITE_ARREGLO)
+
+        self.assertEqual(len(conjunto), len(ids))
+        self.assertEqual(list(conjunto), sorted(ids))
+        self.assertIn(1 << 20, conjunto)
+        self.assertNotIn(69999, conjunto)
+        self.assertNotIn(6, conjunto)
+
+        copia = ConjuntoVistos.desde_contenedores(conjunto.contenedores())
+        self.assertEqual(len(copia), len(conjunto))
+        self.assertEqual(list(copia), list(conjunto))
+        self.assertEqual(copia.contenedores(), conjunto.contenedores())
+        self.assertEqual(len(ConjuntoVistos.desde_contenedores([])), 0)
+
+        # Solo los contenedores que cambian se vuelven a guardar
+        self.assertEqual(copia.contenedores(solo_modificados=True), [])
+        copia.add(3)
+        self.assertEqual([c[:2] for c in copia.contenedores(solo_modificados=True)], [(0, 2)])
+
+    def test_un_swipe_solo_escribe_su_contenedor(self):
+        yo = crear_usuario('yo', genero='hombre')
+        otras = [crear_usuario(f'otra{i}') for i in range(2)]
+        lejano = 1 << 20
+        Swipe.objects.create(usuario_origen=yo, usuario_destino=otras[0], tipo='dislike')
+        registrar_vistos(yo.id, [lejano])
+        contenedores = ContenedorVistos.objects.filter(vistos_id=yo.id)
+        self.assertEqual(sorted(contenedores.values_list('clave', 'cardinalidad')), [(0, 1), (16, 1)])
+
+        with CaptureQueriesContext(connection) as consultas:
+            registrar_vistos(yo.id, [otras[1].id])
+        escrituras = [q['sql'] for q in consultas if 'contenedorvistos' in q['sql'].lower()]
+        # Se lee y se reescribe solo el contenedor 0
+        self.assertEqual(len(escrituras), 2)
+        self.assertEqual(
+            sorted(contenedores.values_list('clave', 'cardinalidad')), [(0, 2), (16, 1)]
+        )
+        self.assertEqual(VistosUsuario.objects.get(usuario=yo).total, 3)
+        self.assertEqual(set(obtener_vistos(yo.id)), {otras[0].id, otras[1].id, lejano})
+        # Preguntar por unos ids solo carga sus contenedores
+        self.assertEqual(list(obtener_vistos(yo.id, [lejano])), [lejano])
+
+    def test_reconstruir_desde_swipes(self):
+        yo = crear_usuario('yo', genero='hombre')
+        otras = [crear_usuario(f'otra{i}') for i in range(3)]
+        for otra in otras[:2]:
+            Swipe.objects.create(usuario_origen=yo, usuario_destino=otra, tipo='dislike')
+
+        VistosUsuario.objects.all().delete()
+        self.assertEqual(list(obtener_vistos(yo.id)), [otras[0].id, otras[1].id])
+        self.assertEqual(VistosUsuario.objects.get(usuario=yo).total, 2)
+
+        Swipe.objects.create(usuario_origen=yo, usuario_destino=otras[2], tipo='like')
+        self.assertIn(otras[2].id, obtener_vistos(yo.id))
+
+    @override_settings(DECK_RELLENO_ASINCRONO=False, DECK_TAMANO=10)
+    def test_escaneo_acotado(self):
+        cache.clear()
+        yo = crear_usuario('yo', genero='hombre')
+        otras = [crear_usuario(f'otra{i}') for i in range(5)]
+        # Las más activas ya están vistas
+        for otra in otras[2:]:
+            Swipe.objects.create(usuario_origen=yo, usuario_destino=otra, tipo='dislike')
+
+        with mock.patch('apps.matches.candidatos.LIMITE_ESCANEO', 3):
+            # Solo una ventana de 3 filas por relleno: ninguna sin ver, pero
+            # no se marca como agotado y el siguiente sigue desde ahí
+            self.assertEqual(rellenar_deck(yo), 0)
+            self.assertIsNone(cache.get(_clave_agotado(yo.id)))
+            self.assertEqual(rellenar_deck(yo), 2)
+            self.assertEqual(set(leer_deck(yo.id)), {otras[0].id, otras[1].id})
+
+            # Al llegar al final se vuelve a empezar; una vuelta completa
+            # sin nada marca el deck como agotado
+            descartar_del_deck(yo.id, leer_deck(yo.id))
+            for otra in otras[:2]:
+                Swipe.objects.create(usuario_origen=yo, usuario_destino=otra, tipo='dislike')
+            self.assertEqual(rellenar_deck(yo), 0)
+            self.assertEqual(rellenar_deck(yo), 0)
+            self.assertTrue(cache.get(_clave_agotado(yo.id)))
+
+
+class RankingTests(SimpleTestCase):
+
+    def test_intereses_y_recencia(self):
+        # Jaccard con 0b0111: 0, 2/3, 3/4 y 1
+        mascaras = [0b1000, 0b0011, 0b1111, 0b0111]
+        self.assertEqual(ranking.ordenar([1, 2, 3, 4], 0b0111, mascaras, [0] * 4), [4, 3, 2, 1])
+
+        # Mismos intereses: primero el más reciente
+        self.assertEqual(ranking.ordenar([1, 2, 3], 0b1, [0b1] * 3, [72, 0, 5]), [2, 3, 1])
+        # Los intereses pesan más que un día de diferencia de actividad
+        self.assertEqual(ranking.ordenar([1, 2], 0b11, [0b01, 0b11], [0, 24]), [2, 1])
+
+    def test_empates_y_mascaras_vacias(self):
+        # A igual puntaje se respeta el orden de entrada
+        self.assertEqual(ranking.ordenar([5, 3, 9], 0b1, [0b1] * 3, [1] * 3), [5, 3, 9])
+        # Sin intereses de ningún lado la similitud es 0 (sin dividir entre 0)
+        self.assertEqual(ranking.ordenar([1, 2], 0, [0, 0], [10, 1]), [2, 1])
+        puntajes = ranking.puntuar(0, [0, 0b1], [0, -3])
+        self.assertEqual(puntajes.tolist(), [ranking.PESO_RECIENTE] * 2)
+        self.assertEqual(ranking.ordenar([], 0b1, [], []), [])
+
+    def test_igual_a_la_referencia(self):
+        mascaras = [0, 1, 0b1011, (1 << 63) | 1, 0b110]
+        horas = [0, 3.5, 100, 0.1, 1000]
+        self.assertEqual(
+            ranking.puntuar(0b1011, mascaras, horas).tolist(),
+            ranking.puntuar_python(0b1011, mascaras, horas)
+        )
+
+
+class SwipeLoteTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.yo = crear_usuario('yo', genero='hombre')
+        self.client = APIClient()
+        self.client.force_authenticate(self.yo)
+
+    def lote(self, swipes):
+        return self.client.post('/api/matches/swipe/batch/', {'swipes': swipes}, format='json')
+
+    def test_estados_y_matches(self):
+        ana, bety, carla = (crear_usuario(n) for n in ('ana', 'bety', 'carla'))
+        inactiva = crear_usuario('inactiva')
+        Usuario.objects.filter(pk=inactiva.pk).update(activo=False)
+        Swipe.objects.create(usuario_origen=ana, usuario_destino=self.yo, tipo='like')
+        Swipe.objects.create(usuario_origen=bety, usuario_destino=self.yo, tipo='like')
+        Swipe.objects.create(usuario_origen=self.yo, usuario_destino=carla, tipo='dislike')
+
+        response = self.lote([
+            {'usuario_destino': ana.id, 'tipo': 'like'},
+            {'usuario_destino': bety.id, 'tipo': 'dislike'},
+            {'usuario_destino': carla.id, 'tipo': 'like'},
+            {'usuario_destino': ana.id, 'tipo': 'superlike'},
+            {'usuario_destino': inactiva.id, 'tipo': 'like'},
+            {'usuario_destino': self.yo.id, 'tipo': 'like'},
+            {'usuario_destino': 999999, 'tipo': 'like'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        match = Match.objects.get()
+        self.assertEqual(
+            [(r['usuario_destino'], r['estado'], r['match_id']) for r in response.data['resultados']],
+            [
+                (ana.id, 'creado', match.id),
+                (bety.id, 'creado', None),
+                (carla.id, 'duplicado', None),
+                (ana.id, 'duplicado', None),
+                (inactiva.id, 'invalido', None),
+                (self.yo.id, 'invalido', None),
+                (999999, 'invalido', None),
+            ]
+        )
+        self.assertEqual(response.data['matches'], 1)
+        self.assertEqual(
+            set(Swipe.objects.filter(usuario_origen=self.yo).values_list('usuario_destino_id', 'tipo')),
+            {(ana.id, 'like'), (bety.id, 'dislike'), (carla.id, 'dislike')}
+        )
+        self.assertEqual(set(obtener_vistos(self.yo.id)), {ana.id, bety.id, carla.id})
+
+    def test_limite_del_lote(self):
+        self.assertEqual(self.lote([]).status_code, 400)
+        swipes = [{'usuario_destino': i + 1, 'tipo': 'like'} for i in range(101)]
+        self.assertEqual(self.lote(swipes).status_code, 400)
+        self.assertEqual(self.lote(swipes[:100]).status_code, 200)
+        self.assertEqual(self.lote([{'usuario_destino': 1, 'tipo': 'otro'}]).status_code, 400)
+
+    def test_reintento_con_clave(self):
+        ana = crear_usuario('ana')
+        Swipe.objects.create(usuario_origen=ana, usuario_destino=self.yo, tipo='like')
+        swipes = {'swipes': [{'usuario_destino': ana.id, 'tipo': 'like'}]}
+        url = '/api/matches/swipe/batch/'
+
+        primera = self.client.post(url, swipes, format='json', HTTP_IDEMPOTENCY_KEY='l-1')
+        repetida = self.client.post(url, swipes, format='json', HTTP_IDEMPOTENCY_KEY='l-1')
+        self.assertEqual(repetida['Idempotent-Replayed'], 'true')
+        self.assertEqual(repetida.data, primera.data)
+        self.assertEqual(repetida.data['resultados'][0]['estado'], 'creado')
+
+        otro = {'swipes': [{'usuario_destino': ana.id, 'tipo': 'dislike'}]}
+        response = self.client.post(url, otro, format='json', HTTP_IDEMPOTENCY_KEY='l-1')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Swipe.objects.filter(usuario_origen=self.yo).count(), 1)
+
+    def test_consultas_fijas(self):
+        otras = [crear_usuario(f'otra{i}') for i in range(12)]
+        for otra in otras[::2]:
+            Swipe.objects.create(usuario_origen=otra, usuario_destino=self.yo, tipo='like')
+        # Crea la fila de vistos fuera de la medición
+        obtener_vistos(self.yo.id)
+
+        # Candado de usuarios + candado de vistos + sus contenedores + destinos
+        # válidos + swipes + contenedores + total de vistos + recíprocos +
+        # matches + leer matches + cambios, entre el savepoint y su release;
+        # igual con 2 swipes (1 match) que con 10 (5 matches)
+        for lote in (otras[:2], otras[2:]):
+            with self.assertNumQueries(1 + 11 + 1):
+                response = self.lote([{'usuario_destino': o.id, 'tipo': 'like'} for o in lote])
+            self.assertEqual(response.data['matches'], len(lote) // 2)
+
+
+class UnificarParesMigracionTests(TransactionTestCase):
+    """0004 deja un solo match por par (el más antiguo) con todos los mensajes"""
+
+    antes = [('matches', '0003_vistosusuario'), ('chat', '0003_initial')]
+    despues = [('matches', '0005_match_par_unico')]
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        self.ultimas = executor.loader.graph.leaf_nodes()
+        executor.migrate(self.antes)
+        self.apps = MigrationExecutor(connection).loader.project_state(self.antes).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(self.ultimas)
+
+    def test_pares_en_ambos_ordenes(self):
+        Usuario = self.apps.get_model('usuarios', 'Usuario')
+        Match = self.apps.get_model('matches', 'Match')
+        Mensaje = self.apps.get_model('chat', 'Mensaje')
+        ana, beto, carla = (
+            Usuario.objects.create(
+                username=nombre, email=f'{nombre}@test.com', url_credencial=f'https://test.com/{nombre}'
+            )
+            for nombre in ('ana', 'beto', 'carla')
+        )
+
+        # El más antiguo del par ana-beto está invertido
+        invertido = Match.objects.create(usuario1=beto, usuario2=ana)
+        ordenado = Match.objects.create(usuario1=ana, usuario2=beto)
+        otro_invertido = Match.objects.create(usuario1=beto, usuario2=ana)
+        unico = Match.objects.create(usuario1=carla, usuario2=ana)
+        for i, match in enumerate((invertido, ordenado, otro_invertido, ordenado)):
+            Mensaje.objects.create(match=match, remitente=ana, contenido=f'm{i}')
+        Mensaje.objects.create(match=unico, remitente=carla, contenido='hola')
+
+        MigrationExecutor(connection).migrate(self.despues)
+        apps = MigrationExecutor(connection).loader.project_state(self.despues).apps
+        Match = apps.get_model('matches', 'Match')
+        Mensaje = apps.get_model('chat', 'Mensaje')
+
+        self.assertEqual(
+            sorted(Match.objects.values_list('id', 'usuario1_id', 'usuario2_id')),
+            [(invertido.id, ana.id, beto.id), (unico.id, ana.id, carla.id)]
+        )
+        self.assertEqual(
+            sorted(Mensaje.objects.filter(match_id=invertido.id).values_list('contenido', flat=True)),
+            ['m0', 'm1', 'm2', 'm3']
+        )
+        self.assertEqual(Mensaje.objects.filter(match_id=unico.id).count(), 1)
+
+
+class VistosPorContenedorMigracionTests(TransactionTestCase):
+    """0011 pasa los conjuntos de vistos a un contenedor por fila"""
+
+    antes = [('matches', '0010_swipe_id_cliente')]
+    despues = [('matches', '0011_vistos_por_contenedor')]
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        self.ultimas = executor.loader.graph.leaf_nodes()
+        executor.migrate(self.antes)
+        self.apps = MigrationExecutor(connection).loader.project_state(self.antes).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(self.ultimas)
+
+    def test_contenedores_desde_swipes(self):
+        Usuario = self.apps.get_model('usuarios', 'Usuario')
+        Swipe = self.apps.get_model('matches', 'Swipe')
+        yo, *otras = (
+            Usuario.objects.create(
+                username=nombre, email=f'{nombre}@test.com', url_credencial=f'https://test.com/{nombre}'
+            )
+            for nombre in ('yo', 'ana', 'bety')
+        )
+        lejana = Usuario.objects.create(
+            id=(1 << 16) + 5, username='lejana', email='lejana@test.com',
+            url_credencial='https://test.com/lejana'
+        )
+        for otra in (*otras, lejana):
+            Swipe.objects.create(usuario_origen=yo, usuario_destino=otra, tipo='like')
+
+        MigrationExecutor(connection).migrate(self.despues)
+        self.assertEqual(VistosUsuario.objects.get(usuario_id=yo.id).total, 3)
+        self.assertEqual(
+            list(ContenedorVistos.objects.order_by('clave').values_list('clave', 'cardinalidad')),
+            [(0, 2), (1, 1)]
+        )
+        self.assertEqual(set(obtener_vistos(yo.id)), {otras[0].id, otras[1].id, lejana.id})
+
+
+class ParUnicoTests(TestCase):
+
+    def setUp(self):
+        self.ana = crear_usuario('ana')
+        self.beto = crear_usuario('beto', genero='hombre')
+
+    def test_restricciones(self):
+        Match.objects.create(usuario1=self.ana, usuario2=self.beto)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Match.objects.create(usuario1=self.beto, usuario2=self.ana)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Match.objects.create(usuario1=self.ana, usuario2=self.beto)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Match.objects.create(usuario1=self.ana, usuario2=self.ana)
+
+    def test_crear_entre_en_ambos_sentidos(self):
+        primero = Match.objects.crear_entre(self.beto.id, self.ana.id)
+        self.assertEqual(Match.objects.crear_entre(self.ana.id, self.beto.id), primero)
+        self.assertEqual(
+            (primero.usuario1_id, primero.usuario2_id), Match.par_canonico(self.ana.id, self.beto.id)
+        )
+        self.assertEqual(Match.objects.count(), 1)
+
+    def test_likes_que_se_ven_mutuamente(self):
+        # Si ambos swipes detectan el like recíproco los dos obtienen el mismo match
+        Swipe.objects.bulk_create([
+            Swipe(usuario_origen=self.ana, usuario_destino=self.beto, tipo='like'),
+            Swipe(usuario_origen=self.beto, usuario_destino=self.ana, tipo='superlike'),
+        ])
+        matches = {swipe.verificar_match() for swipe in Swipe.objects.all()}
+        self.assertEqual(len(matches), 1)
+        self.assertEqual(Match.objects.count(), 1)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class LikesConcurrentesTests(TransactionTestCase):
+
+    def test_likes_mutuos_simultaneos(self):
+        ana = crear_usuario('ana')
+        beto = crear_usuario('beto', genero='hombre')
+        barrera = threading.Barrier(2)
+        resultados = []
+
+        def like(origen, destino):
+            try:
+                barrera.wait()
+                resultados.append(Swipe.objects.create(
+                    usuario_origen=origen, usuario_destino=destino, tipo='like'
+                ).match)
+            finally:
+                connection.close()
+
+        hilos = [
+            threading.Thread(target=like, args=par) for par in ((ana, beto), (beto, ana))
+        ]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(Match.objects.count(), 1)
+        self.assertEqual(len([m for m in resultados if m]), 1)
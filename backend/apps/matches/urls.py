@@ -9,6 +9,7 @@ urlpatterns = [
     
     # Hacer swipe
     path('swipe/', views.SwipeView.as_view(), name='swipe'),
+    path('swipe/batch/', views.SwipeLoteView.as_view(), name='swipe_lote'),
     
     # Mis matches
     path('', views.MisMatchesView.as_view(), name='mis_matches'),
@@ -2,79 +2,59 @@ from rest_framework import status, generics
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Q, Count
+from django.db import transaction
+from django.http import Http404
 
 from .models import Swipe, Match
-from .serializers import SwipeSerializer, MatchSerializer
-from apps.usuarios.models import Usuario
-from apps.usuarios.serializers import UsuarioPerfilSerializer
+from .serializers import SwipeSerializer, SwipeLoteSerializer, MatchSerializer, MatchLigeroSerializer
+from .candidatos import candidatos_elegibles
+from .deck import obtener_deck, descartar_del_deck
+from .vistos import obtener_vistos
+from .paginacion import KeysetPagination
+from apps.usuarios.tarjetas import obtener_tarjetas
+from apps.sincronizacion.models import Cambio
+from cuceimatch.condicional import VersionETagMixin
+from cuceimatch.idempotencia import IdempotenciaMixin
+from apps.chat.models import ContadorNoLeidos
 
 
 class CandidatosView(APIView):
     """
     GET /api/matches/candidatos/
-    Obtiene usuarios candidatos para hacer swipe
+    Obtiene usuarios candidatos para hacer swipe (cabeza del deck precalculado)
     """
     permission_classes = [IsAuthenticated]
+    cantidad = 20
     
     def get(self, request):
         usuario = request.user
         
-        print(f"🔍 Usuario solicitando candidatos: {usuario.email}")
-        
-        # Usuarios que ya vio (hizo swipe)
-        usuarios_vistos_ids = Swipe.objects.filter(
-            usuario_origen=usuario
-        ).values_list('usuario_destino_id', flat=True)
-        
-        print(f"👀 Ya vio a {len(usuarios_vistos_ids)} usuarios")
-        
-        # Obtener géneros que el usuario está buscando
-        generos_buscados = usuario.get_generos_buscados()
-        print(f"💝 Buscando géneros: {generos_buscados}")
-        
-        # Obtener candidatos
-        candidatos = Usuario.objects.filter(
-            verificado=True,
-            activo=True,
-            perfil_completo=True
-        ).exclude(
-            id=usuario.id
-        ).exclude(
-            id__in=usuarios_vistos_ids
-        ).filter(
-            genero__in=generos_buscados
-        ).annotate(
-            num_fotos=Count('fotos')
-        ).filter(
-            num_fotos__gte=1
+        ids = obtener_deck(usuario, self.cantidad)
+        
+        # El deck puede tener ids que dejaron de ser válidos desde que se
+        # generó (cuentas desactivadas, preferencias que cambiaron o swipes
+        # hechos mientras se rellenaba)
+        vistos = obtener_vistos(usuario.id, ids)
+        # La misma consulta trae la versión de cada tarjeta
+        validos = dict(
+            candidatos_elegibles(usuario).filter(
+                id__in=[i for i in ids if i not in vistos]
+            ).values_list('id', 'perfil__fecha_actualizacion')
         )
+        descartados = [i for i in ids if i not in validos]
+        if descartados:
+            descartar_del_deck(usuario.id, descartados)
         
-        print(f"✅ Candidatos encontrados (antes de ordenar): {candidatos.count()}")
-        
-        # Ordenar: usuarios activos recientemente, luego aleatorio
-        candidatos = candidatos.order_by('-ultima_actividad', '?')[:20]
-        
-        print(f"📋 Candidatos finales: {candidatos.count()}")
-        
-        # Verificar que cada candidato tenga fotos
-        for c in candidatos:
-            fotos_count = c.fotos.count()
-            print(f"  - {c.nombre_completo}: {fotos_count} fotos")
-        
-        serializer = UsuarioPerfilSerializer(
-            candidatos,
-            many=True,
-            context={'request': request}
-        )
+        tarjetas = obtener_tarjetas([i for i in ids if i in validos], request, validos)
+        candidatos = [tarjetas[i] for i in ids if i in tarjetas]
         
         return Response({
-            'candidatos': serializer.data,
-            'total': candidatos.count()
+            'candidatos': candidatos,
+            'total': len(candidatos)
         }, status=status.HTTP_200_OK)
 
 
-class SwipeView(generics.CreateAPIView):
+class SwipeView(IdempotenciaMixin, generics.CreateAPIView):
     """
     POST /api/matches/swipe/
     Realiza un swipe (like/dislike)
@@ -82,54 +62,90 @@ class SwipeView(generics.CreateAPIView):
         "usuario_destino": 123,
         "tipo": "like" | "dislike" | "superlike"
     }
+    Header opcional: Idempotency-Key (los reintentos con la misma clave
+    reciben la respuesta original en lugar del error de swipe repetido)
     """
     permission_classes = [IsAuthenticated]
     serializer_class = SwipeSerializer
     
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), 'id_cliente': self.clave_idempotencia}
+    
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         swipe = serializer.save()
         
-        # Verificar si hubo match
-        tiene_match = False
+        # Swipe.save deja el match (si lo hubo) en swipe.match
         match_data = None
-        
-        if swipe.tipo in [Swipe.LIKE, Swipe.SUPER_LIKE]:
-            # Buscar si existe match
-            match = Match.objects.filter(
-                Q(usuario1=request.user, usuario2=swipe.usuario_destino) |
-                Q(usuario1=swipe.usuario_destino, usuario2=request.user)
-            ).first()
-            
-            if match:
-                tiene_match = True
-                match_data = MatchSerializer(
-                    match,
-                    context={'request': request}
-                ).data
+        if swipe.match:
+            match_data = MatchSerializer(
+                swipe.match,
+                context={'request': request}
+            ).data
         
         return Response({
             'swipe': SwipeSerializer(swipe).data,
-            'match': tiene_match,
+            'match': swipe.match is not None,
             'match_data': match_data
         }, status=status.HTTP_201_CREATED)
 
 
-class MisMatchesView(generics.ListAPIView):
+class SwipeLoteView(IdempotenciaMixin, APIView):
+    """
+    POST /api/matches/swipe/batch/
+    Realiza varios swipes en orden con un número fijo de consultas
+    Body: {
+        "swipes": [
+            {"usuario_destino": 123, "tipo": "like" | "dislike" | "superlike"},
+            ...
+        ]
+    }
+    Con Idempotency-Key un reintento recibe la respuesta original. Si la
+    caché ya no la tiene, los swipes que ya se guardaron salen como
+    'duplicado' (el lote no guarda id_cliente por swipe)
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def post(self, request):
+        serializer = SwipeLoteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        resultados = Swipe.crear_lote(
+            request.user,
+            serializer.validated_data['swipes']
+        )
+        
+        return Response({
+            'resultados': resultados,
+            'matches': sum(1 for r in resultados if r['match_id'])
+        }, status=status.HTTP_200_OK)
+
+
+class MisMatchesView(VersionETagMixin, generics.ListAPIView):
     """
     GET /api/matches/
-    Lista todos los matches del usuario
+    Lista todos los matches del usuario, paginados por cursor
+    Query params:
+    - cursor: cursor opaco de la siguiente página (campo `next`)
+    - limit: matches por página (default: 20, máximo: 100)
+    Responde 304 si If-None-Match coincide (no hubo cambios en los matches)
     """
     permission_classes = [IsAuthenticated]
-    serializer_class = MatchSerializer
+    serializer_class = MatchLigeroSerializer
+    pagination_class = KeysetPagination
+    
+    def get_version(self, request):
+        return Match.objects.version_listas(request.user.id)
     
     def get_queryset(self):
         usuario = self.request.user
-        return Match.objects.filter(
-            Q(usuario1=usuario) | Q(usuario2=usuario),
+        return MatchLigeroSerializer.filas(Match.objects.del_usuario(usuario).filter(
             activo=True
-        ).order_by('-ultimo_mensaje', '-fecha')
+        ).order_by('-ultimo_mensaje', '-id'))
+    
+    def get_ramas(self, queryset):
+        return queryset.por_participante(self.request.user)
 
 
 class MatchDetalleView(generics.RetrieveAPIView):
@@ -140,12 +156,13 @@ class MatchDetalleView(generics.RetrieveAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = MatchSerializer
     
-    def get_queryset(self):
-        usuario = self.request.user
-        return Match.objects.filter(
-            Q(usuario1=usuario) | Q(usuario2=usuario),
-            activo=True
-        )
+    def get_object(self):
+        try:
+            return Match.objects.obtener_de_usuario(
+                self.request.user, self.kwargs['pk'], activo=True
+            )
+        except Match.DoesNotExist:
+            raise Http404
 
 
 class EliminarMatchView(APIView):
@@ -157,19 +174,29 @@ class EliminarMatchView(APIView):
     
     def delete(self, request, pk):
         try:
-            match = Match.objects.get(
-                Q(usuario1=request.user) | Q(usuario2=request.user),
-                pk=pk
-            )
+            match = Match.objects.obtener_de_usuario(request.user, pk)
         except Match.DoesNotExist:
             return Response(
                 {'error': 'Match no encontrado'},
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        # Marcar como inactivo en lugar de eliminar
-        match.activo = False
-        match.save()
+        # Marcar como inactivo en lugar de eliminar (solo ese campo, para no
+        # pisar el resumen de mensajes que se actualiza con UPDATEs)
+        with transaction.atomic():
+            fila = Match.objects.select_for_update().filter(pk=match.pk).values(
+                'activo', 'no_leidos_usuario1', 'no_leidos_usuario2'
+            ).get()
+            if fila['activo']:
+                match.activo = False
+                match.save(update_fields=['activo'])
+                Cambio.registrar_matches([match])
+                # Los no leídos de un match inactivo ya no cuentan en el badge
+                for usuario_id, no_leidos in (
+                    (match.usuario1_id, fila['no_leidos_usuario1']),
+                    (match.usuario2_id, fila['no_leidos_usuario2']),
+                ):
+                    ContadorNoLeidos.descontar(usuario_id, no_leidos, 1 if no_leidos else 0)
         
         return Response(
             {'message': 'Match eliminado exitosamente'},
@@ -0,0 +1,227 @@
+"""
+Conjunto compacto de usuarios vistos (a los que ya se les hizo swipe).
+
+Se guarda como un bitmap estilo roaring: los ids se agrupan por sus 16 bits
+altos y cada grupo se guarda como un arreglo ordenado de uint16 mientras
+tenga pocos elementos, o como un bitmap de 8 KB cuando crece. Es exacto
+(sin falsos positivos) y ocupa ~2 bytes por id en el peor caso.
+
+Cada grupo (contenedor) es una fila de ContenedorVistos: un swipe solo lee
+y vuelve a escribir el contenedor de su destino (a lo más 8 KB), sin
+importar cuántos ids haya visto el usuario, y para preguntar por unos
+cuantos ids solo se cargan sus contenedores.
+"""
+from array import array
+from bisect import bisect_left
+
+from django.db import transaction
+
+from .models import Swipe, VistosUsuario, ContenedorVistos
+
+# Un contenedor de arreglo pasa a bitmap al superar este número de elementos
+# (a partir de aquí el bitmap de 8 KB ocupa menos). Los contenedores nunca
+# se achican, así que la cardinalidad guardada indica el tipo
+LIMITE_ARREGLO = 4096
+TAMANO_BITMAP = 1 << 13
+
+
+class ConjuntoVistos:
+    """
+    Conjunto exacto de ids enteros no negativos
+    """
+
+    def __init__(self, ids=()):
+        # clave (16 bits altos) -> array('H') ordenado o bytearray de 8 KB
+        self._contenedores = {}
+        self._total = 0
+        # Contenedores cambiados y ids agregados desde que se cargó
+        self._modificados = set()
+        self.agregados = 0
+        self.update(ids)
+
+    def __len__(self):
+        return self._total
+
+    def __contains__(self, id_):
+        contenedor = self._contenedores.get(id_ >> 16)
+        if contenedor is None:
+            return False
+        bajo = id_ & 0xFFFF
+        if isinstance(contenedor, bytearray):
+            return bool(contenedor[bajo >> 3] & (1 << (bajo & 7)))
+        i = bisect_left(contenedor, bajo)
+        return i < len(contenedor) and contenedor[i] == bajo
+
+    def __iter__(self):
+        for clave in sorted(self._contenedores):
+            base = clave << 16
+            contenedor = self._contenedores[clave]
+            if isinstance(contenedor, bytearray):
+                for byte_i, byte in enumerate(contenedor):
+                    if byte:
+                        for bit in range(8):
+                            if byte & (1 << bit):
+                                yield base | (byte_i << 3) | bit
+            else:
+                for bajo in contenedor:
+                    yield base | bajo
+
+    def add(self, id_):
+        """Agrega un id; retorna True si no estaba"""
+        clave, bajo = id_ >> 16, id_ & 0xFFFF
+        contenedor = self._contenedores.get(clave)
+
+        if contenedor is None:
+            self._contenedores[clave] = array('H', [bajo])
+        elif isinstance(contenedor, bytearray):
+            mascara = 1 << (bajo & 7)
+            if contenedor[bajo >> 3] & mascara:
+                return False
+            contenedor[bajo >> 3] |= mascara
+        else:
+            i = bisect_left(contenedor, bajo)
+            if i < len(contenedor) and contenedor[i] == bajo:
+                return False
+            contenedor.insert(i, bajo)
+            if len(contenedor) > LIMITE_ARREGLO:
+                self._contenedores[clave] = self._a_bitmap(contenedor)
+
+        self._total += 1
+        self.agregados += 1
+        self._modificados.add(clave)
+        return True
+
+    def update(self, ids):
+        for id_ in ids:
+            self.add(id_)
+
+    @staticmethod
+    def _a_bitmap(arreglo):
+        bitmap = bytearray(TAMANO_BITMAP)
+        for bajo in arreglo:
+            bitmap[bajo >> 3] |= 1 << (bajo & 7)
+        return bitmap
+
+    def contenedores(self, solo_modificados=False):
+        """
+        [(clave, cardinalidad, bytes)] de cada contenedor (o solo de los que
+        cambiaron desde que se cargó) para guardarlos en ContenedorVistos
+        """
+        claves = self._modificados if solo_modificados else self._contenedores
+        filas = []
+        for clave in sorted(claves):
+            contenedor = self._contenedores[clave]
+            if isinstance(contenedor, bytearray):
+                cardinalidad = int.from_bytes(contenedor, 'little').bit_count()
+                filas.append((clave, cardinalidad, bytes(contenedor)))
+            else:
+                filas.append((clave, len(contenedor), contenedor.tobytes()))
+        return filas
+
+    @classmethod
+    def desde_contenedores(cls, filas):
+        """Reconstruye el conjunto (o la parte cargada) a partir de `contenedores`"""
+        conjunto = cls()
+        for clave, cardinalidad, datos in filas:
+            if cardinalidad > LIMITE_ARREGLO:
+                conjunto._contenedores[clave] = bytearray(datos)
+            else:
+                arreglo = array('H')
+                arreglo.frombytes(bytes(datos))
+                conjunto._contenedores[clave] = arreglo
+            conjunto._total += cardinalidad
+        return conjunto
+
+
+def _cargar(usuario_id, ids=None):
+    filas = ContenedorVistos.objects.filter(vistos_id=usuario_id)
+    if ids is not None:
+        filas = filas.filter(clave__in={id_ >> 16 for id_ in ids})
+    return ConjuntoVistos.desde_contenedores(
+        filas.values_list('clave', 'cardinalidad', 'datos')
+    )
+
+
+def obtener_vistos(usuario_id, ids=None):
+    """
+    Retorna el ConjuntoVistos del usuario. Con `ids` solo se cargan los
+    contenedores necesarios para preguntar por esos ids. Si el conjunto
+    todavía no existe se construye desde la tabla de swipes.
+    """
+    conjunto = _cargar(usuario_id, ids)
+    if ids is None and not len(conjunto) and not VistosUsuario.objects.filter(
+        usuario_id=usuario_id
+    ).exists():
+        return reconstruir_vistos(usuario_id)
+    return conjunto
+
+
+def reconstruir_vistos(usuario_id):
+    """Reconstruye y guarda el conjunto de vistos desde la tabla de swipes"""
+    conjunto = ConjuntoVistos(
+        Swipe.objects.filter(
+            usuario_origen_id=usuario_id
+        ).values_list('usuario_destino_id', flat=True).iterator()
+    )
+    with transaction.atomic():
+        fila, _ = VistosUsuario.objects.update_or_create(
+            usuario_id=usuario_id, defaults={'total': len(conjunto)}
+        )
+        fila.contenedores.all().delete()
+        ContenedorVistos.objects.bulk_create([
+            ContenedorVistos(vistos=fila, clave=clave, cardinalidad=cardinalidad, datos=datos)
+            for clave, cardinalidad, datos in conjunto.contenedores()
+        ])
+    conjunto._modificados.clear()
+    conjunto.agregados = 0
+    return conjunto
+
+
+def bloquear_vistos(usuario_id, ids=None):
+    """
+    Bloquea (select_for_update) la fila de vistos del usuario y retorna
+    (fila, conjunto), con solo los contenedores de `ids` si se dan. Debe
+    llamarse dentro de una transacción; serializa los swipes concurrentes
+    de un mismo usuario.
+    """
+    fila = VistosUsuario.objects.select_for_update().filter(
+        usuario_id=usuario_id
+    ).first()
+    if fila is None:
+        reconstruir_vistos(usuario_id)
+        fila = VistosUsuario.objects.select_for_update().get(usuario_id=usuario_id)
+    return fila, _cargar(usuario_id, ids)
+
+
+def guardar_vistos(fila, conjunto):
+    """
+    Guarda en la fila obtenida con `bloquear_vistos` solo los contenedores
+    que cambiaron y el nuevo total
+    """
+    ContenedorVistos.objects.bulk_create(
+        [
+            ContenedorVistos(vistos=fila, clave=clave, cardinalidad=cardinalidad, datos=datos)
+            for clave, cardinalidad, datos in conjunto.contenedores(solo_modificados=True)
+        ],
+        update_conflicts=True,
+        unique_fields=['vistos', 'clave'],
+        update_fields=['cardinalidad', 'datos']
+    )
+    fila.total += conjunto.agregados
+    fila.save(update_fields=['total', 'fecha_actualizacion'])
+
+
+def registrar_vistos(usuario_id, destino_ids):
+    """
+    Agrega ids al conjunto de vistos del usuario (se llama al guardar swipes).
+
+    Solo se leen y se vuelven a escribir los contenedores de los destinos
+    (a lo más 8 KB cada uno) bajo el candado de la fila. Es el mismo candado
+    que serializa los swipes del usuario, así que no agrega contención entre
+    usuarios.
+    """
+    with transaction.atomic():
+        fila, conjunto = bloquear_vistos(usuario_id, destino_ids)
+        conjunto.update(destino_ids)
+        if conjunto.agregados:
+            guardar_vistos(fila, conjunto)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Perfil, Foto
+from .models import Perfil, Foto, ArchivoMedia
 
 
 class FotoInline(admin.TabularInline):
@@ -74,11 +74,25 @@ class FotoAdmin(admin.ModelAdmin):
     ]
     list_filter = ['es_principal', 'fecha_subida']
     search_fields = ['usuario__nombre_completo', 'usuario__email']
-    readonly_fields = ['fecha_subida', 'ver_imagen']
+    readonly_fields = ['fecha_subida', 'ver_imagen', 'ancho', 'alto', 'variantes']
     
     def ver_imagen(self, obj):
         if obj.imagen:
             return f'<img src="{obj.imagen.url}" width="100" />'
         return '-'
     ver_imagen.allow_tags = True
-    ver_imagen.short_description = 'Preview'
\ No newline at end of file
+    ver_imagen.short_description = 'Preview'
+
+
+@admin.register(ArchivoMedia)
+class ArchivoMediaAdmin(admin.ModelAdmin):
+    """
+    Admin para los archivos guardados por contenido (solo lectura: las
+    referencias las lleva ContenidoStorage)
+    """
+    list_display = ['ruta', 'referencias', 'tamano', 'fecha_creacion']
+    search_fields = ['ruta']
+    readonly_fields = ['ruta', 'referencias', 'tamano', 'fecha_creacion']
+    
+    def has_add_permission(self, request):
+        return False
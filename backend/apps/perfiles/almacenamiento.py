@@ -0,0 +1,116 @@
+"""
+Almacenamiento de las fotos por contenido.
+
+El nombre de cada archivo es el SHA-256 de sus bytes, repartido en dos
+niveles de directorios con los primeros caracteres del hash
+(`fotos_perfil/ab/cd/abcd…f0.jpg`) para que ningún directorio crezca sin
+límite. El mismo contenido subido dos veces (o por dos usuarios) se guarda
+una sola vez: ArchivoMedia lleva cuántas referencias (fotos y variantes) lo
+usan. `save` suma una referencia y `delete` la quita; el archivo se borra
+cuando ya nadie lo usa. Los archivos anteriores a este almacenamiento no
+tienen ArchivoMedia y se borran directamente.
+
+Como el nombre cambia con el contenido, la URL de un archivo nunca cambia
+de contenido y cuceimatch.media la entrega con caché inmutable. Con
+MEDIA_PRIVADA las URLs salen firmadas. manage.py migrar_media mueve los
+archivos anteriores y recalcula las referencias.
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+from cuceimatch.media import url_firmada
+
+NIVELES = 2
+PATRON_CONTENIDO = re.compile(r'^(?:[^/]+/)?(?:[0-9a-f]{2}/){%d}[0-9a-f]{64}(?:\.\w+)?$' % NIVELES)
+
+
+def es_por_contenido(nombre):
+    """Si el nombre ya es de un archivo guardado por contenido"""
+    return bool(nombre and PATRON_CONTENIDO.match(nombre))
+
+
+@deconstructible
+class ContenidoStorage(FileSystemStorage):
+
+    def nombre_por_contenido(self, nombre, digest):
+        """Prefijo del nombre original (el upload_to) + directorios + hash + extensión"""
+        prefijo = nombre.split('/', 1)[0] if '/' in nombre else ''
+        extension = os.path.splitext(nombre)[1].lower()
+        partes = [prefijo] + [digest[i * 2:i * 2 + 2] for i in range(NIVELES)]
+        return '/'.join(p for p in partes if p) + f'/{digest}{extension}'
+
+    def url(self, name):
+        url = super().url(name)
+        if settings.MEDIA_PRIVADA:
+            return url_firmada(name, url)
+        return url
+
+    def get_available_name(self, name, max_length=None):
+        # El nombre definitivo sale del contenido en _save; si ya existe es
+        # el mismo archivo y se reutiliza
+        return name
+
+    def _save(self, name, content):
+        from .models import ArchivoMedia
+
+        # Se escribe a un temporal calculando el hash en la misma pasada
+        os.makedirs(self.location, exist_ok=True)
+        descriptor, temporal = tempfile.mkstemp(dir=self.location, prefix='.subida-')
+        try:
+            digest = hashlib.sha256()
+            tamano = 0
+            with os.fdopen(descriptor, 'wb') as archivo:
+                for bloque in content.chunks():
+                    digest.update(bloque)
+                    archivo.write(bloque)
+                    tamano += len(bloque)
+            nombre = self.nombre_por_contenido(name, digest.hexdigest())
+            ruta = self.path(nombre)
+
+            with transaction.atomic():
+                registro, creado = ArchivoMedia.objects.select_for_update().get_or_create(
+                    ruta=nombre, defaults={'tamano': tamano, 'referencias': 1}
+                )
+                if not creado:
+                    ArchivoMedia.objects.filter(pk=registro.pk).update(
+                        referencias=F('referencias') + 1
+                    )
+                if creado or not os.path.exists(ruta):
+                    os.makedirs(
+                        os.path.dirname(ruta), exist_ok=True,
+                        mode=self.directory_permissions_mode or 0o777
+                    )
+                    os.chmod(temporal, self.file_permissions_mode or 0o644)
+                    os.replace(temporal, ruta)
+        finally:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+        return nombre
+
+    def delete(self, name):
+        """Quita una referencia; el archivo se borra con la última"""
+        from .models import ArchivoMedia
+
+        if not name:
+            return
+        with transaction.atomic():
+            registro = ArchivoMedia.objects.select_for_update().filter(ruta=name).first()
+            if registro is None:
+                # Archivo anterior al almacenamiento por contenido
+                super().delete(name)
+                return
+            if registro.referencias > 1:
+                ArchivoMedia.objects.filter(pk=registro.pk).update(
+                    referencias=F('referencias') - 1
+                )
+                return
+            registro.delete()
+            super().delete(name)
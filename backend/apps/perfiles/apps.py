@@ -4,4 +4,7 @@ from django.apps import AppConfig
 class PerfilesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.perfiles'
-    verbose_name = 'Perfiles'
\ No newline at end of file
+    verbose_name = 'Perfiles'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,211 @@
+"""
+Procesamiento de las fotos de perfil.
+
+Al subirla (FotoSerializer), antes de guardar nada, el original se vuelve a
+codificar como JPEG sin metadatos (EXIF con ubicación, cámara...), con la
+orientación ya aplicada y a lo más LADO_MAXIMO px por lado: el archivo con
+el EXIF nunca llega al storage ni a `imagen_url`. Sus medidas quedan en la
+Foto (`ancho`, `alto`).
+
+De ahí salen las variantes de VARIANTES, recortadas al tamaño exacto, en
+WebP y JPEG. Sus rutas se guardan en `variantes` y FotoSerializer expone las
+URLs para que el cliente pida solo el tamaño que va a mostrar. Las variantes
+se generan en un pool de hilos después del commit (en línea con
+FOTOS_PROCESAMIENTO_ASINCRONO=False); mientras tanto el cliente usa
+`imagen_url`. manage.py procesar_fotos procesa las que falten, y limpia
+también el original de las fotos subidas antes (sin `ancho`).
+"""
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# nombre: (ancho, alto)
+VARIANTES = {
+    'tarjeta': (720, 960),
+    'miniatura': (320, 320),
+    'avatar': (96, 96),
+}
+
+# formato: (extensión, formato de Pillow, opciones)
+FORMATOS = {
+    'webp': ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+LADO_MAXIMO = 2048
+CALIDAD_ORIGINAL = 90
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.FOTOS_WORKERS, thread_name_prefix='fotos'
+)
+
+
+def abrir(archivo):
+    """Imagen RGB con la orientación del EXIF aplicada"""
+    imagen = Image.open(archivo)
+    # En JPEG decodifica directamente a una escala menor (mucho más rápido)
+    imagen.draft('RGB', (LADO_MAXIMO, LADO_MAXIMO))
+    imagen = ImageOps.exif_transpose(imagen)
+    if imagen.mode in ('RGBA', 'LA', 'P'):
+        # La transparencia queda sobre fondo blanco
+        imagen = imagen.convert('RGBA')
+        fondo = Image.new('RGB', imagen.size, 'white')
+        fondo.paste(imagen, mask=imagen.getchannel('A'))
+        return fondo
+    return imagen.convert('RGB')
+
+
+def codificar(imagen, formato, **opciones):
+    _, formato_pil, por_defecto = FORMATOS[formato]
+    salida = io.BytesIO()
+    # Sin exif= Pillow no escribe metadatos
+    imagen.save(salida, formato_pil, **{**por_defecto, **opciones})
+    return salida.getvalue()
+
+
+def limpiar_original(archivo):
+    """
+    (ContentFile, (ancho, alto)) con el original recodificado sin
+    metadatos, listo para guardarse en lugar del archivo subido
+    """
+    imagen = abrir(archivo)
+    imagen.thumbnail((LADO_MAXIMO, LADO_MAXIMO), Image.LANCZOS)
+    nombre = os.path.splitext(os.path.basename(archivo.name))[0] + '.jpg'
+    datos = codificar(imagen, 'jpeg', quality=CALIDAD_ORIGINAL)
+    return ContentFile(datos, name=nombre), imagen.size
+
+
+def generar_variantes(imagen):
+    """{nombre: {formato: bytes}} recortando la imagen a cada tamaño"""
+    variantes = {}
+    for nombre, tamano in VARIANTES.items():
+        recorte = ImageOps.fit(imagen, tamano, Image.LANCZOS)
+        variantes[nombre] = {formato: codificar(recorte, formato) for formato in FORMATOS}
+    return variantes
+
+
+def procesar_foto(foto):
+    """
+    Genera las variantes (y, si la foto no se limpió al subirla, reemplaza
+    el original por uno sin metadatos). Si la foto se borró o se cambió su
+    imagen mientras tanto, se descarta lo generado. Retorna True si se
+    guardó.
+    """
+    from .models import Foto
+
+    storage = foto.imagen.storage
+    anterior = foto.imagen.name
+    with foto.imagen.open('rb') as archivo:
+        imagen = abrir(archivo)
+    imagen.thumbnail((LADO_MAXIMO, LADO_MAXIMO), Image.LANCZOS)
+
+    base = os.path.splitext(anterior)[0]
+    original = anterior
+    nuevos = []
+    if foto.ancho is None:
+        original = storage.save(f'{base}.jpg', ContentFile(
+            codificar(imagen, 'jpeg', quality=CALIDAD_ORIGINAL)
+        ))
+        nuevos.append(original)
+    variantes = {}
+    for nombre, por_formato in generar_variantes(imagen).items():
+        ancho, alto = VARIANTES[nombre]
+        variantes[nombre] = {'ancho': ancho, 'alto': alto}
+        for formato, datos in por_formato.items():
+            ruta = storage.save(f'{base}_{nombre}.{FORMATOS[formato][0]}', ContentFile(datos))
+            variantes[nombre][formato] = ruta
+            nuevos.append(ruta)
+
+    with transaction.atomic():
+        actual = Foto.objects.select_for_update().filter(pk=foto.pk).first()
+        if actual is None or actual.imagen.name != anterior:
+            transaction.on_commit(lambda: _borrar(storage, nuevos))
+            return False
+        viejos = rutas_variantes(actual.variantes)
+        if original != anterior:
+            viejos.append(anterior)
+        actual.imagen.name = original
+        actual.ancho, actual.alto = imagen.size
+        actual.variantes = variantes
+        actual.save(update_fields=['imagen', 'ancho', 'alto', 'variantes'])
+        transaction.on_commit(lambda: _borrar(storage, viejos))
+
+    foto.imagen.name = actual.imagen.name
+    foto.ancho, foto.alto, foto.variantes = actual.ancho, actual.alto, actual.variantes
+    return True
+
+
+def _procesar_en_segundo_plano(foto_id):
+    from .models import Foto
+
+    try:
+        foto = Foto.objects.filter(pk=foto_id).first()
+        if foto is not None:
+            procesar_foto(foto)
+    except Exception:
+        logger.exception('Error procesando la foto %s', foto_id)
+    finally:
+        close_old_connections()
+
+
+def programar_procesamiento(foto):
+    """Procesa la foto en el pool al confirmar la transacción (o en línea)"""
+    if settings.FOTOS_PROCESAMIENTO_ASINCRONO:
+        foto_id = foto.pk
+        transaction.on_commit(lambda: _executor.submit(_procesar_en_segundo_plano, foto_id))
+    else:
+        procesar_foto(foto)
+
+
+def rutas_variantes(variantes):
+    return [
+        variante[formato]
+        for variante in (variantes or {}).values()
+        for formato in FORMATOS
+        if variante.get(formato)
+    ]
+
+
+def liberar_archivos(foto):
+    """
+    Suelta el original y las variantes de la foto al confirmar la
+    transacción (ContenidoStorage los borra si ya nadie más los usa). Al
+    borrar una foto lo llama apps.perfiles.signals
+    """
+    storage = foto.imagen.storage
+    rutas = [foto.imagen.name] if foto.imagen.name else []
+    rutas += rutas_variantes(foto.variantes)
+    transaction.on_commit(lambda: _borrar(storage, rutas))
+
+
+def _borrar(storage, rutas):
+    for ruta in rutas:
+        try:
+            storage.delete(ruta)
+        except OSError:
+            logger.warning('No se pudo borrar %s', ruta)
+
+
+def urls_variantes(variantes, request=None):
+    """
+    {nombre: {'ancho', 'alto', 'webp', 'jpeg'}} con las URLs (absolutas si
+    hay request); vacío mientras la foto no se procesa
+    """
+    from .models import Foto
+
+    url = Foto._meta.get_field('imagen').storage.url
+    resultado = {}
+    for nombre, variante in (variantes or {}).items():
+        resultado[nombre] = {'ancho': variante['ancho'], 'alto': variante['alto']}
+        for formato in FORMATOS:
+            ruta = url(variante[formato])
+            resultado[nombre][formato] = request.build_absolute_uri(ruta) if request else ruta
+    return resultado
@@ -0,0 +1,122 @@
+from collections import Counter
+from functools import partial
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from apps.perfiles.almacenamiento import es_por_contenido
+from apps.perfiles.imagenes import rutas_variantes
+from apps.perfiles.models import Foto, ArchivoMedia
+
+
+class Command(BaseCommand):
+    """
+    Pasa las fotos (y variantes) guardadas con el nombre original al
+    almacenamiento por contenido (apps.perfiles.almacenamiento): los
+    archivos iguales quedan en uno solo. Al final recalcula las referencias
+    de ArchivoMedia desde las fotos y borra los archivos que ya nadie usa.
+
+    Debe correr con las escrituras de fotos detenidas (sin subidas ni
+    trabajos de apps.perfiles.imagenes pendientes): un archivo guardado
+    cuya Foto todavía no se guarda parece sin uso. Como resguardo no se
+    tocan los ArchivoMedia creados después de iniciar el comando, pero un
+    archivo ya registrado que otra subida reutiliza en ese momento puede
+    quedar con una referencia de menos.
+
+    Uso: python manage.py migrar_media [--simular]
+    """
+    help = 'Mueve la media al almacenamiento por contenido y recalcula las referencias'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--simular',
+            action='store_true',
+            help='Solo reportar cuántos archivos se moverían'
+        )
+
+    def handle(self, *args, **options):
+        inicio = timezone.now()
+        storage = Foto._meta.get_field('imagen').storage
+        movidos = faltantes = 0
+        anteriores = set()
+
+        for foto in Foto.objects.order_by('id').iterator(chunk_size=100):
+            cambios = {}
+            for ruta in [foto.imagen.name] + rutas_variantes(foto.variantes):
+                if not ruta or es_por_contenido(ruta) or ruta in cambios:
+                    continue
+                if not storage.exists(ruta):
+                    faltantes += 1
+                    self.stderr.write(f'Foto {foto.id}: no existe {ruta}')
+                    continue
+                movidos += 1
+                if options['simular']:
+                    continue
+                with storage.open(ruta) as archivo:
+                    cambios[ruta] = storage.save(ruta, archivo)
+            if not cambios:
+                continue
+
+            foto.imagen.name = cambios.get(foto.imagen.name, foto.imagen.name)
+            for variante in foto.variantes.values():
+                for formato, ruta in variante.items():
+                    if ruta in cambios:
+                        variante[formato] = cambios[ruta]
+            foto.save(update_fields=['imagen', 'variantes'])
+            anteriores.update(cambios)
+
+        if options['simular']:
+            self.stdout.write(f'{movidos} archivos por mover ({faltantes} no existen)')
+            return
+
+        # Se borran al final por si dos fotos apuntaban al mismo archivo
+        for ruta in anteriores:
+            storage.delete(ruta)
+
+        corregidos, borrados = self._recontar(storage, inicio)
+        self.stdout.write(self.style.SUCCESS(
+            f'{movidos} archivos movidos ({faltantes} no existen), '
+            f'{corregidos} referencias corregidas, {borrados} archivos sin uso borrados'
+        ))
+
+    def _recontar(self, storage, inicio):
+        """
+        Ajusta ArchivoMedia a las referencias reales de las fotos, salvo los
+        registros creados desde `inicio` (subidas en curso)
+        """
+        reales = Counter()
+        for imagen, variantes in Foto.objects.values_list('imagen', 'variantes').iterator():
+            for ruta in [imagen] + rutas_variantes(variantes):
+                if es_por_contenido(ruta):
+                    reales[ruta] += 1
+
+        corregidos = borrados = 0
+        with transaction.atomic():
+            registros = ArchivoMedia.objects.select_for_update().filter(fecha_creacion__lt=inicio)
+            for registro in registros.iterator():
+                esperado = reales.pop(registro.ruta, 0)
+                if esperado == registro.referencias:
+                    continue
+                corregidos += 1
+                if esperado:
+                    registro.referencias = esperado
+                    registro.save(update_fields=['referencias'])
+                else:
+                    # El archivo se borra al confirmar: si el bloque se
+                    # revierte, el registro vuelve y el archivo sigue ahí
+                    registro.delete()
+                    transaction.on_commit(partial(storage.delete, registro.ruta))
+                    borrados += 1
+
+            # Archivos por contenido que existen pero no estaban registrados
+            recientes = set(ArchivoMedia.objects.filter(
+                fecha_creacion__gte=inicio
+            ).values_list('ruta', flat=True))
+            for ruta, referencias in reales.items():
+                if ruta not in recientes and storage.exists(ruta):
+                    ArchivoMedia.objects.create(
+                        ruta=ruta, referencias=referencias, tamano=storage.size(ruta)
+                    )
+                    corregidos += 1
+        return corregidos, borrados
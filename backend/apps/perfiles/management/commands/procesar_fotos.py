@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.perfiles.imagenes import procesar_foto
+from apps.perfiles.models import Foto
+
+
+class Command(BaseCommand):
+    """
+    Procesa las fotos que no tienen variantes (subidas antes de
+    apps.perfiles.imagenes o cuyo procesamiento falló): original sin EXIF,
+    medidas y variantes en WebP y JPEG.
+
+    Uso: python manage.py procesar_fotos [--todas]
+    """
+    help = 'Genera las variantes de las fotos de perfil'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--todas', action='store_true',
+            help='Volver a procesar también las que ya tienen variantes'
+        )
+
+    def handle(self, *args, **options):
+        fotos = Foto.objects.order_by('id')
+        if not options['todas']:
+            fotos = fotos.filter(variantes={})
+
+        procesadas = errores = 0
+        inicio = time.perf_counter()
+        for foto in fotos.iterator(chunk_size=100):
+            try:
+                if procesar_foto(foto):
+                    procesadas += 1
+            except Exception as error:
+                errores += 1
+                self.stderr.write(f'Foto {foto.id}: {error}')
+
+        segundos = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f'{procesadas} fotos procesadas en {segundos:.1f} s ({errores} con error)'
+        ))
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:10
+
+from django.db import migrations, models
+
+
+# Copia del catálogo al crear la migración (apps.perfiles.models puede
+# cambiar después sin que cambie lo que calcula esta migración). 'MangaMemes'
+# es como quedó en el catálogo por la coma que faltaba entre los dos
+INTERESES = [
+    'Deportes', 'Música', 'Cine', 'Series', 'Videojuegos', 'Lectura', 'Arte',
+    'Fotografía', 'Viajes', 'Cocina', 'Fitness', 'Yoga', 'Pilates', 'Baile',
+    'Tecnología', 'Programación', 'Ciencia', 'Naturaleza', 'Mascotas', 'Café',
+    'Fiesta', 'Anime', 'MangaMemes', 'Ajedrez',
+]
+INDICE_INTERESES = {interes: i for i, interes in enumerate(INTERESES)}
+
+
+def codificar_intereses(intereses):
+    mascara = 0
+    for interes in intereses or []:
+        indice = INDICE_INTERESES.get(interes)
+        if indice is not None:
+            mascara |= 1 << indice
+    return mascara
+
+
+def calcular_mascaras(apps, schema_editor):
+    Perfil = apps.get_model('perfiles', 'Perfil')
+    perfiles = list(Perfil.objects.only('id', 'intereses'))
+    for perfil in perfiles:
+        perfil.intereses_mascara = codificar_intereses(perfil.intereses)
+    Perfil.objects.bulk_update(perfiles, ['intereses_mascara'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('perfiles', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='perfil',
+            name='intereses_mascara',
+            field=models.BigIntegerField(default=0, editable=False, help_text='Se calcula al guardar a partir de intereses'),
+        ),
+        migrations.RunPython(calcular_mascaras, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('perfiles', '0003_perfil_intereses_mascara'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='foto',
+            name='alto',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='foto',
+            name='ancho',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='foto',
+            name='variantes',
+            field=models.JSONField(blank=True, default=dict, help_text='Rutas de las variantes por tamaño y formato'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:14
+
+import apps.perfiles.almacenamiento
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('perfiles', '0004_foto_variantes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivoMedia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ruta', models.CharField(max_length=255, unique=True)),
+                ('referencias', models.PositiveIntegerField(default=0)),
+                ('tamano', models.PositiveBigIntegerField(help_text='Bytes')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Archivo de media',
+                'verbose_name_plural': 'Archivos de media',
+            },
+        ),
+        migrations.AlterField(
+            model_name='foto',
+            name='imagen',
+            field=models.ImageField(help_text='Foto del perfil', storage=apps.perfiles.almacenamiento.ContenidoStorage(), upload_to='fotos_perfil/'),
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
+from django.utils import timezone
 from apps.usuarios.models import Usuario
 from django.core.validators import MinValueValidator, MaxValueValidator
+from .almacenamiento import ContenidoStorage
 
 # Create your models here.
 class Perfil(models.Model):
@@ -23,6 +25,13 @@ class Perfil(models.Model):
         help_text="Lista de intereses : ['deportes', 'música', 'cine', ...]"
     )
 
+    #Intereses codificados como bitmask (bit i = INTERESES_DISPONIBLES[i]) para el ranking de candidatos
+    intereses_mascara = models.BigIntegerField(
+        default=0,
+        editable=False,
+        help_text="Se calcula al guardar a partir de intereses"
+    )
+
     #Preferencia de distancia para futuras funcionalidades
     distancia_maxima = models.IntegerField(
         default = 50,
@@ -54,6 +63,35 @@ class Perfil(models.Model):
     def __str__(self):
         return f"Perfil de {self.usuario.nombre_completo}"
     
+    def save(self, *args, **kwargs):
+        """
+        Mantener intereses_mascara sincronizada con intereses
+        """
+        self.intereses_mascara = codificar_intereses(self.intereses)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            # fecha_actualizacion es la versión del perfil (ETag de MiPerfilView)
+            update_fields = set(update_fields) | {'fecha_actualizacion'}
+            if 'intereses' in update_fields:
+                update_fields.add('intereses_mascara')
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+    
+    @classmethod
+    def tocar(cls, usuario_id):
+        """
+        Cambia la versión del perfil cuando cambia algo que se muestra con él
+        (fotos o datos del usuario) sin guardar el perfil completo
+        """
+        cls.objects.filter(usuario_id=usuario_id).update(fecha_actualizacion=timezone.now())
+    
+    @classmethod
+    def version_de(cls, usuario_id):
+        """fecha_actualizacion del perfil del usuario (None si no tiene)"""
+        return cls.objects.filter(usuario_id=usuario_id).values_list(
+            'fecha_actualizacion', flat=True
+        ).first()
+    
 class Foto(models.Model):
     """
     Fotos del perfil del usuario
@@ -66,7 +104,8 @@ class Foto(models.Model):
     )
 
     imagen = models.ImageField(
-        upload_to='fotos_perfil/%Y/%m/', #las fotos se guardarán en una carpeta llamada fotos_perfil, y además se organizarán por año (%Y) y mes (%m).
+        upload_to='fotos_perfil/',  # El nombre y los subdirectorios salen del contenido (ContenidoStorage)
+        storage=ContenidoStorage(),
         help_text="Foto del perfil"
     )
 
@@ -82,6 +121,15 @@ class Foto(models.Model):
 
     fecha_subida = models.DateTimeField(auto_now_add=True)
 
+    # Los llena apps.perfiles.imagenes al procesar la foto
+    ancho = models.PositiveIntegerField(null=True, blank=True)
+    alto = models.PositiveIntegerField(null=True, blank=True)
+    variantes = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Rutas de las variantes por tamaño y formato"
+    )
+
     class Meta:
         verbose_name = 'Foto'
         verbose_name_plural = 'Fotos'
@@ -108,8 +156,27 @@ class Foto(models.Model):
             self.orden = 0
         
         super().save(*args, **kwargs)
-    
-    # Lista de intereses predefinidos
+
+
+class ArchivoMedia(models.Model):
+    """
+    Archivo guardado por contenido (apps.perfiles.almacenamiento) y cuántas
+    referencias (fotos o variantes) lo usan
+    """
+    ruta = models.CharField(max_length=255, unique=True)
+    referencias = models.PositiveIntegerField(default=0)
+    tamano = models.PositiveBigIntegerField(help_text="Bytes")
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Archivo de media'
+        verbose_name_plural = 'Archivos de media'
+
+    def __str__(self):
+        return f"{self.ruta} ({self.referencias} referencias)"
+
+
+# Lista de intereses predefinidos
 INTERESES_DISPONIBLES = [
     'Deportes',
     'Música',
@@ -136,4 +203,21 @@ INTERESES_DISPONIBLES = [
     'Manga'
     'Memes',
     'Ajedrez',
-]
\ No newline at end of file
+]
+
+# Posición de cada interés en el catálogo. Perfil.intereses_mascara depende
+# de estas posiciones: los intereses nuevos se agregan al final de la lista
+_INDICE_INTERESES = {interes: i for i, interes in enumerate(INTERESES_DISPONIBLES)}
+
+
+def codificar_intereses(intereses):
+    """
+    Codifica una lista de intereses como bitmask usando la posición de cada
+    uno en INTERESES_DISPONIBLES. Los intereses fuera del catálogo se ignoran.
+    """
+    mascara = 0
+    for interes in intereses or []:
+        indice = _INDICE_INTERESES.get(interes)
+        if indice is not None:
+            mascara |= 1 << indice
+    return mascara
@@ -1,17 +1,32 @@
 from rest_framework import serializers
+from .imagenes import limpiar_original, urls_variantes
 from .models import Perfil, Foto, INTERESES_DISPONIBLES
 
 
 class FotoSerializer(serializers.ModelSerializer):
     """
-    Serializer para fotos del perfil
+    Serializer para fotos del perfil. `variantes` trae la URL de cada tamaño
+    en WebP y JPEG (vacío mientras la foto se procesa)
     """
     imagen_url = serializers.SerializerMethodField()
+    variantes = serializers.SerializerMethodField()
     
     class Meta:
         model = Foto
-        fields = ['id', 'imagen', 'imagen_url', 'orden', 'es_principal', 'fecha_subida']
-        read_only_fields = ['id', 'fecha_subida']
+        fields = [
+            'id', 'imagen', 'imagen_url', 'orden', 'es_principal', 'fecha_subida',
+            'ancho', 'alto', 'variantes'
+        ]
+        read_only_fields = ['id', 'fecha_subida', 'ancho', 'alto']
+    
+    def validate(self, attrs):
+        """El original se guarda ya sin metadatos (apps.perfiles.imagenes)"""
+        if 'imagen' in attrs:
+            try:
+                attrs['imagen'], (attrs['ancho'], attrs['alto']) = limpiar_original(attrs['imagen'])
+            except OSError:
+                raise serializers.ValidationError({'imagen': "No se pudo leer la imagen"})
+        return attrs
     
     def get_imagen_url(self, obj):
         request = self.context.get('request')
@@ -20,6 +35,9 @@ class FotoSerializer(serializers.ModelSerializer):
                 return request.build_absolute_uri(obj.imagen.url)
             return obj.imagen.url
         return None
+    
+    def get_variantes(self, obj):
+        return urls_variantes(obj.variantes, self.context.get('request'))
 
 
 class PerfilSerializer(serializers.ModelSerializer):
@@ -0,0 +1,15 @@
+"""
+Los archivos de una foto borrada (original y variantes) se sueltan al
+confirmar el borrado, venga de la vista, del admin o en cascada con el
+usuario
+"""
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .imagenes import liberar_archivos
+from .models import Foto
+
+
+@receiver(post_delete, sender=Foto)
+def liberar_archivos_foto(sender, instance, **kwargs):
+    liberar_archivos(instance)
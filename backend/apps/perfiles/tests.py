@@ -1,3 +1,269 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from apps.matches.tests import crear_usuario
+from .almacenamiento import es_por_contenido
+from .imagenes import VARIANTES, procesar_foto, rutas_variantes
+from .models import Foto, ArchivoMedia
+
+
+def archivos_en(directorio):
+    return [
+        os.path.relpath(os.path.join(raiz, nombre), directorio).replace(os.sep, '/')
+        for raiz, _, nombres in os.walk(directorio)
+        for nombre in nombres
+    ]
+
+
+def jpeg_con_exif(ancho, alto):
+    imagen = Image.new('RGB', (ancho, alto), 'orange')
+    exif = imagen.getexif()
+    exif[0x0112] = 6  # Orientación: girada 90°
+    exif[0x010F] = 'Cámara de prueba'
+    salida = io.BytesIO()
+    imagen.save(salida, 'JPEG', exif=exif)
+    return SimpleUploadedFile('IMG_0001.jpg', salida.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(FOTOS_PROCESAMIENTO_ASINCRONO=False)
+class ProcesamientoFotosTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        configuracion = override_settings(MEDIA_ROOT=media)
+        configuracion.enable()
+        self.addCleanup(configuracion.disable)
+        cache.clear()
+        self.ana = crear_usuario('ana', fotos=0)
+        self.client = APIClient()
+        self.client.force_authenticate(self.ana)
+
+    def test_variantes_sin_exif(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/perfiles/fotos/', {'imagen': jpeg_con_exif(1200, 900)}, format='multipart'
+            )
+        self.assertEqual(response.status_code, 201)
+
+        foto = Foto.objects.get(usuario=self.ana)
+        # La orientación del EXIF ya está aplicada
+        self.assertEqual((foto.ancho, foto.alto), (900, 1200))
+        with Image.open(foto.imagen.path) as original:
+            self.assertEqual(len(original.getexif()), 0)
+        # Solo quedan el original procesado y las variantes
+        self.assertEqual(
+            sorted(archivos_en(foto.imagen.storage.location)),
+            sorted([foto.imagen.name] + rutas_variantes(foto.variantes))
+        )
+
+        for nombre, tamano in VARIANTES.items():
+            for formato, pil in (('webp', 'WEBP'), ('jpeg', 'JPEG')):
+                with foto.imagen.storage.open(foto.variantes[nombre][formato]) as archivo:
+                    imagen = Image.open(archivo)
+                    self.assertEqual((imagen.format, imagen.size), (pil, tamano))
+                    self.assertEqual(len(imagen.getexif()), 0)
+
+        # Las URLs de las variantes vienen en la foto y en la tarjeta
+        variantes = self.client.get('/api/perfiles/fotos/').data['results'][0]['variantes']
+        self.assertEqual(list(variantes), list(VARIANTES))
+        self.assertEqual(variantes['avatar']['ancho'], 96)
+        self.assertTrue(variantes['avatar']['webp'].startswith('http://testserver/media/'))
+
+        self.client.force_authenticate(crear_usuario('beto', genero='hombre'))
+        tarjeta = self.client.get(f'/api/usuarios/perfil/{self.ana.id}/').data
+        self.assertEqual(tarjeta['fotos'][0]['variantes'], variantes)
+
+    def test_original_sin_exif_antes_de_procesar(self):
+        with self.settings(FOTOS_PROCESAMIENTO_ASINCRONO=True), self.captureOnCommitCallbacks():
+            response = self.client.post(
+                '/api/perfiles/fotos/', {'imagen': jpeg_con_exif(1200, 900)}, format='multipart'
+            )
+        self.assertEqual((response.data['ancho'], response.data['alto']), (900, 1200))
+        self.assertEqual(response.data['variantes'], {})
+
+        # Lo único guardado (y servido por imagen_url) ya no tiene EXIF
+        foto = Foto.objects.get(usuario=self.ana)
+        self.assertEqual(archivos_en(foto.imagen.storage.location), [foto.imagen.name])
+        with Image.open(foto.imagen.path) as original:
+            self.assertEqual(len(original.getexif()), 0)
+
+        # El procesamiento solo agrega las variantes
+        self.assertTrue(procesar_foto(foto))
+        self.assertEqual(Foto.objects.get().imagen.name, foto.imagen.name)
+
+    def test_borrar_foto_borra_variantes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                '/api/perfiles/fotos/', {'imagen': jpeg_con_exif(400, 300)}, format='multipart'
+            )
+        foto = Foto.objects.get(usuario=self.ana)
+        ruta = foto.imagen.storage.path(foto.variantes['tarjeta']['webp'])
+        self.assertTrue(os.path.exists(ruta))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/perfiles/fotos/{foto.id}/')
+        self.assertFalse(os.path.exists(ruta))
+
+    def test_reemplazar_o_borrar_en_cascada_suelta_archivos(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/perfiles/fotos/', {'imagen': jpeg_con_exif(400, 300)}, format='multipart')
+        foto = Foto.objects.get(usuario=self.ana)
+        anterior = foto.imagen.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f'/api/perfiles/fotos/{foto.id}/', {'imagen': jpeg_con_exif(500, 300)}, format='multipart'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(os.path.exists(anterior))
+        # Solo quedan los archivos de la imagen nueva
+        foto.refresh_from_db()
+        self.assertEqual(
+            sorted(archivos_en(foto.imagen.storage.location)),
+            sorted({foto.imagen.name, *rutas_variantes(foto.variantes)})
+        )
+
+        # Sin pasar por la vista: el usuario se borra con sus fotos
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ana.delete()
+        self.assertEqual(archivos_en(foto.imagen.storage.location), [])
+        self.assertFalse(ArchivoMedia.objects.exists())
+
+    def test_mismo_contenido_un_solo_archivo(self):
+        beto = crear_usuario('beto', genero='hombre', fotos=0)
+        datos = jpeg_con_exif(400, 300).read()
+        with self.settings(FOTOS_PROCESAMIENTO_ASINCRONO=True), self.captureOnCommitCallbacks():
+            for usuario in (self.ana, self.ana, beto):
+                self.client.force_authenticate(usuario)
+                self.client.post('/api/perfiles/fotos/', {
+                    'imagen': SimpleUploadedFile('foto.jpg', datos, content_type='image/jpeg')
+                }, format='multipart')
+
+        fotos = list(Foto.objects.order_by('id'))
+        nombre = fotos[0].imagen.name
+        self.assertRegex(nombre, r'^fotos_perfil/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        self.assertEqual({foto.imagen.name for foto in fotos}, {nombre})
+        self.assertEqual(ArchivoMedia.objects.get(ruta=nombre).referencias, 3)
+        self.assertEqual(archivos_en(fotos[0].imagen.storage.location), [nombre])
+
+        # El archivo se queda mientras alguna foto lo use
+        for i, foto in enumerate(fotos):
+            self.client.force_authenticate(foto.usuario)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.delete(f'/api/perfiles/fotos/{foto.id}/')
+            self.assertEqual(os.path.exists(foto.imagen.path), i < 2)
+        self.assertFalse(ArchivoMedia.objects.exists())
+
+    def test_migrar_media(self):
+        anterior = FileSystemStorage()
+        rutas = [
+            anterior.save('fotos_perfil/2024/05/a.jpg', ContentFile(b'igual')),
+            anterior.save('fotos_perfil/2024/06/b.jpg', ContentFile(b'igual')),
+        ]
+        for orden, ruta in enumerate(rutas):
+            Foto.objects.create(usuario=self.ana, imagen=ruta, orden=orden)
+
+        call_command('migrar_media', stdout=io.StringIO())
+        nombres = set(Foto.objects.values_list('imagen', flat=True))
+        self.assertEqual(len(nombres), 1)
+        nombre = nombres.pop()
+        self.assertTrue(es_por_contenido(nombre))
+        self.assertEqual(ArchivoMedia.objects.get(ruta=nombre).referencias, 2)
+        self.assertEqual(archivos_en(anterior.location), [nombre])
+
+        # Referencias desviadas se corrigen
+        ArchivoMedia.objects.update(referencias=7)
+        call_command('migrar_media', stdout=io.StringIO())
+        self.assertEqual(ArchivoMedia.objects.get().referencias, 2)
+
+        # Un archivo guardado después de iniciar, cuya Foto aún no existe, se queda
+        storage = Foto._meta.get_field('imagen').storage
+        en_curso = storage.save('fotos_perfil/c.jpg', ContentFile(b'en curso'))
+        ArchivoMedia.objects.filter(ruta=en_curso).update(
+            fecha_creacion=timezone.now() + timedelta(minutes=1)
+        )
+        call_command('migrar_media', stdout=io.StringIO())
+        self.assertTrue(storage.exists(en_curso))
+        self.assertEqual(ArchivoMedia.objects.get(ruta=en_curso).referencias, 1)
+
+        # Un registro sin fotos se borra, y su archivo hasta confirmar
+        ArchivoMedia.objects.filter(ruta=en_curso).update(fecha_creacion=timezone.now())
+        with self.captureOnCommitCallbacks() as callbacks:
+            call_command('migrar_media', stdout=io.StringIO())
+        self.assertFalse(ArchivoMedia.objects.filter(ruta=en_curso).exists())
+        self.assertTrue(storage.exists(en_curso))
+        for callback in callbacks:
+            callback()
+        self.assertFalse(storage.exists(en_curso))
+
+
+class MediaTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        configuracion = override_settings(MEDIA_ROOT=media)
+        configuracion.enable()
+        self.addCleanup(configuracion.disable)
+        self.storage = Foto._meta.get_field('imagen').storage
+        self.nombre = self.storage.save('fotos_perfil/x.jpg', ContentFile(b'0123456789'))
+
+    def test_inmutable_y_rangos(self):
+        url = self.storage.url(self.nombre)
+        response = self.client.get(url)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['ETag'], '"%s"' % self.nombre.rsplit('/', 1)[1][:-4])
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        response = self.client.get(url, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        response = self.client.get(url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), b'789')
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=10-').status_code, 416)
+        # If-Range que no coincide: archivo completo
+        response = self.client.get(url, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"otro"')
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.client.get('/media/../cuceimatch/settings.py').status_code, 404)
+        self.assertEqual(self.client.get('/media/fotos_perfil/no-existe.jpg').status_code, 404)
+
+    @override_settings(MEDIA_DESCARGA='x-accel-redirect')
+    def test_servidor_web_envia_el_archivo(self):
+        response = self.client.get(self.storage.url(self.nombre))
+        self.assertEqual(response['X-Accel-Redirect'], f'/media-interna/{self.nombre}')
+        self.assertEqual(response.content, b'')
+        self.assertIn('immutable', response['Cache-Control'])
+
+    @override_settings(MEDIA_PRIVADA=True)
+    def test_urls_firmadas(self):
+        url = self.storage.url(self.nombre)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertTrue(self.client.get(url)['Cache-Control'].startswith('private'))
+        self.assertEqual(self.client.get(url.split('?')[0]).status_code, 403)
+        self.assertEqual(self.client.get(url[:-1] + 'x').status_code, 403)
+
+        # La misma URL durante la ventana, y deja de valer cuando expira
+        self.assertEqual(self.storage.url(self.nombre), url)
+        with mock.patch('cuceimatch.media.time.time', return_value=time.time() + 5 * 24 * 60 * 60):
+            self.assertEqual(self.client.get(url).status_code, 403)
@@ -1,3 +1,4 @@
+from django.db import transaction
 from rest_framework import status, generics
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -5,6 +6,8 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework import serializers
 
+from cuceimatch.condicional import VersionETagMixin
+from .imagenes import programar_procesamiento, liberar_archivos
 from .models import Perfil, Foto, INTERESES_DISPONIBLES
 from .serializers import (
     PerfilSerializer,
@@ -13,14 +16,18 @@ from .serializers import (
 )
 
 
-class MiPerfilView(generics.RetrieveAPIView):
+class MiPerfilView(VersionETagMixin, generics.RetrieveAPIView):
     """
     GET /api/perfiles/mi-perfil/
     Obtiene el perfil completo del usuario autenticado
+    Responde 304 si If-None-Match coincide con la versión del perfil
     """
     permission_classes = [IsAuthenticated]
     serializer_class = PerfilSerializer
     
+    def get_version(self, request):
+        return Perfil.version_de(request.user.id)
+    
     def get_object(self):
         perfil, created = Perfil.objects.get_or_create(usuario=self.request.user)
         return perfil
@@ -41,6 +48,10 @@ class ActualizarPerfilView(generics.UpdateAPIView):
     def perform_update(self, serializer):
         serializer.save()
         
+        # El rango de edad pudo cambiar, el deck se vuelve a generar
+        from apps.matches.deck import invalidar_deck
+        invalidar_deck(self.request.user.id)
+        
         # Verificar si el perfil está completo
         usuario = self.request.user
         tiene_fotos = usuario.fotos.exists()
@@ -64,32 +75,38 @@ class FotoListCreateView(generics.ListCreateAPIView):
         return Foto.objects.filter(usuario=self.request.user).order_by('orden')
     
     def perform_create(self, serializer):
-        # Contar fotos existentes
-        num_fotos = Foto.objects.filter(usuario=self.request.user).count()
-        
-        # Máximo 6 fotos
-        if num_fotos >= 6:
-            raise serializers.ValidationError(
-                "Has alcanzado el máximo de 6 fotos"
+        # El procesamiento se programa para después del commit
+        with transaction.atomic():
+            # Contar fotos existentes
+            num_fotos = Foto.objects.filter(usuario=self.request.user).count()
+            
+            # Máximo 6 fotos
+            if num_fotos >= 6:
+                raise serializers.ValidationError(
+                    "Has alcanzado el máximo de 6 fotos"
+                )
+            
+            # Asignar orden automático
+            orden = serializer.validated_data.get('orden', num_fotos)
+            
+            # Si es la primera foto, hacerla principal
+            es_principal = num_fotos == 0
+            
+            foto = serializer.save(
+                usuario=self.request.user,
+                orden=orden,
+                es_principal=es_principal
             )
-        
-        # Asignar orden automático
-        orden = serializer.validated_data.get('orden', num_fotos)
-        
-        # Si es la primera foto, hacerla principal
-        es_principal = num_fotos == 0
-        
-        foto = serializer.save(
-            usuario=self.request.user,
-            orden=orden,
-            es_principal=es_principal
-        )
-        
-        # Marcar perfil como completo si tiene bio
-        usuario = self.request.user
-        if hasattr(usuario, 'perfil') and usuario.perfil.bio:
-            usuario.perfil_completo = True
-            usuario.save(update_fields=['perfil_completo'])
+            
+            # El original ya viene sin EXIF; las variantes en segundo plano
+            # (apps.perfiles.imagenes)
+            programar_procesamiento(foto)
+            
+            # Marcar perfil como completo si tiene bio
+            usuario = self.request.user
+            if hasattr(usuario, 'perfil') and usuario.perfil.bio:
+                usuario.perfil_completo = True
+                usuario.save(update_fields=['perfil_completo'])
         
         return foto
 
@@ -107,18 +124,33 @@ class FotoDetailView(generics.RetrieveUpdateDestroyAPIView):
     def get_queryset(self):
         return Foto.objects.filter(usuario=self.request.user)
     
+    def perform_update(self, serializer):
+        if 'imagen' not in serializer.validated_data:
+            serializer.save()
+            return
+        
+        # Los archivos se sueltan y se procesan al confirmar la transacción
+        with transaction.atomic():
+            # La imagen anterior y sus variantes ya no se usan
+            liberar_archivos(serializer.instance)
+            foto = serializer.save(variantes={})
+            programar_procesamiento(foto)
+    
     def perform_destroy(self, instance):
-        # Si era la foto principal, hacer principal a la primera
-        if instance.es_principal:
-            primera_foto = Foto.objects.filter(
-                usuario=self.request.user
-            ).exclude(pk=instance.pk).order_by('orden').first()
+        with transaction.atomic():
+            # Si era la foto principal, hacer principal a la primera
+            if instance.es_principal:
+                primera_foto = Foto.objects.filter(
+                    usuario=self.request.user
+                ).exclude(pk=instance.pk).order_by('orden').first()
+                
+                if primera_foto:
+                    primera_foto.es_principal = True
+                    primera_foto.save()
             
-            if primera_foto:
-                primera_foto.es_principal = True
-                primera_foto.save()
-        
-        instance.delete()
+            # apps.perfiles.signals suelta los archivos al confirmar el borrado
+            # (se borran solo si ninguna otra foto tiene el mismo contenido)
+            instance.delete()
 
 
 class MarcarFotoPrincipalView(APIView):
@@ -153,12 +185,17 @@ class MarcarFotoPrincipalView(APIView):
         )
 
 
-class InteresesDisponiblesView(APIView):
+class InteresesDisponiblesView(VersionETagMixin, APIView):
     """
     GET /api/perfiles/intereses/
-    Lista los intereses disponibles
+    Lista los intereses disponibles (catálogo fijo: el cliente lo puede
+    guardar un día sin volver a pedirlo)
     """
     permission_classes = [IsAuthenticated]
+    cache_control = 'private, max-age=86400'
+    
+    def get_version(self, request):
+        return INTERESES_DISPONIBLES
     
     def get(self, request):
         return Response({
@@ -0,0 +1,33 @@
+from django.contrib import admin
+from .models import Cambio, PurgaCambios
+
+
+@admin.register(Cambio)
+class CambioAdmin(admin.ModelAdmin):
+    """
+    Admin para la secuencia de cambios (solo lectura)
+    """
+    list_display = ['id', 'usuario', 'tipo', 'objeto_id', 'fecha']
+    list_filter = ['tipo']
+    search_fields = ['usuario__email']
+    raw_id_fields = ['usuario']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(PurgaCambios)
+class PurgaCambiosAdmin(admin.ModelAdmin):
+    """
+    Admin para el registro de purgas (solo lectura)
+    """
+    list_display = ['id', 'hasta_id', 'fecha']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,7 @@
+from django.apps import AppConfig
+
+
+class SincronizacionConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'apps.sincronizacion'
+    verbose_name = 'Sincronización'
@@ -0,0 +1,66 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.sincronizacion.models import Cambio, PurgaCambios
+
+
+class Command(BaseCommand):
+    """
+    Borra los cambios de sincronización con más de --dias (por defecto
+    SINCRONIZACION_RETENCION_DIAS) y registra hasta qué id se borró. Los
+    clientes con un cursor anterior reciben `recargar` en /api/sync/ y
+    vuelven a cargar todo. Se puede correr con la aplicación en marcha
+    (p. ej. diario desde cron).
+
+    Uso: python manage.py purgar_cambios [--dias 30] [--lote 10000] [--simular]
+    """
+    help = 'Borra los cambios de sincronización más viejos que la retención'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=settings.SINCRONIZACION_RETENCION_DIAS)
+        parser.add_argument('--lote', type=int, default=10000, help='Cambios por DELETE')
+        parser.add_argument(
+            '--simular',
+            action='store_true',
+            help='Solo reportar cuántos cambios se borrarían'
+        )
+
+    def handle(self, *args, **options):
+        limite = timezone.now() - timedelta(days=options['dias'])
+
+        # Los ids crecen con la fecha: se borra todo lo anterior al primer
+        # cambio que todavía está dentro de la retención
+        primero = Cambio.objects.filter(fecha__gte=limite).order_by('id').values_list(
+            'id', flat=True
+        ).first()
+        if primero is None:
+            hasta_id = Cambio.objects.order_by('-id').values_list('id', flat=True).first()
+        else:
+            hasta_id = primero - 1
+        if not hasta_id or hasta_id <= Cambio.horizonte():
+            self.stdout.write('No hay cambios por purgar')
+            return
+
+        if options['simular']:
+            cantidad = Cambio.objects.filter(id__lte=hasta_id).count()
+            self.stdout.write(f'{cantidad} cambios por borrar (hasta el id {hasta_id})')
+            return
+
+        # El horizonte se registra antes de borrar: si se interrumpe, a lo
+        # más algunos clientes recargan sin necesidad
+        PurgaCambios.objects.create(hasta_id=hasta_id)
+        total = 0
+        while True:
+            ids = list(
+                Cambio.objects.filter(id__lte=hasta_id).order_by('id').values_list(
+                    'id', flat=True
+                )[:options['lote']]
+            )
+            if not ids:
+                break
+            total += Cambio.objects.filter(id__in=ids).delete()[0]
+
+        self.stdout.write(self.style.SUCCESS(f'{total} cambios borrados (hasta el id {hasta_id})'))
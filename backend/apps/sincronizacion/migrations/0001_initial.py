@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Cambio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('match', 'Match nuevo o actualizado'), ('mensaje', 'Mensaje nuevo'), ('leidos', 'Mensajes leídos por el otro usuario'), ('tarjeta', 'Tarjeta de perfil actualizada')], max_length=10)),
+                ('objeto_id', models.BigIntegerField(help_text='Id del match, mensaje o usuario (tarjeta) que cambió')),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+                ('usuario', models.ForeignKey(db_index=False, help_text='Usuario al que le interesa el cambio', on_delete=django.db.models.deletion.CASCADE, related_name='cambios', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Cambio',
+                'verbose_name_plural': 'Cambios',
+                'indexes': [models.Index(fields=['usuario', 'id'], name='sincronizac_usuario_b350db_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sincronizacion', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PurgaCambios',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hasta_id', models.BigIntegerField(help_text='Se borraron los cambios con id menor o igual')),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Purga de cambios',
+                'verbose_name_plural': 'Purgas de cambios',
+            },
+        ),
+    ]
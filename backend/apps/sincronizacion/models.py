@@ -0,0 +1,145 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+from apps.usuarios.models import Usuario
+
+
+class Cambio(models.Model):
+    """
+    Cambios por usuario para la sincronización incremental
+    (GET /api/sync/?since=<cursor>). El cursor es el id del último cambio
+    que vio el cliente.
+    
+    Cada fila avisa a un usuario que algo que ve cambió: se escribe una por
+    destinatario en la misma transacción que el cambio.
+    
+    El id se asigna al insertar pero la fila se ve hasta el commit, así que
+    una transacción más lenta puede confirmar un id menor que otro que ya se
+    entregó. Por eso la sincronización solo entrega cambios con más de
+    SINCRONIZACION_RETRASO segundos (ver `limite_asentados`): el retraso
+    debe ser mayor que la transacción más larga que escribe cambios (más la
+    diferencia de reloj entre servidores).
+    
+    Los cambios con más de SINCRONIZACION_RETENCION_DIAS se borran con
+    manage.py purgar_cambios; los clientes con un cursor anterior a la
+    última purga deben recargar todo.
+    """
+    
+    MATCH = 'match'
+    MENSAJE = 'mensaje'
+    LEIDOS = 'leidos'
+    TARJETA = 'tarjeta'
+    
+    TIPO_CHOICES = [
+        (MATCH, 'Match nuevo o actualizado'),
+        (MENSAJE, 'Mensaje nuevo'),
+        (LEIDOS, 'Mensajes leídos por el otro usuario'),
+        (TARJETA, 'Tarjeta de perfil actualizada'),
+    ]
+    
+    usuario = models.ForeignKey(
+        Usuario,
+        on_delete=models.CASCADE,
+        related_name='cambios',
+        db_index=False,
+        help_text="Usuario al que le interesa el cambio"
+    )
+    
+    tipo = models.CharField(max_length=10, choices=TIPO_CHOICES)
+    
+    objeto_id = models.BigIntegerField(
+        help_text="Id del match, mensaje o usuario (tarjeta) que cambió"
+    )
+    
+    fecha = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Cambio'
+        verbose_name_plural = 'Cambios'
+        indexes = [
+            models.Index(fields=['usuario', 'id']),
+        ]
+    
+    def __str__(self):
+        return f"{self.usuario_id}: {self.tipo} {self.objeto_id}"
+    
+    @staticmethod
+    def limite_asentados():
+        """Los cambios anteriores a esta fecha ya están confirmados"""
+        return timezone.now() - timedelta(seconds=settings.SINCRONIZACION_RETRASO)
+    
+    @staticmethod
+    def horizonte():
+        """Id hasta el que se purgaron los cambios (0 si nunca se ha purgado)"""
+        return PurgaCambios.objects.order_by('-hasta_id').values_list(
+            'hasta_id', flat=True
+        ).first() or 0
+    
+    @classmethod
+    def registrar(cls, usuario_ids, tipo, objeto_id):
+        """Registra el mismo cambio para varios usuarios en un solo INSERT"""
+        cls.objects.bulk_create([
+            cls(usuario_id=usuario_id, tipo=tipo, objeto_id=objeto_id)
+            for usuario_id in dict.fromkeys(usuario_ids)
+        ])
+    
+    @classmethod
+    def registrar_matches(cls, matches):
+        """Matches creados, desactivados o leídos: aviso a ambos usuarios"""
+        cls.objects.bulk_create([
+            cls(usuario_id=usuario_id, tipo=cls.MATCH, objeto_id=match.id)
+            for match in matches
+            for usuario_id in (match.usuario1_id, match.usuario2_id)
+        ])
+    
+    @classmethod
+    def registrar_lectura(cls, match, lector_id):
+        """
+        El lector movió su marca de lectura: el otro usuario ve sus mensajes
+        leídos y el lector, su contador de no leídos (un solo INSERT)
+        """
+        cls.objects.bulk_create([
+            cls(usuario_id=match.otro_usuario_id(lector_id), tipo=cls.LEIDOS, objeto_id=match.id),
+            cls(usuario_id=lector_id, tipo=cls.MATCH, objeto_id=match.id),
+        ])
+    
+    @classmethod
+    def registrar_tarjeta(cls, usuario_id):
+        """
+        La tarjeta de `usuario_id` cambió: se avisa a todos los usuarios con
+        los que tiene match
+        """
+        from apps.matches.models import Match
+        
+        otros = [
+            usuario2_id if usuario1_id == usuario_id else usuario1_id
+            for usuario1_id, usuario2_id in Match.objects.del_usuario(
+                usuario_id
+            ).values_list('usuario1_id', 'usuario2_id')
+        ]
+        if otros:
+            cls.registrar(otros, cls.TARJETA, usuario_id)
+
+
+class PurgaCambios(models.Model):
+    """
+    Registro de cada ejecución de manage.py purgar_cambios. La última marca
+    el horizonte de la sincronización: un cursor menor que `hasta_id` pudo
+    perder cambios y el cliente debe recargar todo.
+    """
+    
+    hasta_id = models.BigIntegerField(
+        help_text="Se borraron los cambios con id menor o igual"
+    )
+    
+    fecha = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Purga de cambios'
+        verbose_name_plural = 'Purgas de cambios'
+    
+    def __str__(self):
+        return f"Hasta {self.hasta_id} ({self.fecha:%Y-%m-%d})"
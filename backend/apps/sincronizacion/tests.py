@@ -0,0 +1,137 @@
+import io
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models import F
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from apps.chat.models import Mensaje
+from apps.matches.models import Swipe
+from apps.matches.tests import crear_usuario
+from apps.perfiles.models import Foto
+from .models import Cambio, PurgaCambios
+
+
+def envejecer(cambios, **delta):
+    cambios.update(fecha=F('fecha') - timedelta(**delta))
+
+
+@override_settings(SINCRONIZACION_RETRASO=0)
+class SincronizacionTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.ana = crear_usuario('ana')
+        self.beto = crear_usuario('beto', genero='hombre')
+        self.client = APIClient()
+        self.client.force_authenticate(self.ana)
+
+    def sincronizar(self, cursor):
+        return self.client.get('/api/sync/', {'since': cursor}).data
+
+    def test_solo_cambios_desde_el_cursor(self):
+        cursor = self.client.get('/api/sync/').data['cursor']
+
+        Swipe.objects.create(usuario_origen=self.ana, usuario_destino=self.beto, tipo='like')
+        swipe = Swipe.objects.create(usuario_origen=self.beto, usuario_destino=self.ana, tipo='like')
+        match = swipe.match
+        mensaje = Mensaje.objects.create(match=match, remitente=self.beto, contenido='Hola')
+
+        datos = self.sincronizar(cursor)
+        self.assertEqual([m['id'] for m in datos['matches']], [match.id])
+        self.assertEqual([m['id'] for m in datos['mensajes']], [mensaje.id])
+        self.assertFalse(datos['has_more'])
+
+        # Sin cambios nuevos la respuesta está vacía y el cursor no cambia
+        cursor = datos['cursor']
+        vacio = self.sincronizar(cursor)
+        self.assertEqual(vacio['cursor'], cursor)
+        self.assertEqual(vacio['matches'] + vacio['mensajes'] + vacio['tarjetas'], [])
+
+        # beto lee el mensaje de ana y cambia sus fotos
+        propio = Mensaje.objects.create(match=match, remitente=self.ana, contenido='Qué tal')
+        Mensaje.marcar_leidos(match, self.beto)
+        with self.captureOnCommitCallbacks(execute=True):
+            Foto.objects.create(usuario=self.beto, imagen='fotos_perfil/beto_9.jpg', orden=9)
+
+        datos = self.sincronizar(cursor)
+        self.assertEqual([m['id'] for m in datos['mensajes']], [propio.id])
+        self.assertEqual(datos['leidos'], [{'match_id': match.id, 'hasta_id': propio.id}])
+        self.assertEqual([t['id'] for t in datos['tarjetas']], [self.beto.id])
+        self.assertEqual(len(datos['tarjetas'][0]['fotos']), 2)
+
+    def test_paginado(self):
+        cursor = self.client.get('/api/sync/').data['cursor']
+        Swipe.objects.create(usuario_origen=self.ana, usuario_destino=self.beto, tipo='like')
+        match = Swipe.objects.create(usuario_origen=self.beto, usuario_destino=self.ana, tipo='like').match
+        for i in range(3):
+            Mensaje.objects.create(match=match, remitente=self.beto, contenido=str(i))
+
+        datos = self.client.get('/api/sync/', {'since': cursor, 'limit': 2}).data
+        self.assertTrue(datos['has_more'])
+        datos = self.client.get('/api/sync/', {'since': datos['cursor'], 'limit': 2}).data
+        self.assertFalse(datos['has_more'])
+        self.assertEqual([m['contenido'] for m in datos['mensajes']], ['1', '2'])
+
+
+class AsentadosYPurgaTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.ana = crear_usuario('ana')
+        self.beto = crear_usuario('beto', genero='hombre')
+        self.client = APIClient()
+        self.client.force_authenticate(self.ana)
+        Swipe.objects.create(usuario_origen=self.ana, usuario_destino=self.beto, tipo='like')
+        self.match = Swipe.objects.create(
+            usuario_origen=self.beto, usuario_destino=self.ana, tipo='like'
+        ).match
+
+    def sincronizar(self, cursor):
+        return self.client.get('/api/sync/', {'since': cursor}).data
+
+    def test_solo_cambios_asentados(self):
+        envejecer(Cambio.objects.all(), seconds=10)
+        cursor = self.sincronizar(0)['cursor']
+        mensajes = [
+            Mensaje.objects.create(match=self.match, remitente=self.beto, contenido=str(i))
+            for i in range(2)
+        ]
+
+        # Recién escritos: pueden faltar ids menores sin confirmar
+        datos = self.sincronizar(cursor)
+        self.assertEqual((datos['cursor'], datos['mensajes']), (cursor, []))
+        self.assertEqual(self.client.get('/api/sync/').data['cursor'], cursor)
+
+        # Uno viejo después de uno reciente tampoco se entrega todavía
+        envejecer(Cambio.objects.filter(objeto_id=mensajes[1].id), seconds=10)
+        self.assertEqual(self.sincronizar(cursor)['mensajes'], [])
+
+        envejecer(Cambio.objects.filter(objeto_id=mensajes[0].id), seconds=10)
+        datos = self.sincronizar(cursor)
+        self.assertEqual([m['id'] for m in datos['mensajes']], [m.id for m in mensajes])
+
+    def test_purga(self):
+        viejo = self.sincronizar(0)['cursor']
+        envejecer(Cambio.objects.all(), days=40)
+        mensaje = Mensaje.objects.create(match=self.match, remitente=self.beto, contenido='Hola')
+        envejecer(Cambio.objects.filter(tipo=Cambio.MENSAJE), hours=1)
+
+        call_command('purgar_cambios', stdout=io.StringIO())
+        self.assertEqual(list(Cambio.objects.values_list('tipo', flat=True).distinct()), [Cambio.MENSAJE])
+        self.assertEqual(PurgaCambios.objects.get().hasta_id, Cambio.objects.order_by('id').first().id - 1)
+        # Sin nada más viejo que la retención no se registra otra purga
+        call_command('purgar_cambios', stdout=io.StringIO())
+        self.assertEqual(PurgaCambios.objects.count(), 1)
+
+        # Un cursor anterior a la purga pide recargar todo
+        datos = self.sincronizar(viejo)
+        self.assertTrue(datos['recargar'])
+        self.assertEqual(datos['mensajes'], [])
+        self.assertEqual(datos['cursor'], Cambio.objects.get(usuario=self.ana).id)
+
+        datos = self.sincronizar(Cambio.objects.get(usuario=self.ana).id - 1)
+        self.assertFalse(datos['recargar'])
+        self.assertEqual([m['id'] for m in datos['mensajes']], [mensaje.id])
@@ -0,0 +1,9 @@
+from django.urls import path
+from . import views
+
+app_name = 'sincronizacion'
+
+urlpatterns = [
+    # Cambios desde un cursor
+    path('', views.SincronizarView.as_view(), name='sincronizar'),
+]
@@ -0,0 +1,121 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from apps.chat.models import Mensaje
+from apps.chat.serializers import MensajeSerializer
+from apps.matches.models import Match
+from apps.matches.serializers import MatchSerializer
+from apps.usuarios.tarjetas import obtener_tarjetas
+from .models import Cambio
+
+
+class SincronizarView(APIView):
+    """
+    GET /api/sync/?since=<cursor>
+    Retorna solo lo que cambió para el usuario desde el cursor:
+    - matches: matches nuevos o actualizados (desactivados, contador de no leídos)
+    - mensajes: mensajes nuevos (de ambos lados)
+    - leidos: hasta qué mensaje propio leyó el otro usuario en cada match
+    - tarjetas: tarjetas de perfil actualizadas de los otros usuarios
+    Sin `since` solo retorna el cursor actual (el cliente carga todo con las
+    listas normales y sincroniza desde ahí). Si `has_more` es true se debe
+    volver a pedir con el nuevo cursor. Si `recargar` es true el cursor es
+    anterior a la última purga de cambios: el cliente debe cargar todo otra
+    vez y seguir desde el cursor que viene en la respuesta.
+    Los cambios se entregan con SINCRONIZACION_RETRASO segundos de retraso
+    (ver Cambio); lo inmediato llega por WebSocket.
+    Query params:
+    - since: cursor retornado por la llamada anterior
+    - limit: cambios a procesar por llamada (default: 500, máximo: 1000)
+    """
+    permission_classes = [IsAuthenticated]
+    limite_default = 500
+    limite_maximo = 1000
+    
+    def _parametro_entero(self, nombre, default=None):
+        valor = self.request.query_params.get(nombre)
+        if valor is None:
+            return default
+        try:
+            return int(valor)
+        except ValueError:
+            raise ValidationError({nombre: 'Debe ser un número entero'})
+    
+    def get(self, request):
+        usuario = request.user
+        cambios = Cambio.objects.filter(usuario=usuario)
+        asentados = Cambio.limite_asentados()
+        
+        since = self._parametro_entero('since')
+        if since is None or since < Cambio.horizonte():
+            cursor = cambios.filter(fecha__lt=asentados).order_by(
+                '-id'
+            ).values_list('id', flat=True).first()
+            return Response(self._respuesta(cursor or 0, recargar=since is not None))
+        
+        limite = self._parametro_entero('limit', self.limite_default)
+        limite = max(1, min(limite, self.limite_maximo))
+        
+        filas = []
+        for fila in cambios.filter(id__gt=since).order_by('id').values_list(
+            'id', 'tipo', 'objeto_id', 'fecha'
+        )[:limite + 1]:
+            # Se corta en el primer cambio reciente aunque después haya otros
+            # más viejos: los ids no siguen exactamente el orden de las fechas
+            if fila[3] >= asentados:
+                break
+            filas.append(fila)
+        has_more = len(filas) > limite
+        filas = filas[:limite]
+        if not filas:
+            return Response(self._respuesta(since))
+        
+        ids = {tipo: [] for tipo, _ in Cambio.TIPO_CHOICES}
+        for _, tipo, objeto_id, _ in filas:
+            ids[tipo].append(objeto_id)
+        
+        respuesta = self._respuesta(filas[-1][0], has_more)
+        contexto = {'request': request}
+        
+        if ids[Cambio.MATCH]:
+            matches = Match.objects.filter(id__in=ids[Cambio.MATCH]).order_by('id')
+            respuesta['matches'] = MatchSerializer(matches, many=True, context=contexto).data
+        
+        if ids[Cambio.MENSAJE]:
+            mensajes = Mensaje.objects.filter(
+                id__in=ids[Cambio.MENSAJE]
+            ).select_related('remitente', 'match').order_by('id')
+            respuesta['mensajes'] = MensajeSerializer(mensajes, many=True, context=contexto).data
+        
+        if ids[Cambio.LEIDOS]:
+            respuesta['leidos'] = [
+                {
+                    'match_id': match.id,
+                    'hasta_id': match.ultimo_leido_de(match.otro_usuario_id(usuario.id)),
+                }
+                for match in Match.objects.filter(
+                    id__in=ids[Cambio.LEIDOS]
+                ).only(
+                    'usuario1', 'usuario2', 'ultimo_leido_usuario1', 'ultimo_leido_usuario2'
+                ).order_by('id')
+            ]
+        
+        if ids[Cambio.TARJETA]:
+            respuesta['tarjetas'] = list(
+                obtener_tarjetas(ids[Cambio.TARJETA], request).values()
+            )
+        
+        return Response(respuesta)
+    
+    def _respuesta(self, cursor, has_more=False, recargar=False):
+        return {
+            'cursor': cursor,
+            'has_more': has_more,
+            'recargar': recargar,
+            'matches': [],
+            'mensajes': [],
+            'leidos': [],
+            'tarjetas': [],
+        }
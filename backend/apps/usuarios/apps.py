@@ -4,4 +4,7 @@ from django.apps import AppConfig
 class UsuariosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.usuarios'
-    verbose_name = 'Usuarios'
\ No newline at end of file
+    verbose_name = 'Usuarios'
+
+    def ready(self):
+        from . import signals  # noqa: F401
\ No newline at end of file
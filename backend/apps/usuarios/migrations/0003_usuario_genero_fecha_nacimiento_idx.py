@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('usuarios', '0002_alter_tokentemporal_codigo_udg_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usuario',
+            index=models.Index(fields=['genero', 'fecha_nacimiento'], name='usuarios_us_genero_5c19ac_idx'),
+        ),
+    ]
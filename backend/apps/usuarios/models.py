@@ -75,6 +75,10 @@ class Usuario(AbstractUser):
         verbose_name = 'Usuario'
         verbose_name_plural = 'Usuarios'
         ordering = ['-fecha_registro']
+        indexes = [
+            # Filtro de candidatos por género y rango de edad
+            models.Index(fields=['genero', 'fecha_nacimiento']),
+        ]
     
     def __str__(self):
         return f"{self.nombre_completo} ({self.email})"
@@ -82,12 +86,17 @@ class Usuario(AbstractUser):
     @property
     def edad(self):
         """Calcula la edad del usuario"""
-        if not self.fecha_nacimiento:
+        return self.calcular_edad(self.fecha_nacimiento)
+    
+    @staticmethod
+    def calcular_edad(fecha_nacimiento):
+        """Edad a la fecha de hoy (None sin fecha de nacimiento)"""
+        if not fecha_nacimiento:
             return None
         from datetime import date
         today = date.today()
-        return today.year - self.fecha_nacimiento.year - (
-            (today.month, today.day) < (self.fecha_nacimiento.month, self.fecha_nacimiento.day)
+        return today.year - fecha_nacimiento.year - (
+            (today.month, today.day) < (fecha_nacimiento.month, fecha_nacimiento.day)
         )
     
     def get_generos_buscados(self):
@@ -99,6 +108,36 @@ class Usuario(AbstractUser):
         elif self.buscando == 'mujeres':
             return ['mujer']
         return []
+    
+    def get_buscando_compatibles(self):
+        """Retorna los valores de `buscando` de quienes buscan el género de este usuario"""
+        if self.genero == 'hombre':
+            return ['hombres', 'ambos']
+        elif self.genero == 'mujer':
+            return ['mujeres', 'ambos']
+        return ['ambos']
+    
+    @staticmethod
+    def rango_fecha_nacimiento(edad_minima, edad_maxima):
+        """
+        Traduce un rango de edades a límites de fecha_nacimiento para poder
+        filtrar en la base de datos (edad es una propiedad de Python).
+        
+        Returns:
+            (nacido_despues_de, nacido_hasta): usar como
+            fecha_nacimiento__gt y fecha_nacimiento__lte
+        """
+        from datetime import date
+        today = date.today()
+        
+        def hace_anios(anios):
+            try:
+                return today.replace(year=today.year - anios)
+            except ValueError:
+                # 29 de febrero en un año no bisiesto
+                return today.replace(year=today.year - anios, day=28)
+        
+        return hace_anios(edad_maxima + 1), hace_anios(edad_minima)
 
 
 class TokenTemporal(models.Model):
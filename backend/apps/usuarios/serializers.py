@@ -2,7 +2,10 @@
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
 from .models import Usuario, TokenTemporal
+from apps.perfiles.imagenes import urls_variantes
+from apps.perfiles.models import Foto
 from apps.perfiles.serializers import FotoSerializer
+from cuceimatch.serializacion import SerializadorLigero, columna, fecha, fecha_hora
 
 class UsuarioSerializer(serializers.ModelSerializer):
     """
@@ -24,7 +27,8 @@ class UsuarioSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'verificado', 'fecha_registro', 'ultima_actividad']
 
     def get_fotos(self, obj):
-        fotos = obj.fotos.all().order_by('orden')
+        # Foto.Meta.ordering ya es 'orden'; sin order_by se aprovecha el prefetch
+        fotos = obj.fotos.all()
         request = self.context.get('request')
         return FotoSerializer(fotos, many=True, context={'request': request}).data
 
@@ -46,19 +50,80 @@ class UsuarioPerfilSerializer(serializers.ModelSerializer):
         ]
     
     def get_fotos(self, obj):
-        from apps.perfiles.serializers import FotoSerializer
-        fotos = obj.fotos.all().order_by('orden')
+        # Foto.Meta.ordering ya es 'orden'; sin order_by se aprovecha el
+        # prefetch de apps.usuarios.tarjetas.con_tarjeta
+        fotos = obj.fotos.all()
         return FotoSerializer(fotos, many=True, context=self.context).data
     
     def get_perfil(self, obj):
-        """Incluir datos del perfil si existen"""
+        """Incluir datos del perfil si existen (usar select_related('perfil'))"""
         if hasattr(obj, 'perfil'):
             return {
                 'bio': obj.perfil.bio,
                 'intereses': obj.perfil.intereses,
             }
         return None
+
+
+class UsuarioPerfilLigeroSerializer(SerializadorLigero):
+    """
+    Misma salida que UsuarioPerfilSerializer sobre filas de .values() (ver
+    cuceimatch.serializacion). Las fotos de todas las filas se leen en una
+    sola consulta
+    """
+    columnas = (
+        'id', 'nombre_completo', 'carrera', 'semestre', 'genero',
+        'fecha_nacimiento', 'perfil__id', 'perfil__bio', 'perfil__intereses'
+    )
     
+    def plan(self, filas):
+        fotos = self._fotos([fila['id'] for fila in filas])
+        
+        def perfil(fila):
+            if fila['perfil__id'] is None:
+                return None
+            return {'bio': fila['perfil__bio'], 'intereses': fila['perfil__intereses']}
+        
+        return [
+            ('id', columna('id')),
+            ('nombre_completo', columna('nombre_completo')),
+            ('edad', lambda fila: Usuario.calcular_edad(fila['fecha_nacimiento'])),
+            ('carrera', columna('carrera')),
+            ('semestre', columna('semestre')),
+            ('genero', columna('genero')),
+            ('fotos', lambda fila: fotos.get(fila['id'], [])),
+            ('perfil', perfil),
+            ('fecha_nacimiento', lambda fila: fecha(fila['fecha_nacimiento'])),
+        ]
+    
+    def _fotos(self, usuario_ids):
+        """{usuario_id: [fotos como FotoSerializer]} ordenadas por `orden`"""
+        request = self.context.get('request')
+        url = Foto._meta.get_field('imagen').storage.url
+        fotos = {}
+        for foto in Foto.objects.filter(usuario_id__in=usuario_ids).order_by('orden').values(
+            'id', 'usuario_id', 'imagen', 'orden', 'es_principal', 'fecha_subida',
+            'ancho', 'alto', 'variantes'
+        ):
+            imagen = None
+            if foto['imagen']:
+                imagen = url(foto['imagen'])
+                if request:
+                    imagen = request.build_absolute_uri(imagen)
+            fotos.setdefault(foto['usuario_id'], []).append({
+                'id': foto['id'],
+                'imagen': imagen,
+                'imagen_url': imagen,
+                'orden': foto['orden'],
+                'es_principal': foto['es_principal'],
+                'fecha_subida': fecha_hora(foto['fecha_subida']),
+                'ancho': foto['ancho'],
+                'alto': foto['alto'],
+                'variantes': urls_variantes(foto['variantes'], request),
+            })
+        return fotos
+
+
 class RegistroSerializer(serializers.ModelSerializer):
     """
     Serializer para registro de nuevos usuarios
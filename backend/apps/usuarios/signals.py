@@ -0,0 +1,35 @@
+"""
+Nueva versión del perfil (Perfil.tocar), que también invalida la tarjeta en
+caché (apps.usuarios.tarjetas), y aviso a los matches del usuario para la
+sincronización incremental (apps.sincronizacion)
+"""
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from apps.perfiles.models import Perfil, Foto
+from apps.sincronizacion.models import Cambio
+from .models import Usuario
+
+# Campos que se guardan seguido y no aparecen en la tarjeta
+CAMPOS_SIN_TARJETA = {'last_login', 'ultima_actividad'}
+
+
+@receiver(post_save, sender=Usuario)
+@receiver(post_delete, sender=Usuario)
+def invalidar_tarjeta_usuario(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= CAMPOS_SIN_TARJETA:
+        return
+    if not kwargs.get('created'):
+        Cambio.registrar_tarjeta(instance.pk)
+        Perfil.tocar(instance.pk)
+
+
+@receiver(post_save, sender=Perfil)
+@receiver(post_delete, sender=Perfil)
+@receiver(post_save, sender=Foto)
+@receiver(post_delete, sender=Foto)
+def invalidar_tarjeta_relacionada(sender, instance, **kwargs):
+    # Guardar el perfil ya cambia su fecha_actualizacion
+    Cambio.registrar_tarjeta(instance.usuario_id)
+    if sender is Foto:
+        Perfil.tocar(instance.usuario_id)
@@ -0,0 +1,150 @@
+"""
+Tarjetas de perfil: lo que se muestra de otro usuario en el deck, los
+matches y las conversaciones (UsuarioPerfilSerializer).
+
+La tarjeta ya renderizada se guarda en la caché por id de usuario, versión
+del perfil (Perfil.fecha_actualizacion, que apps.usuarios.signals cambia
+cuando cambian Usuario, Perfil o Foto) y versión de formato, con las URLs de
+las fotos relativas. Por petición solo se aplica el prefijo absoluto
+(esquema y host) de la request.
+
+La versión se lee antes de renderizar, así que una tarjeta renderizada con
+datos anteriores a un cambio queda bajo la versión anterior, que nadie
+vuelve a pedir: no hace falta borrar nada al confirmar. Las tarjetas de
+usuarios sin perfil (sin versión) no se guardan.
+
+Las tarjetas que no están en la caché se renderizan con
+UsuarioPerfilLigeroSerializer: el perfil viene en el mismo JOIN y las fotos en
+una sola consulta ordenada. con_tarjeta prepara un queryset de instancias
+igual de barato para UsuarioPerfilSerializer.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch
+
+from apps.perfiles.models import Perfil, Foto
+
+# Incrementar cuando cambie la salida de UsuarioPerfilSerializer (y de su versión ligera)
+VERSION_TARJETA = 2
+
+# La edad se calcula al renderizar, así que la tarjeta no puede vivir para siempre
+TTL_TARJETA = 6 * 60 * 60
+
+
+def prefetch_fotos(ruta='fotos'):
+    """Prefetch de las fotos ordenadas por `orden` (ruta relativa al queryset)"""
+    return Prefetch(ruta, queryset=Foto.objects.order_by('orden'))
+
+
+def con_tarjeta(queryset):
+    """Prepara un queryset de Usuario para UsuarioPerfilSerializer"""
+    return queryset.select_related('perfil').prefetch_related(prefetch_fotos())
+
+
+def versiones_de(usuario_ids):
+    """{usuario_id: fecha_actualizacion del perfil} en una consulta"""
+    return dict(
+        Perfil.objects.filter(usuario_id__in=usuario_ids).values_list(
+            'usuario_id', 'fecha_actualizacion'
+        )
+    )
+
+
+def _clave(usuario_id, version):
+    # Las URLs de las fotos cambian de forma con MEDIA_PRIVADA (firmadas)
+    privada = 'p' if settings.MEDIA_PRIVADA else ''
+    marca = int(version.timestamp() * 1_000_000) if version else 0
+    return f'tarjeta:v{VERSION_TARJETA}{privada}:{usuario_id}:{marca}'
+
+
+def renderizar_tarjetas(usuario_ids):
+    """Serializa las tarjetas desde la base de datos (URLs relativas)"""
+    from .models import Usuario
+    from .serializers import UsuarioPerfilLigeroSerializer
+
+    filas = UsuarioPerfilLigeroSerializer.filas(Usuario.objects.filter(id__in=usuario_ids))
+    return {
+        tarjeta['id']: tarjeta
+        for tarjeta in UsuarioPerfilLigeroSerializer(filas, many=True).data
+    }
+
+
+def obtener_tarjetas(usuario_ids, request=None, versiones=None):
+    """
+    Retorna {usuario_id: tarjeta} con una consulta de versiones (o las
+    `versiones` que ya leyó quien llama, de versiones_de o de la misma
+    columna) y una sola lectura a la caché; las que faltan se renderizan
+    juntas y se guardan. Los ids que no existen no aparecen en el resultado.
+    """
+    usuario_ids = list(dict.fromkeys(usuario_ids))
+    if not usuario_ids:
+        return {}
+
+    if versiones is None:
+        versiones = versiones_de(usuario_ids)
+    claves = {i: _clave(i, versiones.get(i)) for i in usuario_ids}
+    guardadas = cache.get_many(list(claves.values()))
+    tarjetas = {}
+    faltantes = []
+    for usuario_id in usuario_ids:
+        tarjeta = guardadas.get(claves[usuario_id])
+        if tarjeta is None:
+            faltantes.append(usuario_id)
+        else:
+            tarjetas[usuario_id] = tarjeta
+
+    if faltantes:
+        nuevas = renderizar_tarjetas(faltantes)
+        # Sin perfil no hay versión: la tarjeta no se guarda
+        cache.set_many(
+            {
+                claves[usuario_id]: tarjeta for usuario_id, tarjeta in nuevas.items()
+                if versiones.get(usuario_id) is not None
+            },
+            TTL_TARJETA
+        )
+        tarjetas.update(nuevas)
+
+    if request is None:
+        return tarjetas
+
+    prefijo = request.build_absolute_uri('/')[:-1]
+    return {
+        usuario_id: aplicar_prefijo(tarjeta, prefijo)
+        for usuario_id, tarjeta in tarjetas.items()
+    }
+
+
+def obtener_tarjeta(usuario_id, request=None):
+    """Atajo para una sola tarjeta (None si el usuario no existe)"""
+    return obtener_tarjetas([usuario_id], request).get(usuario_id)
+
+
+def aplicar_prefijo(tarjeta, prefijo):
+    """Copia la tarjeta convirtiendo las URLs relativas de las fotos (y sus variantes) en absolutas"""
+    def absoluta(url):
+        if url and url.startswith('/'):
+            return prefijo + url
+        return url
+
+    def variantes(variantes):
+        return {
+            nombre: {
+                campo: absoluta(valor) if isinstance(valor, str) else valor
+                for campo, valor in variante.items()
+            }
+            for nombre, variante in variantes.items()
+        }
+
+    return {
+        **tarjeta,
+        'fotos': [
+            {
+                **foto,
+                'imagen': absoluta(foto['imagen']),
+                'imagen_url': absoluta(foto['imagen_url']),
+                'variantes': variantes(foto['variantes']),
+            }
+            for foto in tarjeta['fotos']
+        ],
+    }
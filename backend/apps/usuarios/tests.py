@@ -1,3 +1,145 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from apps.matches.candidatos import candidatos_elegibles
+from apps.matches.tests import crear_usuario
+from apps.perfiles.models import Perfil
+from .models import Usuario
+from .serializers import UsuarioPerfilSerializer, UsuarioPerfilLigeroSerializer
+from .tarjetas import con_tarjeta
+
+
+class PerfilUsuarioDetalleTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_perfil_detalle_sin_n_mas_1(self):
+        yo = crear_usuario('yo', genero='hombre')
+        otra = crear_usuario('otra', fotos=4)
+        client = APIClient()
+        client.force_authenticate(yo)
+
+        # visibilidad + tarjeta (usuario con perfil + fotos)
+        with self.assertNumQueries(3):
+            client.get(f'/api/usuarios/perfil/{otra.id}/')
+
+        # Con la tarjeta en caché solo se verifica la visibilidad
+        with self.assertNumQueries(1):
+            response = client.get(f'/api/usuarios/perfil/{otra.id}/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['fotos']), 4)
+        self.assertEqual(response.data['perfil']['intereses'], ['Música'])
+
+    def test_serializador_ligero_igual_al_de_drf(self):
+        crear_usuario('ana', fotos=3)
+        crear_usuario('bety', fotos=0)
+        Perfil.objects.filter(usuario=crear_usuario('carla')).delete()
+        usuarios = Usuario.objects.order_by('id')
+
+        request = Request(APIRequestFactory().get('/api/usuarios/perfil/1/'))
+        for contexto in ({}, {'request': request}):
+            self.assertEqual(
+                UsuarioPerfilLigeroSerializer(
+                    UsuarioPerfilLigeroSerializer.filas(usuarios), many=True, context=contexto
+                ).data,
+                UsuarioPerfilSerializer(con_tarjeta(usuarios), many=True, context=contexto).data
+            )
+
+
+class FechaFija(date):
+    hoy = None
+
+    @classmethod
+    def today(cls):
+        return cls.hoy
+
+
+class RangoEdadTests(SimpleTestCase):
+
+    def comprobar(self, hoy, edad_minima, edad_maxima):
+        """El rango de fechas coincide con calcular_edad para cada día alrededor de los límites"""
+        FechaFija.hoy = hoy
+        with mock.patch('datetime.date', FechaFija):
+            despues_de, hasta = Usuario.rango_fecha_nacimiento(edad_minima, edad_maxima)
+            for anios in (edad_minima - 1, edad_minima, edad_maxima, edad_maxima + 1):
+                centro = hoy - timedelta(days=round(anios * 365.25))
+                for dias in range(-3, 4):
+                    nacimiento = centro + timedelta(days=dias)
+                    edad = Usuario.calcular_edad(nacimiento)
+                    self.assertEqual(
+                        despues_de < nacimiento <= hasta,
+                        edad_minima <= edad <= edad_maxima,
+                        f'hoy={hoy} nacimiento={nacimiento} edad={edad}'
+                    )
+        return despues_de, hasta
+
+    def test_limites(self):
+        # Quien cumple 18 hoy entra; quien cumple 26 hoy ya no
+        self.assertEqual(
+            self.comprobar(date(2026, 10, 18), 18, 25),
+            (date(2000, 10, 18), date(2008, 10, 18))
+        )
+        self.comprobar(date(2026, 1, 1), 20, 20)
+
+    def test_29_de_febrero(self):
+        # En un año bisiesto los años no bisiestos no tienen 29 de febrero
+        self.assertEqual(
+            self.comprobar(date(2024, 2, 29), 21, 30),
+            (date(1993, 2, 28), date(2003, 2, 28))
+        )
+        self.assertEqual(
+            self.comprobar(date(2024, 2, 29), 20, 24),
+            (date(1999, 2, 28), date(2004, 2, 29))
+        )
+
+
+class CandidatosElegiblesTests(TestCase):
+
+    def nacido_con(self, usuario, edad):
+        """Cumple `edad` hoy (el caso límite)"""
+        hoy = date.today()
+        try:
+            usuario.fecha_nacimiento = hoy.replace(year=hoy.year - edad)
+        except ValueError:
+            usuario.fecha_nacimiento = hoy.replace(year=hoy.year - edad, day=28)
+        usuario.save(update_fields=['fecha_nacimiento'])
+
+    def test_genero_en_ambos_sentidos(self):
+        yo = crear_usuario('yo', genero='hombre', buscando='mujeres')
+        ana = crear_usuario('ana', genero='mujer', buscando='hombres')
+        crear_usuario('bety', genero='mujer', buscando='mujeres')
+        carla = crear_usuario('carla', genero='mujer', buscando='ambos')
+        crear_usuario('dani', genero='hombre', buscando='ambos')
+        crear_usuario('eli', genero='otro', buscando='ambos')
+
+        elegibles = set(candidatos_elegibles(yo).values_list('id', flat=True))
+        self.assertEqual(elegibles, {ana.id, carla.id})
+
+        # Quien se identifica como 'otro' solo aparece a quien busca 'ambos'
+        otro = crear_usuario('otro', genero='otro', buscando='ambos')
+        elegibles = set(candidatos_elegibles(otro).values_list('username', flat=True))
+        self.assertEqual(elegibles, {'carla', 'dani', 'eli'})
+
+    def test_edad_en_ambos_sentidos(self):
+        yo = crear_usuario('yo', genero='hombre')
+        Perfil.objects.filter(usuario=yo).update(edad_minima=20, edad_maxima=25)
+        self.nacido_con(yo, 22)
+
+        candidatas = {}
+        for edad in (19, 20, 25, 26):
+            candidatas[edad] = crear_usuario(f'edad{edad}')
+            self.nacido_con(candidatas[edad], edad)
+        exigente = crear_usuario('exigente')
+        self.nacido_con(exigente, 22)
+        Perfil.objects.filter(usuario=exigente).update(edad_minima=23, edad_maxima=30)
+        yo.refresh_from_db()
+
+        elegibles = set(candidatos_elegibles(yo).values_list('id', flat=True))
+        self.assertEqual(elegibles, {candidatas[20].id, candidatas[25].id})
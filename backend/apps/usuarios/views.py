@@ -4,7 +4,10 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from django.contrib.auth import get_user_model
+from django.http import Http404
 
+from apps.perfiles.models import Perfil
+from cuceimatch.condicional import VersionETagMixin
 from .models import Usuario, TokenTemporal
 from .serializers import (
     UsuarioSerializer,
@@ -13,6 +16,7 @@ from .serializers import (
     ActualizarUsuarioSerializer
 )
 from .utils import validar_credencial_udg, generar_token_temporal
+from .tarjetas import obtener_tarjetas
 
 User = get_user_model()
 
@@ -98,14 +102,30 @@ class RegistroView(generics.CreateAPIView):
         }, status=status.HTTP_201_CREATED)
 
 
-class PerfilUsuarioView(generics.RetrieveAPIView):
+# Campos de UsuarioSerializer que se leen del usuario (las fotos no)
+CAMPOS_VERSIONADOS = [campo for campo in UsuarioSerializer.Meta.fields if campo != 'fotos']
+
+
+class PerfilUsuarioView(VersionETagMixin, generics.RetrieveAPIView):
     """
     GET /api/usuarios/perfil/
     Obtiene el perfil del usuario autenticado
+    Responde 304 si If-None-Match coincide con la versión del perfil
     """
     permission_classes = [IsAuthenticated]
     serializer_class = UsuarioSerializer
     
+    def get_version(self, request):
+        # Las fotos actualizan el perfil (Perfil.tocar); sin perfil la
+        # respuesta no tiene ETag. Los campos del usuario cambian también
+        # sin tocarlo (ultima_actividad, .update()), así que entran tal cual
+        # desde request.user, que la autenticación lee en cada petición
+        version = Perfil.version_de(request.user.id)
+        if version is None:
+            return None
+        usuario = request.user
+        return version, tuple(getattr(usuario, campo) for campo in CAMPOS_VERSIONADOS)
+    
     def get_object(self):
         return self.request.user
 
@@ -118,6 +138,17 @@ class PerfilUsuarioDetalleView(generics.RetrieveAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = UsuarioPerfilSerializer
     queryset = Usuario.objects.filter(verificado=True, activo=True)
+    
+    def retrieve(self, request, *args, **kwargs):
+        # La tarjeta sale de la caché; solo se verifica que el usuario sea
+        # visible, y en la misma consulta se lee la versión de su tarjeta
+        fila = self.get_queryset().filter(pk=kwargs['pk']).values_list(
+            'id', 'perfil__fecha_actualizacion'
+        ).first()
+        if fila is None:
+            raise Http404
+        usuario_id, version = fila
+        return Response(obtener_tarjetas([usuario_id], request, {usuario_id: version})[usuario_id])
 
 
 class ActualizarUsuarioView(generics.UpdateAPIView):
@@ -129,4 +160,11 @@ class ActualizarUsuarioView(generics.UpdateAPIView):
     serializer_class = ActualizarUsuarioSerializer
     
     def get_object(self):
-        return self.request.user
\ No newline at end of file
+        return self.request.user
+    
+    def perform_update(self, serializer):
+        serializer.save()
+        
+        # Las preferencias pudieron cambiar, el deck se vuelve a generar
+        from apps.matches.deck import invalidar_deck
+        invalidar_deck(self.request.user.id)
\ No newline at end of file
@@ -2,6 +2,8 @@
 ASGI config for cuceimatch project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP requests go to Django; WebSocket connections go to the chat
+(apps.chat.websocket).
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -13,4 +15,14 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cuceimatch.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Se importa después de get_asgi_application() porque carga modelos
+from apps.chat.websocket import aplicacion_websocket  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        await aplicacion_websocket(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -0,0 +1,72 @@
+"""
+GET condicional (ETag) para las vistas que los clientes vuelven a pedir en
+cada pantalla.
+
+La vista define `get_version(request)`: algo barato de leer que cambia
+cuando cambia la respuesta (una fecha de actualización, el último Cambio de
+sincronización...). El ETag se calcula con la versión antes de consultar los
+datos y serializarlos; si coincide con If-None-Match se responde 304 sin
+pasar por la vista. El ETag también incluye el usuario, la URL completa y la
+fecha del día (la edad se calcula al serializar).
+
+No se manda Last-Modified: tiene resolución de un segundo y dos cambios en
+el mismo segundo darían un 304 falso a quien solo mande If-Modified-Since.
+"""
+import hashlib
+
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import quote_etag
+from rest_framework.exceptions import APIException
+
+
+class NoModificado(APIException):
+    """Lleva la respuesta 304 desde `initial` hasta handle_exception"""
+
+    def __init__(self, respuesta):
+        self.respuesta = respuesta
+
+
+class VersionETagMixin:
+    """
+    Para vistas GET. `cache_control` se manda en las respuestas 200 y 304:
+    por defecto el cliente puede guardar la respuesta pero la revalida
+    siempre (barato gracias al 304)
+    """
+    cache_control = 'private, no-cache'
+    etag = None
+
+    def get_version(self, request):
+        """Valor que cambia cuando cambia la respuesta; None para no usar ETag"""
+        return None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method not in ('GET', 'HEAD'):
+            return
+        version = self.get_version(request)
+        if version is None:
+            return
+
+        datos = repr((
+            type(self).__name__, request.user.pk, request.build_absolute_uri(),
+            timezone.localdate(), version
+        ))
+        self.etag = quote_etag(hashlib.md5(datos.encode(), usedforsecurity=False).hexdigest())
+
+        respuesta = get_conditional_response(request._request, etag=self.etag)
+        if respuesta is not None:
+            raise NoModificado(respuesta)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NoModificado):
+            return exc.respuesta
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.etag is not None and response.status_code in (200, 304):
+            response['ETag'] = self.etag
+            response['Cache-Control'] = self.cache_control
+            patch_vary_headers(response, ['Authorization'])
+        return response
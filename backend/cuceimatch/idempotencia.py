@@ -0,0 +1,102 @@
+"""
+Claves de idempotencia para los POST que los clientes reintentan (enviar
+mensaje, swipe, lote de swipes).
+
+El cliente manda un id propio por operación en el header `Idempotency-Key`
+y lo repite en cada reintento. La primera respuesta exitosa se guarda en la
+caché por IDEMPOTENCIA_TTL segundos y los reintentos la reciben tal cual
+(con `Idempotent-Replayed: true`) sin pasar por la escritura. Si la caché ya
+no la tiene, o dos reintentos llegan a la vez, la vista guarda la clave como
+`id_cliente` en la fila (única por usuario) y retorna la fila original.
+
+La clave identifica una sola operación: si llega con otro cuerpo (en la
+caché se guarda una huella del cuerpo) o la fila guardada con ella no
+corresponde a la petición (otro match, otro destino, otro contenido), se
+responde 422 en lugar de repetir una respuesta ajena.
+"""
+import hashlib
+import json
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.response import Response
+
+HEADER = 'Idempotency-Key'
+CLAVE_VALIDA = re.compile(r'^[\w.:-]{1,64}$')
+
+
+class RespuestaRepetida(APIException):
+    """Lleva la respuesta guardada desde `initial` hasta handle_exception"""
+
+    def __init__(self, guardada):
+        self.guardada = guardada
+
+
+class ClaveReutilizada(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'La clave de idempotencia ya se usó para otra operación.'
+    default_code = 'clave_reutilizada'
+
+
+def verificar_original(original, **esperado):
+    """
+    Compara la fila creada (o encontrada por id_cliente) con lo que pidió
+    el cliente; si no coincide la clave se reutilizó para otra cosa
+    """
+    if any(getattr(original, campo) != valor for campo, valor in esperado.items()):
+        raise ClaveReutilizada()
+    return original
+
+
+class IdempotenciaMixin:
+    """
+    Para APIViews con POST. La vista usa `self.clave_idempotencia` (None si
+    el cliente no mandó el header) como id_cliente de lo que crea.
+    """
+    clave_idempotencia = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        clave = request.headers.get(HEADER)
+        if request.method != 'POST' or clave is None:
+            return
+        if not CLAVE_VALIDA.match(clave):
+            raise ValidationError({HEADER: 'Debe tener de 1 a 64 letras, números o - _ . :'})
+        self.clave_idempotencia = clave
+        guardada = cache.get(self._clave_cache(request))
+        if guardada is not None:
+            huella, status_code, data = guardada
+            if huella != self._huella(request):
+                raise ClaveReutilizada()
+            raise RespuestaRepetida((status_code, data))
+
+    def handle_exception(self, exc):
+        if isinstance(exc, RespuestaRepetida):
+            status_code, data = exc.guardada
+            return Response(data, status=status_code, headers={'Idempotent-Replayed': 'true'})
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if (
+            self.clave_idempotencia is not None
+            and 200 <= response.status_code < 300
+            and 'Idempotent-Replayed' not in response
+        ):
+            cache.set(
+                self._clave_cache(request),
+                (self._huella(request), response.status_code, response.data),
+                settings.IDEMPOTENCIA_TTL
+            )
+        return response
+
+    def _huella(self, request):
+        cuerpo = json.dumps(request.data, sort_keys=True, default=str)
+        return hashlib.sha256(cuerpo.encode()).hexdigest()
+
+    def _clave_cache(self, request):
+        # La misma clave en otro endpoint o de otro usuario es otra operación
+        return f'idempotencia:{request.user.pk}:{request.path}:{self.clave_idempotencia}'
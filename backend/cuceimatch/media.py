@@ -0,0 +1,184 @@
+"""
+Entrega de los archivos de media (fotos) fuera de DEBUG.
+
+- Transferencia: con MEDIA_DESCARGA='django' el archivo sale del worker de
+  Python (con soporte de Range). Con 'x-accel-redirect' (nginx) o
+  'x-sendfile' (Apache, lighttpd) Django solo valida la petición y el
+  servidor web envía el archivo. Para nginx:
+
+      location /media-interna/ {
+          internal;
+          alias /ruta/a/MEDIA_ROOT/;
+      }
+
+- Caché: los archivos nombrados por su hash (apps.perfiles.almacenamiento)
+  nunca cambian de contenido, así que se marcan `immutable` por un año y su
+  ETag es el hash. El resto se revalida cada hora.
+- URLs firmadas: con MEDIA_PRIVADA el storage agrega a cada URL una firma
+  (HMAC con SECRET_KEY) y una expiración, y aquí solo se verifica la firma,
+  sin autenticar al usuario. La expiración se redondea a ventanas de
+  MEDIA_FIRMA_TTL para que la URL de un archivo sea la misma durante la
+  ventana (y el navegador la pueda guardar); vale entre una y dos ventanas.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+import stat
+import time
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseForbidden, StreamingHttpResponse
+)
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from django.views.decorators.http import require_safe
+
+UN_ANO = 365 * 24 * 60 * 60
+MAX_AGE_MUTABLE = 60 * 60
+TAMANO_BLOQUE = 64 * 1024
+
+# Nombre de archivo que es un SHA-256 (el contenido nunca cambia)
+PATRON_INMUTABLE = re.compile(r'(?:^|/)([0-9a-f]{64})(?:\.\w+)?$')
+PATRON_RANGO = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _firma(ruta, expira):
+    return signing.Signer(salt='cuceimatch.media').signature(f'{ruta}:{expira}')
+
+
+def url_firmada(ruta, url):
+    """Agrega a la URL de `ruta` la expiración y la firma"""
+    ventana = settings.MEDIA_FIRMA_TTL
+    expira = (int(time.time()) // ventana + 2) * ventana
+    return f'{url}?e={expira}&f={_firma(ruta, expira)}'
+
+
+def firma_valida(ruta, expira, firma):
+    try:
+        expira = int(expira)
+    except (TypeError, ValueError):
+        return False
+    if expira < time.time():
+        return False
+    return constant_time_compare(firma or '', _firma(ruta, expira))
+
+
+def _rango(request, tamano, etag, modificado):
+    """
+    (inicio, fin) del header Range; None para enviar el archivo completo
+    (sin Range, If-Range que no coincide o varios rangos) y False si el
+    rango no se puede satisfacer
+    """
+    rango = request.headers.get('Range')
+    if not rango:
+        return None
+    si_rango = request.headers.get('If-Range')
+    if si_rango and si_rango != etag and parse_http_date_safe(si_rango) != modificado:
+        return None
+    coincidencia = PATRON_RANGO.match(rango.strip())
+    if not coincidencia:
+        return None
+
+    inicio, fin = coincidencia.groups()
+    if not inicio:
+        if not fin:
+            return None
+        # bytes=-N: los últimos N bytes
+        largo = int(fin)
+        return (max(tamano - largo, 0), tamano - 1) if largo and tamano else False
+    inicio = int(inicio)
+    fin = tamano - 1 if not fin else min(int(fin), tamano - 1)
+    if inicio >= tamano:
+        return False
+    if fin < inicio:
+        return None
+    return inicio, fin
+
+
+def _leer(archivo, largo):
+    try:
+        while largo > 0:
+            bloque = archivo.read(min(TAMANO_BLOQUE, largo))
+            if not bloque:
+                break
+            largo -= len(bloque)
+            yield bloque
+    finally:
+        archivo.close()
+
+
+def _respuesta_archivo(request, completa, tamano, content_type, etag, modificado):
+    rango = _rango(request, tamano, etag, modificado)
+    if rango is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{tamano}'
+        return response
+    if rango is None:
+        return FileResponse(open(completa, 'rb'), content_type=content_type)
+
+    inicio, fin = rango
+    archivo = open(completa, 'rb')
+    archivo.seek(inicio)
+    response = StreamingHttpResponse(
+        _leer(archivo, fin - inicio + 1), status=206, content_type=content_type
+    )
+    response['Content-Length'] = fin - inicio + 1
+    response['Content-Range'] = f'bytes {inicio}-{fin}/{tamano}'
+    return response
+
+
+@require_safe
+def servir_media(request, ruta):
+    """GET/HEAD de un archivo de MEDIA_ROOT"""
+    ruta = posixpath.normpath(ruta).lstrip('/')
+    # Los temporales de las subidas empiezan con punto
+    if any(parte.startswith('.') for parte in ruta.split('/')):
+        raise Http404
+    try:
+        completa = safe_join(settings.MEDIA_ROOT, ruta)
+        estado = os.stat(completa)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404
+    if not stat.S_ISREG(estado.st_mode):
+        raise Http404
+
+    privada = settings.MEDIA_PRIVADA
+    if privada and not firma_valida(ruta, request.GET.get('e'), request.GET.get('f')):
+        return HttpResponseForbidden()
+
+    modificado = int(estado.st_mtime)
+    inmutable = PATRON_INMUTABLE.search(ruta)
+    alcance = 'private' if privada else 'public'
+    if inmutable:
+        etag = quote_etag(inmutable.group(1))
+        cache_control = f'{alcance}, max-age={UN_ANO}, immutable'
+    else:
+        etag = quote_etag(f'{estado.st_mtime_ns:x}-{estado.st_size:x}')
+        cache_control = f'{alcance}, max-age={MAX_AGE_MUTABLE}'
+
+    response = get_conditional_response(request, etag=etag, last_modified=modificado)
+    if response is None:
+        content_type = mimetypes.guess_type(completa)[0] or 'application/octet-stream'
+        if settings.MEDIA_DESCARGA == 'x-accel-redirect':
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIJO.rstrip('/') + '/' + quote(ruta)
+        elif settings.MEDIA_DESCARGA == 'x-sendfile':
+            response = HttpResponse(content_type=content_type)
+            response['X-Sendfile'] = completa
+        else:
+            response = _respuesta_archivo(
+                request, completa, estado.st_size, content_type, etag, modificado
+            )
+        response['Accept-Ranges'] = 'bytes'
+        response['Last-Modified'] = http_date(modificado)
+
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+    return response
@@ -0,0 +1,68 @@
+"""
+Compresión de las respuestas de la API (gzip, o brotli si está instalado y
+el cliente lo acepta) a partir de COMPRESION_TAMANO_MINIMO bytes.
+
+Solo se comprimen tipos de texto (JSON, HTML, JS...): las fotos ya vienen
+comprimidas. gzip usa compress_string de Django, que agrega bytes aleatorios
+al encabezado para mitigar BREACH como GZipMiddleware.
+"""
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional
+    brotli = None
+
+TIPOS_COMPRIMIBLES = re.compile(r'^(text/|application/(json|javascript|xml)|image/svg\+xml)')
+ACEPTA_GZIP = re.compile(r'\bgzip\b')
+ACEPTA_BROTLI = re.compile(r'\bbr\b')
+
+
+class CompresionMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        return self.comprimir(request, response)
+
+    def comprimir(self, request, response):
+        if (
+            response.streaming
+            or response.has_header('Content-Encoding')
+            or not TIPOS_COMPRIMIBLES.match(response.get('Content-Type', ''))
+        ):
+            return response
+
+        # La respuesta depende de Accept-Encoding aunque esta no se comprima
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < settings.COMPRESION_TAMANO_MINIMO:
+            return response
+
+        acepta = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if brotli is not None and ACEPTA_BROTLI.search(acepta):
+            contenido = brotli.compress(response.content, quality=settings.COMPRESION_NIVEL_BROTLI)
+            codificacion = 'br'
+        elif ACEPTA_GZIP.search(acepta):
+            contenido = compress_string(response.content, max_random_bytes=100)
+            codificacion = 'gzip'
+        else:
+            return response
+
+        if len(contenido) >= len(response.content):
+            return response
+
+        response.content = contenido
+        response['Content-Length'] = str(len(contenido))
+        response['Content-Encoding'] = codificacion
+        # El cuerpo cambió: el ETag fuerte pasa a débil (If-None-Match los
+        # compara en modo débil, así que los 304 siguen funcionando)
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,46 @@
+"""
+Renderer y parser JSON de la API con orjson.
+
+La salida es la misma que la de JSONRenderer de DRF: las fechas que no
+pasaron por un serializer se formatean con el JSONEncoder de DRF (orjson las
+deja pasar con OPT_PASSTHROUGH_DATETIME), igual que Decimal, lazy strings y
+demás tipos que orjson no conoce, y se escapan U+2028/U+2029. Si el cliente
+pide una indentación que orjson no soporta (solo 2), se usa el renderer de
+DRF.
+"""
+import orjson
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+_encoder = JSONEncoder()
+
+OPCIONES = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+
+class ORJSONRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent not in (None, 2) or not self.compact or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        opciones = (OPCIONES | orjson.OPT_INDENT_2) if indent else OPCIONES
+        ret = orjson.dumps(data, default=_encoder.default, option=opciones)
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class ORJSONParser(JSONParser):
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
@@ -0,0 +1,81 @@
+"""
+Serialización ligera para las lecturas más frecuentes (página de mensajes,
+listas de matches, tarjetas de perfil).
+
+Trabaja sobre filas de .values() (dicts) en lugar de instancias: no se
+construyen modelos ni se pasa por los Field de DRF campo por campo. Cada
+serializador arma su `plan` una vez por lista: pares (nombre, función de la
+fila) en el mismo orden que el ModelSerializer equivalente. La salida debe
+ser idéntica a la de ese serializer (los tests de cada app lo comprueban);
+si cambia uno, cambia el otro.
+
+Se usa como serializer_class de las vistas de lista de solo lectura: imita
+lo que DRF necesita de un serializer (`many`, `context` y `.data`).
+"""
+from operator import itemgetter
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+_CAMPO_FECHA_HORA = serializers.DateTimeField()
+_CAMPO_FECHA = serializers.DateField()
+
+columna = itemgetter
+
+
+def fecha_hora(valor):
+    """Lo mismo que DateTimeField.to_representation, sin instanciar el campo"""
+    if not valor:
+        return None
+    formato = api_settings.DATETIME_FORMAT
+    if (
+        formato is None or formato.lower() == ISO_8601
+        or not settings.USE_TZ or timezone.is_naive(valor)
+    ):
+        return _CAMPO_FECHA_HORA.to_representation(valor)
+    return valor.astimezone(timezone.get_current_timezone()).strftime(formato)
+
+
+def fecha(valor):
+    """Lo mismo que DateField.to_representation"""
+    if not valor:
+        return None
+    formato = api_settings.DATE_FORMAT
+    if formato is not None and formato.lower() == ISO_8601:
+        return valor.isoformat()
+    return _CAMPO_FECHA.to_representation(valor)
+
+
+def columna_fecha_hora(nombre):
+    obtener = itemgetter(nombre)
+    return lambda fila: fecha_hora(obtener(fila))
+
+
+class SerializadorLigero:
+    """
+    Base de los serializadores ligeros. Las subclases definen `columnas`
+    (lo que se pide a .values()) y `plan(filas)`.
+    """
+    columnas = ()
+
+    def __init__(self, instance=None, many=False, context=None, **kwargs):
+        self.instance = instance
+        self.many = many
+        self.context = context or {}
+
+    @classmethod
+    def filas(cls, queryset):
+        return queryset.values(*cls.columnas)
+
+    def plan(self, filas):
+        """[(nombre, función(fila))] para estas filas y este contexto"""
+        raise NotImplementedError
+
+    @property
+    def data(self):
+        filas = list(self.instance) if self.many else [self.instance]
+        plan = self.plan(filas)
+        datos = [{nombre: valor(fila) for nombre, valor in plan} for fila in filas]
+        return datos if self.many else datos[0]
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 from decouple import config
 from datetime import timedelta
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -50,10 +51,12 @@ INSTALLED_APPS = [
     'apps.perfiles',
     'apps.matches',
     'apps.chat',
+    'apps.sincronizacion',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'cuceimatch.middleware.CompresionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -98,6 +101,16 @@ DATABASES = {
     }
 }
 
+# Cache
+# Se usa para el deck de candidatos; en producción con varios workers
+# debe apuntar a un backend compartido (p. ej. Redis)
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='cuceimatch'),
+    }
+}
+
 # Custom User Model
 AUTH_USER_MODEL = 'usuarios.Usuario'
 
@@ -157,11 +170,61 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'cuceimatch.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'cuceimatch.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
     'DATETIME_FORMAT': '%Y-%m-%d %H:%M:%S',
 }
 
+# Compresión de respuestas (cuceimatch.middleware); brotli es opcional
+COMPRESION_TAMANO_MINIMO = config('COMPRESION_TAMANO_MINIMO', default=1024, cast=int)  # Bytes
+COMPRESION_NIVEL_BROTLI = config('COMPRESION_NIVEL_BROTLI', default=5, cast=int)
+
+# Deck de candidatos (apps.matches.deck)
+DECK_TAMANO = config('DECK_TAMANO', default=100, cast=int)  # Ids que se precalculan por usuario
+DECK_MINIMO = config('DECK_MINIMO', default=20, cast=int)  # Por debajo de esto se rellena
+DECK_TTL = config('DECK_TTL', default=60 * 60, cast=int)  # Segundos
+DECK_RELLENO_ASINCRONO = config('DECK_RELLENO_ASINCRONO', default=True, cast=bool)
+
+# Entrega de media (cuceimatch.media). MEDIA_DESCARGA: 'django' (el worker
+# envía el archivo), 'x-accel-redirect' (nginx, con la location interna
+# MEDIA_ACCEL_PREFIJO) o 'x-sendfile' (Apache, lighttpd)
+MEDIA_DESCARGA = config('MEDIA_DESCARGA', default='django')
+MEDIA_ACCEL_PREFIJO = config('MEDIA_ACCEL_PREFIJO', default='/media-interna/')
+# URLs firmadas que caducan; la firma debe durar más que las tarjetas en caché
+MEDIA_PRIVADA = config('MEDIA_PRIVADA', default=False, cast=bool)
+MEDIA_FIRMA_TTL = config('MEDIA_FIRMA_TTL', default=2 * 24 * 60 * 60, cast=int)  # Segundos
+
+# Procesamiento de las fotos subidas (apps.perfiles.imagenes)
+FOTOS_PROCESAMIENTO_ASINCRONO = config('FOTOS_PROCESAMIENTO_ASINCRONO', default=True, cast=bool)
+FOTOS_WORKERS = config('FOTOS_WORKERS', default=2, cast=int)
+
+# Pub/sub de los eventos en tiempo real del chat (apps.chat.tiempo_real).
+# MemoriaPubSub solo reparte dentro de un proceso: con varios workers hace
+# falta un backend sobre un broker compartido
+CHAT_PUBSUB_BACKEND = config('CHAT_PUBSUB_BACKEND', default='apps.chat.tiempo_real.MemoriaPubSub')
+
+# Escritura agrupada del resumen de conversación en Match (apps.chat.coalescer)
+CHAT_COALESCER_ACTIVO = config('CHAT_COALESCER_ACTIVO', default=False, cast=bool)
+CHAT_COALESCER_INTERVALO = config('CHAT_COALESCER_INTERVALO', default=0.2, cast=float)  # Segundos
+
+# Sincronización incremental (apps.sincronizacion). Solo se entregan cambios
+# con más de SINCRONIZACION_RETRASO segundos (deben estar confirmados) y
+# purgar_cambios borra los de más de SINCRONIZACION_RETENCION_DIAS
+SINCRONIZACION_RETRASO = config('SINCRONIZACION_RETRASO', default=5, cast=int)  # Segundos
+SINCRONIZACION_RETENCION_DIAS = config('SINCRONIZACION_RETENCION_DIAS', default=30, cast=int)
+
+# Respuestas guardadas para los reintentos con Idempotency-Key (cuceimatch.idempotencia)
+IDEMPOTENCIA_TTL = config('IDEMPOTENCIA_TTL', default=24 * 60 * 60, cast=int)  # Segundos
+
 # JWT Settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),  # Token de acceso válido por 1 día
@@ -184,6 +247,10 @@ CORS_ALLOWED_ORIGINS = config(
 
 CORS_ALLOW_CREDENTIALS = True
 
+# Header de los reintentos idempotentes (cuceimatch.idempotencia)
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
+CORS_EXPOSE_HEADERS = ['idempotent-replayed']
+
 # Security settings for production
 if not DEBUG:
     SECURE_SSL_REDIRECT = True
@@ -20,6 +20,8 @@ from django.conf import settings
 from django.conf.urls.static import static
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
+from .media import servir_media
+
 urlpatterns = [
     path('admin/', admin.site.urls),
 
@@ -32,9 +34,13 @@ urlpatterns = [
     path('api/perfiles/', include('apps.perfiles.urls')),
     path('api/matches/', include('apps.matches.urls')),
     path('api/chat/', include('apps.chat.urls')),
+    path('api/sync/', include('apps.sincronizacion.urls')),
+    
+    # Media (también en producción): rangos, caché inmutable, URLs firmadas
+    # y envío por el servidor web según MEDIA_DESCARGA
+    path(f'{settings.MEDIA_URL.strip("/")}/<path:ruta>', servir_media, name='media'),
 ]
 
-# Servir archivos media en desarrollo
+# Servir archivos estáticos en desarrollo
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
\ No newline at end of file